@@ -21,8 +21,6 @@
  This script initializes the plugin, making it known to QGIS.
 """
 
-from qgis.utils import iface
-
 # noinspection PyPep8Naming
 def classFactory(iface):  # pylint: disable=invalid-name
     """Load Top10NLDownloader class from file Top10NLDownloader.
@@ -0,0 +1,243 @@
+"""
+Polygon area of interest: selection of tiles and features within a polygon
+"""
+
+import hashlib
+import json
+
+try:
+    from osgeo import ogr
+except ImportError:
+    # Exact clipping needs GDAL/OGR, which ships with QGIS; without it features are tested here
+    ogr = None
+
+# How features are limited to the area of interest
+AREA_FILTERS = ("tiles", "intersects", "clip")
+
+
+def _rings(geometry):
+    """Rings of a GeoJSON Polygon or MultiPolygon"""
+    if geometry["type"] == "Polygon":
+        return [ring for ring in geometry["coordinates"]]
+    if geometry["type"] == "MultiPolygon":
+        return [ring for polygon in geometry["coordinates"] for ring in polygon]
+    raise ValueError(f"The area of interest must be a polygon, not a {geometry['type']}")
+
+
+def _parts(geometry):
+    """Point sequences and polygon rings of a GeoJSON geometry, with a flag for polygons"""
+    geometry_type = geometry.get("type")
+    coordinates = geometry.get("coordinates")
+    if geometry_type == "Point":
+        return [[coordinates]], False
+    if geometry_type in ("MultiPoint", "LineString"):
+        return [coordinates], False
+    if geometry_type == "MultiLineString":
+        return coordinates, False
+    if geometry_type == "Polygon":
+        return coordinates, True
+    if geometry_type == "MultiPolygon":
+        return [ring for polygon in coordinates for ring in polygon], True
+    if geometry_type == "GeometryCollection":
+        parts = []
+        polygonal = False
+        for member in geometry.get("geometries", []):
+            member_parts, member_polygonal = _parts(member)
+            parts.extend(member_parts)
+            polygonal = polygonal or member_polygonal
+        return parts, polygonal
+    return [], False
+
+
+def _edges(points):
+    return zip(points, points[1:])
+
+
+def _orientation(a, b, c):
+    value = (b[0] - a[0]) * (c[1] - a[1]) - (b[1] - a[1]) * (c[0] - a[0])
+    return (value > 0) - (value < 0)
+
+
+def _on_segment(a, b, c):
+    return min(a[0], b[0]) <= c[0] <= max(a[0], b[0]) and min(a[1], b[1]) <= c[1] <= max(a[1], b[1])
+
+
+def segments_intersect(p1, p2, q1, q2):
+    """True when the segments p1-p2 and q1-q2 touch or cross"""
+    d1 = _orientation(q1, q2, p1)
+    d2 = _orientation(q1, q2, p2)
+    d3 = _orientation(p1, p2, q1)
+    d4 = _orientation(p1, p2, q2)
+    if d1 != d2 and d3 != d4:
+        return True
+    return ((d1 == 0 and _on_segment(q1, q2, p1)) or (d2 == 0 and _on_segment(q1, q2, p2))
+            or (d3 == 0 and _on_segment(p1, p2, q1)) or (d4 == 0 and _on_segment(p1, p2, q2)))
+
+
+def point_in_rings(point, rings):
+    """Even-odd test of a point against polygon rings, so holes are excluded"""
+    x, y = point[0], point[1]
+    inside = False
+    for ring in rings:
+        for (x1, y1), (x2, y2) in ((a[:2], b[:2]) for a, b in _edges(ring)):
+            if (y1 > y) != (y2 > y) and x < x1 + (y - y1) * (x2 - x1) / (y2 - y1):
+                inside = not inside
+    return inside
+
+
+def _boxes_overlap(a, b):
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+
+def _edge_box(p1, p2):
+    return (min(p1[0], p2[0]), min(p1[1], p2[1]), max(p1[0], p2[0]), max(p1[1], p2[1]))
+
+
+def _bounds(sequences):
+    xs = [point[0] for points in sequences for point in points]
+    ys = [point[1] for points in sequences for point in points]
+    return (min(xs), min(ys), max(xs), max(ys)) if xs else None
+
+
+class AreaOfInterest:
+    """A polygon or multipolygon in RD New that limits a download.
+
+    Only the tiles that intersect the polygon are requested. With the
+    'intersects' filter, features that do not intersect the polygon are
+    dropped before writing; with 'clip', their geometries are clipped to
+    it as well, which needs GDAL/OGR. Features are tested against a
+    prepared OGR polygon when GDAL/OGR is available.
+    """
+
+    def __init__(self, geometry, area_filter="tiles"):
+        if area_filter not in AREA_FILTERS:
+            raise ValueError(f"Unknown area filter: {area_filter}")
+        if area_filter == "clip" and ogr is None:
+            raise ValueError("Clipping to the area of interest needs GDAL/OGR (osgeo.ogr)")
+        self.geometry = geometry
+        self.area_filter = area_filter
+        self.rings = [[tuple(point[:2]) for point in ring] for ring in _rings(geometry)]
+        if not self.rings:
+            raise ValueError("The area of interest is empty")
+        self.bounds = _bounds(self.rings)
+        # A vertex of the shell of each polygon, to find polygons within a geometry
+        polygons = [geometry["coordinates"]] if geometry["type"] == "Polygon" else geometry["coordinates"]
+        self.shell_points = [tuple(polygon[0][0][:2]) for polygon in polygons if polygon and polygon[0]]
+        # Edges of the rings with their bounding boxes
+        self.edges = [(_edge_box(q1, q2), q1, q2) for ring in self.rings for q1, q2 in _edges(ring)]
+        self._ogr_area = None
+        self._prepared_area = None
+        if ogr is not None and area_filter != "tiles":
+            self._ogr_area = ogr.CreateGeometryFromJson(json.dumps(geometry))
+            # Prepared geometries (GDAL 3.9 and later) index the edges of the polygon for repeated tests
+            self._prepared_area = (self._ogr_area.CreatePreparedGeometry()
+                                   if hasattr(self._ogr_area, "CreatePreparedGeometry") else self._ogr_area)
+
+    @property
+    def extent(self):
+        """Bounding box (xmin, ymin, xmax, ymax) of the polygon"""
+        return list(self.bounds)
+
+    @property
+    def key(self):
+        """Short digest of the polygon and filter, to tell downloads with different areas apart"""
+        text = json.dumps(self.geometry, sort_keys=True)
+        return f"{self.area_filter} {hashlib.sha1(text.encode('utf-8')).hexdigest()[:12]}"
+
+    def to_json(self):
+        """The polygon and filter as JSON, to store with a job"""
+        return json.dumps({"geometry": self.geometry, "filter": self.area_filter})
+
+    @classmethod
+    def from_json(cls, text):
+        data = json.loads(text)
+        return cls(data["geometry"], data.get("filter", "tiles"))
+
+    def area(self):
+        """Area of the polygon in square metres"""
+        polygons = [self.geometry["coordinates"]] if self.geometry["type"] == "Polygon" \
+            else self.geometry["coordinates"]
+        total = 0.0
+        for polygon in polygons:
+            # The first ring is the shell, the others are holes, whatever their orientation
+            for index, ring in enumerate(polygon):
+                ring_area = abs(sum(a[0] * b[1] - b[0] * a[1] for a, b in _edges(ring))) / 2
+                total += -ring_area if index else ring_area
+        return total
+
+    def intersects_extent(self, extent):
+        """True when the rectangle (xmin, ymin, xmax, ymax) intersects the polygon"""
+        xmin, ymin, xmax, ymax = extent
+        bounds = self.bounds
+        if xmin > bounds[2] or xmax < bounds[0] or ymin > bounds[3] or ymax < bounds[1]:
+            return False
+        corners = [(xmin, ymin), (xmax, ymin), (xmax, ymax), (xmin, ymax), (xmin, ymin)]
+        return self._intersects_parts([corners], True, extent)
+
+    def _intersects_parts(self, sequences, polygonal, bounds):
+        if bounds is None or not _boxes_overlap(bounds, self.bounds):
+            return False
+        # Crossing edges, only tested for the edges of the polygon near the geometry
+        edges = [edge for edge in self.edges if _boxes_overlap(edge[0], bounds)]
+        for points in sequences:
+            for p1, p2 in _edges(points):
+                box = _edge_box(p1, p2)
+                for edge_box, q1, q2 in edges:
+                    if _boxes_overlap(box, edge_box) and segments_intersect(p1, p2, q1, q2):
+                        return True
+        # Without crossing edges each part lies entirely inside or outside the polygon
+        for points in sequences:
+            if points and point_in_rings(points[0], self.rings):
+                return True
+        # A polygon of the area within a polygonal geometry
+        return polygonal and any(point_in_rings(point, sequences) for point in self.shell_points)
+
+    def intersects(self, geometry):
+        """True when a GeoJSON geometry intersects the polygon"""
+        if not geometry:
+            return False
+        sequences, polygonal = _parts(geometry)
+        bounds = _bounds(sequences)
+        if bounds is None or not _boxes_overlap(bounds, self.bounds):
+            return False
+        if self._prepared_area is not None:
+            ogr_geometry = ogr.CreateGeometryFromJson(json.dumps(geometry))
+            if ogr_geometry is not None:
+                return self._prepared_area.Intersects(ogr_geometry)
+        return self._intersects_parts(sequences, polygonal, bounds)
+
+    def clip(self, geometry):
+        """A GeoJSON geometry clipped to the polygon, of the same dimension, or None when nothing is left"""
+        clipped = ogr.CreateGeometryFromJson(json.dumps(geometry)).Intersection(self._ogr_area)
+        if clipped is None or clipped.IsEmpty():
+            return None
+        result = json.loads(clipped.ExportToJson())
+        if result["type"] == "GeometryCollection":
+            # Parts of a lower dimension where the geometry touches the border are dropped
+            base = geometry["type"].replace("Multi", "")
+            members = [member for member in result["geometries"] if member["type"].replace("Multi", "") == base]
+            if not members:
+                return None
+            coordinates = []
+            for member in members:
+                coordinates.extend(member["coordinates"] if member["type"].startswith("Multi")
+                                   else [member["coordinates"]])
+            result = {"type": "Multi" + base, "coordinates": coordinates}
+        return result
+
+    def select_features(self, features):
+        """The features within the polygon, clipped when the filter is 'clip'"""
+        if self.area_filter == "tiles":
+            return features
+        selected = []
+        for feature in features:
+            geometry = feature.get("geometry")
+            if not self.intersects(geometry):
+                continue
+            if self.area_filter == "clip":
+                clipped = self.clip(geometry)
+                if clipped is None:
+                    continue
+                feature["geometry"] = clipped
+            selected.append(feature)
+        return selected
@@ -0,0 +1,110 @@
+"""
+Top10NL Downloader - Polygon area of interest from a layer selection or drawn on the map canvas
+"""
+
+import json
+
+from qgis.PyQt.QtCore import Qt, pyqtSignal
+from qgis.PyQt.QtGui import QColor
+from qgis.core import (QgsCoordinateReferenceSystem, QgsCoordinateTransform, QgsGeometry,
+                       QgsProject, QgsWkbTypes)
+from qgis.gui import QgsMapTool, QgsRubberBand
+
+RD_NEW = "EPSG:28992"
+
+
+def to_rd_new(geometry, crs):
+    """Copy of a QgsGeometry, transformed from crs to RD New"""
+    geometry = QgsGeometry(geometry)
+    if crs.authid() != RD_NEW:
+        transform = QgsCoordinateTransform(crs, QgsCoordinateReferenceSystem(RD_NEW), QgsProject.instance())
+        geometry.transform(transform)
+    return geometry
+
+
+def selected_area(layer):
+    """Union of the selected features of a polygon layer in RD New, or None when none are selected"""
+    geometries = [feature.geometry() for feature in layer.selectedFeatures() if feature.hasGeometry()]
+    if not geometries:
+        return None
+    return to_rd_new(QgsGeometry.unaryUnion(geometries), layer.crs())
+
+
+def to_geojson(geometry):
+    """GeoJSON geometry of a polygon QgsGeometry, with millimetre precision"""
+    return json.loads(geometry.asJson(3))
+
+
+class AreaMapTool(QgsMapTool):
+    """Draw a polygon on the map canvas.
+
+    Click to add a vertex, right click to finish and Esc to cancel. The
+    finished polygon stays visible until clear() is called.
+    """
+    area_drawn = pyqtSignal(object)  # QgsGeometry in the CRS of the canvas
+    canceled = pyqtSignal()
+
+    def __init__(self, canvas):
+        super().__init__(canvas)
+        self.points = []
+        self.rubber_band = QgsRubberBand(canvas, QgsWkbTypes.GeometryType.PolygonGeometry)
+        self.rubber_band.setColor(QColor(255, 0, 0, 160))
+        self.rubber_band.setFillColor(QColor(255, 0, 0, 40))
+        self.rubber_band.setWidth(2)
+
+    def clear(self):
+        """Remove the polygon from the canvas"""
+        self.points = []
+        self.rubber_band.reset(QgsWkbTypes.GeometryType.PolygonGeometry)
+
+    def show_points(self, points):
+        self.rubber_band.reset(QgsWkbTypes.GeometryType.PolygonGeometry)
+        for index, point in enumerate(points):
+            self.rubber_band.addPoint(point, index == len(points) - 1)
+
+    def activate(self):
+        super().activate()
+        self.clear()
+
+    def canvasPressEvent(self, event):
+        if event.button() == Qt.MouseButton.RightButton:
+            self.finish()
+            return
+        self.points.append(self.toMapCoordinates(event.pos()))
+        self.show_points(self.points)
+
+    def canvasMoveEvent(self, event):
+        if self.points:
+            self.show_points(self.points + [self.toMapCoordinates(event.pos())])
+
+    def keyPressEvent(self, event):
+        if event.key() == Qt.Key.Key_Escape:
+            self.clear()
+            self.canceled.emit()
+
+    def finish(self):
+        if len(self.points) < 3:
+            self.clear()
+            self.canceled.emit()
+            return
+        self.show_points(self.points)
+        self.area_drawn.emit(QgsGeometry.fromPolygonXY([self.points]))
+
+
+def rectangle_to_rd_new(rectangle, crs):
+    """Extent [xmin, ymin, xmax, ymax] in RD New of a QgsRectangle in crs"""
+    if crs.authid() != RD_NEW:
+        transform = QgsCoordinateTransform(crs, QgsCoordinateReferenceSystem(RD_NEW), QgsProject.instance())
+        rectangle = transform.transformBoundingBox(rectangle)
+    return [rectangle.xMinimum(), rectangle.yMinimum(), rectangle.xMaximum(), rectangle.yMaximum()]
+
+
+def feature_extents(layer):
+    """Extents in RD New of the selected features of a layer, one per feature"""
+    return [rectangle_to_rd_new(feature.geometry().boundingBox(), layer.crs())
+            for feature in layer.selectedFeatures() if feature.hasGeometry()]
+
+
+def bookmark_extents(bookmarks):
+    """Extents in RD New of spatial bookmarks"""
+    return [rectangle_to_rd_new(bookmark.extent(), bookmark.extent().crs()) for bookmark in bookmarks]
@@ -0,0 +1,229 @@
+"""
+Top10NL Downloader - Unattended downloads from scripts, Processing and the command line
+
+    python -m top10nl_downloader.batch_download --collections gebouw_vlak,wegdeel_vlak \\
+        --extent 154000,462000,156000,464000 --output top10nl.gpkg --mode append --workers 4
+
+Give --extent more than once, or --extents-file with one extent per line, to
+download a queue of areas in one run.
+
+The download runs without QGIS; the exit code is 0 when all collections were
+downloaded, 1 when the download failed or is incomplete and 2 when it was
+interrupted. Rerun with --resume to complete an interrupted download.
+"""
+
+import argparse
+import datetime
+import json
+import os
+import signal
+import sys
+import threading
+
+from .area_of_interest import AreaOfInterest
+from .download_engine import Top10NLDownloadEngine
+from .download_options import DEFAULT_COLLECTIONS, DEFAULT_PARALLEL_DOWNLOADS, MAX_PARALLEL_DOWNLOADS, MODES
+from .gpkg_writer import load_job
+from .log_writer import BufferedLogWriter
+from .oapif_client import DEFAULT_PAGE_SIZE, TOP10NL_API_URL
+from .output_writers import check_output_format, state_file
+from .tiling import DEFAULT_TILE_SIZE
+
+
+def parse_collections(text):
+    """Collection names from a comma separated list"""
+    collections = [name.strip() for name in text.split(",") if name.strip()]
+    if not collections:
+        raise ValueError("No collections given")
+    return collections
+
+
+def parse_extent(text):
+    """Extent [xmin, ymin, xmax, ymax] in RD New from 'xmin,ymin,xmax,ymax'"""
+    try:
+        extent = [float(value) for value in text.split(",")]
+    except ValueError:
+        raise ValueError(f"Invalid extent: {text}") from None
+    if len(extent) != 4 or extent[0] >= extent[2] or extent[1] >= extent[3]:
+        raise ValueError(f"The extent must be xmin,ymin,xmax,ymax with xmin < xmax and ymin < ymax: {text}")
+    return extent
+
+
+def read_extents(path):
+    """Extents from a text file with one 'xmin,ymin,xmax,ymax' per line; empty lines and # comments are skipped"""
+    with open(path, encoding="utf-8") as extents_file:
+        lines = [line.split("#", 1)[0].strip() for line in extents_file]
+    return [parse_extent(line) for line in lines if line]
+
+
+def job_arguments(job):
+    """Engine arguments that continue a job stored in a GeoPackage, see load_job()"""
+    return {
+        "features": job["collections"],
+        "extent": job["extent"],
+        "overwrite": job["overwrite"],
+        "tile_size": job["tile_size"],
+        "update": job["mode"] == "update",
+        "properties": job["properties"],
+        "filters": job["filters"],
+        "area": AreaOfInterest.from_json(job["area"]) if job["area"] else None,
+        "extents": job["extents"],
+    }
+
+
+def unfinished_job(output_file):
+    """The job stored for an output when not all of its collections are complete, else None"""
+    path = state_file(output_file)
+    job = load_job(path) if os.path.exists(path) else None
+    if not job or all(status == "complete" for status in job["status"].values()):
+        return None
+    return job
+
+
+def run_download(collections, extent, output_file, mode="append", max_workers=DEFAULT_PARALLEL_DOWNLOADS,
+                 tile_size=DEFAULT_TILE_SIZE, page_size=DEFAULT_PAGE_SIZE, base_url=TOP10NL_API_URL,
+                 resume=False, log_file=None, log=None, progress=None, is_canceled=None, area=None,
+                 extents=None, bulk_load=True, maintain=False):
+    """Download collections into a GeoPackage and return the engine.
+
+    ``extents`` downloads a queue of areas in one run instead of ``extent``,
+    see Top10NLDownloadEngine. ``bulk_load`` writes new layers in
+    bulk-load mode and ``maintain`` checks and compacts the GeoPackage
+    after the download. With ``resume`` the unfinished job in the GeoPackage
+    is continued with its own collections, extent and mode instead. Log
+    lines are timestamped and written to ``log_file`` and passed to
+    ``log``; collection metrics are appended to a .metrics.jsonl file next
+    to the log file. Raises ValueError for invalid arguments and
+    RuntimeError when the download was canceled or incomplete.
+    """
+    if mode not in MODES:
+        raise ValueError(f"Unknown mode {mode}, expected one of {', '.join(MODES)}")
+    max_workers = max(1, min(MAX_PARALLEL_DOWNLOADS, int(max_workers)))
+    output_file = os.path.normpath(output_file)
+    check_output_format(output_file)
+    if resume:
+        job = unfinished_job(output_file)
+        if job is None:
+            raise ValueError(f"{output_file} has no unfinished download to resume")
+        arguments = job_arguments(job)
+    else:
+        arguments = {"features": collections, "extent": extent, "overwrite": mode == "overwrite",
+                     "tile_size": tile_size, "update": mode == "update", "area": area,
+                     "extents": extents}
+    if log_file is None:
+        log_file = os.path.splitext(output_file)[0] + ".log"
+    log_writer = BufferedLogWriter(log_file)
+
+    def log_line(message):
+        line = f"{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - {message}"
+        log_writer.log(line)
+        if log is not None:
+            log(line)
+
+    engine = Top10NLDownloadEngine(
+        arguments.pop("features"), arguments.pop("extent"), output_file, arguments.pop("overwrite"),
+        max_workers=max_workers, page_size=page_size, base_url=base_url,
+        log=log_line, progress=progress, is_canceled=is_canceled, resume=resume, bulk_load=bulk_load,
+        maintain=maintain, **arguments)
+    result = False
+    try:
+        log_line(f"Starting Top10NL download of {len(engine.features)} features into {output_file}")
+        log_line(f"Processing mode: {engine.mode}{' (resumed)' if resume else ''}")
+        if not engine.run():
+            raise RuntimeError("Download canceled")
+        if engine.failed_features:
+            raise RuntimeError(f"Download incomplete for {', '.join(engine.failed_features)}; "
+                               "resume to download the missing tiles")
+        log_line("Finished")
+        result = True
+        return engine
+    except Exception as e:
+        log_line(f"Error during download: {str(e)}")
+        raise
+    finally:
+        try:
+            engine.write_metrics(os.path.splitext(log_file)[0] + ".metrics.jsonl", result)
+        finally:
+            log_writer.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Download Top10NL collections from PDOK into a GeoPackage")
+    parser.add_argument("--collections", type=parse_collections, default=DEFAULT_COLLECTIONS,
+                        help="comma separated collections (default: %(default)s)")
+    parser.add_argument("--extent", type=parse_extent, action="append",
+                        help="xmin,ymin,xmax,ymax in RD New (EPSG:28992); repeat to queue more areas")
+    parser.add_argument("--extents-file", help="text file with one extent per line, to queue many areas")
+    parser.add_argument("--area", help="GeoJSON file with a polygon in RD New to download instead of the extent")
+    parser.add_argument("--area-filter", choices=("tiles", "intersects", "clip"), default="tiles",
+                        help="features kept within --area (default: %(default)s)")
+    parser.add_argument("--output", required=True,
+                        help="GeoPackage to write; .fgb or .parquet writes one FlatGeobuf or GeoParquet "
+                             "file per collection")
+    parser.add_argument("--mode", choices=MODES, default="append", help="operation mode (default: %(default)s)")
+    parser.add_argument("--resume", action="store_true",
+                        help="continue the unfinished download in --output with its own parameters")
+    parser.add_argument("--workers", type=int, default=DEFAULT_PARALLEL_DOWNLOADS,
+                        help=f"parallel requests to the service, 1 to {MAX_PARALLEL_DOWNLOADS} (default: %(default)s)")
+    parser.add_argument("--tile-size", type=int, default=DEFAULT_TILE_SIZE, help="tile size in metres")
+    parser.add_argument("--page-size", type=int, default=DEFAULT_PAGE_SIZE, help="features per request")
+    parser.add_argument("--base-url", default=TOP10NL_API_URL, help="OGC API Features service")
+    parser.add_argument("--no-bulk-load", action="store_true",
+                        help="update the spatial index of new layers on every write instead of building it "
+                             "once per layer, and write without a write-ahead log")
+    parser.add_argument("--maintain", action="store_true",
+                        help="after the download, rebuild damaged spatial indexes, compact the GeoPackage "
+                             "when needed and update its statistics; see also gpkg_maintenance")
+    parser.add_argument("--log", help="log file (default: next to the output)")
+    parser.add_argument("--quiet", action="store_true", help="only write the log file")
+    args = parser.parse_args(argv)
+    extents = list(args.extent or [])
+    if args.extents_file:
+        try:
+            extents += read_extents(args.extents_file)
+        except (OSError, ValueError) as e:
+            parser.error(f"Invalid extents file {args.extents_file}: {str(e)}")
+    if not args.resume and not extents and args.area is None:
+        parser.error("--extent, --extents-file or --area is required, unless --resume is given")
+    if extents and args.area:
+        parser.error("--area cannot be combined with --extent or --extents-file")
+
+    area = None
+    if args.area and not args.resume:
+        try:
+            with open(args.area, encoding="utf-8") as area_file:
+                data = json.load(area_file)
+            # A FeatureCollection, a Feature or a bare geometry
+            if data.get("type") == "FeatureCollection":
+                data = data["features"][0]
+            area = AreaOfInterest(data.get("geometry", data), args.area_filter)
+        except (OSError, ValueError, KeyError, IndexError) as e:
+            parser.error(f"Invalid area {args.area}: {str(e)}")
+
+    # Ctrl+C cancels the download at the next page, so the tiles done so far are kept
+    interrupted = threading.Event()
+    signal.signal(signal.SIGINT, lambda signum, frame: interrupted.set())
+
+    last_percent = -1
+
+    def progress(value, status=None):
+        nonlocal last_percent
+        if value != last_percent and not args.quiet:
+            last_percent = value
+            print(f"{value:3d}% {status or ''}", file=sys.stderr)
+
+    try:
+        run_download(args.collections, extents[0] if len(extents) == 1 else None, args.output, args.mode, args.workers,
+                     args.tile_size, args.page_size, args.base_url, args.resume, args.log,
+                     log=None if args.quiet else print, progress=progress,
+                     is_canceled=interrupted.is_set, area=area,
+                     extents=extents if len(extents) > 1 else None, bulk_load=not args.no_bulk_load,
+                     maintain=args.maintain)
+    except Exception as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        return 2 if interrupted.is_set() else 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
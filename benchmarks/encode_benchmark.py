@@ -0,0 +1,97 @@
+"""
+Micro-benchmark of the GeoJSON to GeoPackage geometry encoding
+
+Encodes pages of synthetic polygons, lines and points, such as the dense
+waterdeel_vlak and terrein_vlak polygons, one geometry at a time with
+encode_geometry() and per page with encode_geometries(), checks that both
+give the same blobs and reports the time per page.
+
+    python benchmarks/encode_benchmark.py --vertices 5,50,500 --page-size 1000
+
+encode_geometries() needs NumPy to encode a page at once; without it both
+columns measure the same per-geometry encoder.
+"""
+
+import argparse
+import importlib
+import math
+import random
+import time
+
+from run_benchmark import int_list, load_engine
+
+GEOMETRY_TYPES = ("Polygon", "MultiPolygon", "LineString", "Point")
+
+
+def ring(x, y, radius, vertices):
+    """Closed ring of a jagged circle, with millimetre coordinates as in the PDOK responses"""
+    points = []
+    for index in range(vertices):
+        angle = 2 * math.pi * index / vertices
+        distance = radius * random.uniform(0.8, 1.0)
+        points.append([round(x + distance * math.cos(angle), 3), round(y + distance * math.sin(angle), 3)])
+    points.append(points[0])
+    return points
+
+
+def geometry(geometry_type, vertices):
+    """A random geometry near Amersfoort with about ``vertices`` coordinates per ring or line"""
+    x = random.uniform(150000, 160000)
+    y = random.uniform(458000, 468000)
+    if geometry_type == "Point":
+        return {"type": "Point", "coordinates": [round(x, 3), round(y, 3)]}
+    if geometry_type == "LineString":
+        return {"type": "LineString", "coordinates": ring(x, y, 50, vertices)[:-1]}
+    polygon = [ring(x, y, 50, vertices), ring(x, y, 10, max(3, vertices // 4))[::-1]]
+    if geometry_type == "Polygon":
+        return {"type": "Polygon", "coordinates": polygon}
+    return {"type": "MultiPolygon", "coordinates": [polygon, [ring(x + 120, y, 50, vertices)]]}
+
+
+def best_time(function, repeat):
+    """Shortest time of ``repeat`` calls, in seconds"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-geometry and batched GeoPackage geometry encoding")
+    parser.add_argument("--vertices", type=int_list, default=[5, 50, 500], help="coordinates per ring or line")
+    parser.add_argument("--types", default=",".join(GEOMETRY_TYPES), help="comma separated geometry types")
+    parser.add_argument("--page-size", type=int, default=1000, help="geometries per page")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per case; the fastest is reported")
+    args = parser.parse_args()
+    load_engine()
+    gpkg_geometry = importlib.import_module("top10nl_downloader.gpkg_geometry")
+    srs_id = 28992
+    random.seed(28992)
+
+    columns = ["type", "vertices", "per_feature_ms", "batched_ms", "speedup", "mb_of_blobs"]
+    print(" ".join(f"{column:>14}" for column in columns))
+    if gpkg_geometry.numpy is None:
+        print("NumPy is not installed: encode_geometries() encodes one geometry at a time")
+    for geometry_type in args.types.split(","):
+        for vertices in args.vertices:
+            page = [geometry(geometry_type, vertices) for _ in range(args.page_size)]
+            expected = [gpkg_geometry.encode_geometry(item, srs_id) for item in page]
+            if gpkg_geometry.encode_geometries(page, srs_id) != expected:
+                raise AssertionError(f"Batched blobs differ for {geometry_type} with {vertices} vertices")
+            single = best_time(lambda: [gpkg_geometry.encode_geometry(item, srs_id) for item in page], args.repeat)
+            batched = best_time(lambda: gpkg_geometry.encode_geometries(page, srs_id), args.repeat)
+            result = {
+                "type": geometry_type,
+                "vertices": vertices,
+                "per_feature_ms": round(single * 1000, 1),
+                "batched_ms": round(batched * 1000, 1),
+                "speedup": round(single / batched, 2) if batched else 0,
+                "mb_of_blobs": round(sum(len(blob) for blob in expected) / 1e6, 2),
+            }
+            print(" ".join(f"{result[column]:>14}" for column in columns))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+"""
+Mock of the PDOK Top10NL OGC API Features service for offline benchmarks
+
+Serves synthetic Top10NL-like collections: every collection has one feature
+per grid cell of ``spacing`` metres over the Netherlands, so the number of
+features within a bbox is predictable. Supports the parts of the API the
+plugin uses: /collections, and /collections/{id}/items with bbox, limit,
+offset, crs, datetime, properties and property=value filters, returning
+``next`` links and ``numberMatched``. CQL2 filters are answered with HTTP 400.
+All features have ``mutation_date`` as their mutatiedatum.
+
+Run standalone with ``python mock_oapif_server.py --port 8080`` or start it
+from a script with MockOapifServer(...).start().
+"""
+
+import argparse
+import gzip
+import json
+import math
+import random
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Default collections, one per geometry type
+DEFAULT_COLLECTIONS = ["gebouw_vlak", "wegdeel_lijn", "inrichtingselement_punt", "terrein_vlak"]
+# Largest page size the mock accepts, as the PDOK service
+MAX_LIMIT = 1000
+# Extent of the synthetic features in RD New
+RD_EXTENT = (0, 300000, 280000, 625000)
+# Properties of the synthetic features that can be used as property=value filters
+FEATURE_PROPERTIES = ("ID", "lokaal_id", "typeobject", "hoogte", "aantal", "mutatiedatum")
+
+
+class MockOapifServer:
+    """Threaded HTTP server serving synthetic OGC API Features collections.
+
+    :param collections: collection IDs; the geometry type follows from the name.
+    :param spacing: distance in metres between the features of a collection.
+    :param latency: seconds every request waits before it is answered.
+    :param payload: number of characters of filler text added to each feature.
+    :param max_concurrent: requests beyond this number in flight get HTTP 429
+        with Retry-After, as a throttling service; 0 for no limit.
+    :param error_rate: fraction of the requests that fail with HTTP 503.
+    :param compress: gzip the responses to clients that accept it.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, collections=DEFAULT_COLLECTIONS,
+                 spacing=50, latency=0.0, payload=0, max_concurrent=0, error_rate=0.0, compress=True):
+        self.collections = list(collections)
+        self.spacing = spacing
+        self.latency = latency
+        self.payload = payload
+        self.max_concurrent = max_concurrent
+        self.error_rate = error_rate
+        self.compress = compress
+        self.mutation_date = "2025-01-01"
+        self.requests = 0
+        self.bytes_sent = 0
+        self.rejected = 0
+        self.in_flight = 0
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), _handler_class(self))
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        """Base URL of the service, to pass as base_url to the download engine"""
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """Serve requests in a background thread"""
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="Mock OAPIF", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving and close the socket"""
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def count(self, nbytes):
+        with self._lock:
+            self.requests += 1
+            self.bytes_sent += nbytes
+
+    def admit(self):
+        """Register a request in flight; returns the HTTP status to answer it with"""
+        with self._lock:
+            self.in_flight += 1
+            status = 200
+            if self.max_concurrent and self.in_flight > self.max_concurrent:
+                status = 429
+            elif random.random() < self.error_rate:
+                status = 503
+            if status != 200:
+                self.rejected += 1
+            return status
+
+    def done(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def grid_cells(self, bbox):
+        """Grid cells (column, row) whose feature lies within bbox, in a fixed order"""
+        minx = max(bbox[0], RD_EXTENT[0])
+        miny = max(bbox[1], RD_EXTENT[1])
+        maxx = min(bbox[2], RD_EXTENT[2])
+        maxy = min(bbox[3], RD_EXTENT[3])
+        if minx >= maxx or miny >= maxy:
+            return 0, range(0), range(0)
+        # Features lie at the centre of their cell
+        columns = range(math.ceil(minx / self.spacing - 0.5), math.ceil(maxx / self.spacing - 0.5))
+        rows = range(math.ceil(miny / self.spacing - 0.5), math.ceil(maxy / self.spacing - 0.5))
+        return len(columns) * len(rows), columns, rows
+
+    def feature(self, collection, column, row):
+        """Synthetic GeoJSON feature of a collection in one grid cell"""
+        x = (column + 0.5) * self.spacing
+        y = (row + 0.5) * self.spacing
+        size = self.spacing / 4
+        if collection.endswith("punt"):
+            geometry = {"type": "Point", "coordinates": [x, y]}
+        elif collection.endswith("lijn"):
+            geometry = {"type": "LineString",
+                        "coordinates": [[x - size, y - size], [x, y + size], [x + size, y - size]]}
+        else:
+            ring = [[x - size, y - size], [x + size, y - size], [x + size, y + size],
+                    [x - size, y + size], [x - size, y - size]]
+            geometry = {"type": "Polygon", "coordinates": [ring]}
+        identifier = f"{collection}.{column}.{row}"
+        properties = {
+            "ID": identifier,
+            "lokaal_id": f"{column * 100000 + row}",
+            "typeobject": "synthetisch",
+            "hoogte": float(row % 50),
+            "aantal": column % 10,
+            "mutatiedatum": self.mutation_date,
+        }
+        if self.payload:
+            properties["toelichting"] = "x" * self.payload
+        return {"type": "Feature", "id": identifier, "geometry": geometry, "properties": properties}
+
+    def items(self, collection, query, path):
+        """Items response for a collection; query holds the parsed query string"""
+        bbox = [float(value) for value in query.get("bbox", [",".join(str(c) for c in RD_EXTENT)])[0].split(",")]
+        limit = min(int(query.get("limit", ["10"])[0]), MAX_LIMIT)
+        offset = int(query.get("offset", ["0"])[0])
+        matched, columns, rows = self.grid_cells(bbox)
+        if "datetime" in query:
+            start = query["datetime"][0].split("/")[0]
+            if start not in ("", "..") and start[:10] > self.mutation_date:
+                matched = 0
+        if "filter" in query:
+            raise ValueError("CQL2 filters are not supported")
+        conditions = {key: values[0] for key, values in query.items() if key in FEATURE_PROPERTIES}
+        if conditions:
+            cells = [(columns[index % len(columns)], rows[index // len(columns)]) for index in range(matched)]
+            cells = [(column, row) for column, row in cells
+                     if all(str(self.feature(collection, column, row)["properties"][key]) == value
+                            for key, value in conditions.items())]
+            matched = len(cells)
+            page = cells[offset:offset + limit]
+        else:
+            page = [(columns[index % len(columns)], rows[index // len(columns)])
+                    for index in range(offset, min(offset + limit, matched))]
+        features = []
+        for column, row in page:
+            feature = self.feature(collection, column, row)
+            if "properties" in query:
+                selected = query["properties"][0].split(",")
+                feature["properties"] = {key: value for key, value in feature["properties"].items()
+                                         if key in selected}
+            features.append(feature)
+        links = []
+        if offset + limit < matched:
+            params = {key: values[0] for key, values in query.items()}
+            params["offset"] = offset + limit
+            links.append({"rel": "next", "type": "application/geo+json",
+                          "href": f"{self.url}{path}?{urllib.parse.urlencode(params)}"})
+        return {"type": "FeatureCollection", "numberMatched": matched,
+                "numberReturned": len(features), "features": features, "links": links}
+
+
+def _handler_class(server):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def send_json(self, status, data, content_type="application/json", headers=None):
+            body = json.dumps(data).encode("utf-8")
+            self.send_response(status)
+            if server.compress and "gzip" in self.headers.get("Accept-Encoding", ""):
+                body = gzip.compress(body, compresslevel=6)
+                self.send_header("Content-Encoding", "gzip")
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            server.count(len(body))
+
+        def do_GET(self):
+            status = server.admit()
+            try:
+                if server.latency:
+                    time.sleep(server.latency)
+                if status == 429:
+                    self.send_json(429, {"code": "TooManyRequests"}, headers={"Retry-After": "1"})
+                elif status == 503:
+                    self.send_json(503, {"code": "ServiceUnavailable"})
+                else:
+                    self.respond()
+            finally:
+                server.done()
+
+        def respond(self):
+            url = urllib.parse.urlsplit(self.path)
+            query = urllib.parse.parse_qs(url.query)
+            parts = [part for part in url.path.split("/") if part]
+            if parts == ["collections"]:
+                self.send_json(200, {"collections": [{"id": name} for name in server.collections]})
+            elif len(parts) == 3 and parts[0] == "collections" and parts[2] == "items":
+                collection = urllib.parse.unquote(parts[1])
+                if collection not in server.collections:
+                    self.send_json(404, {"code": "NotFound", "description": f"Unknown collection {collection}"})
+                    return
+                try:
+                    data = server.items(collection, query, url.path)
+                except ValueError as e:
+                    self.send_json(400, {"code": "InvalidParameterValue", "description": str(e)})
+                    return
+                self.send_json(200, data, "application/geo+json")
+            else:
+                self.send_json(404, {"code": "NotFound", "description": self.path})
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--collections", default=",".join(DEFAULT_COLLECTIONS))
+    parser.add_argument("--spacing", type=float, default=50, help="metres between features")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per request")
+    parser.add_argument("--payload", type=int, default=0, help="filler characters per feature")
+    parser.add_argument("--max-concurrent", type=int, default=0, help="answer HTTP 429 above this")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of HTTP 503 responses")
+    parser.add_argument("--no-gzip", action="store_true", help="do not compress responses")
+    args = parser.parse_args()
+    server = MockOapifServer(args.host, args.port, args.collections.split(","),
+                             args.spacing, args.latency, args.payload,
+                             args.max_concurrent, args.error_rate, not args.no_gzip)
+    print(f"Serving {len(server.collections)} collections at {server.url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Offline benchmark of the Top10NL download engine
+
+Runs the download engine against the mock OGC API Features service for each
+combination of extent size, number of collections and parallel downloads,
+and reports throughput, peak Python memory and the size of the GeoPackage.
+
+    python benchmarks/run_benchmark.py --extents 1000,4000 --collections 1,4 --workers 1,4
+
+Results are printed as a table and can be written as JSON lines with --output.
+QGIS is not needed: the engine modules are loaded without the plugin package.
+"""
+
+import argparse
+import importlib
+import itertools
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+
+from mock_oapif_server import DEFAULT_COLLECTIONS, MockOapifServer
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Centre of the benchmark extents, in RD New
+CENTRE = (155000, 463000)
+
+
+def load_engine():
+    """Import the download engine without the plugin __init__, which needs QGIS"""
+    package = types.ModuleType("top10nl_downloader")
+    package.__path__ = [PLUGIN_DIR]
+    sys.modules.setdefault("top10nl_downloader", package)
+    return importlib.import_module("top10nl_downloader.download_engine")
+
+
+def int_list(text):
+    return [int(value) for value in text.split(",") if value]
+
+
+def run_case(engine_module, server, extent_size, collections, workers, tile_size, page_size, directory,
+             properties=None, bulk_load=True):
+    """Download one case into a new GeoPackage and return its measurements
+
+    :param properties: property names to keep for every collection; all when None.
+    :param bulk_load: write the GeoPackage in bulk-load mode, see GeoPackageWriter.
+    """
+    half = extent_size / 2
+    extent = [CENTRE[0] - half, CENTRE[1] - half, CENTRE[0] + half, CENTRE[1] + half]
+    output_file = os.path.join(directory, f"bench_{extent_size}_{collections}_{workers}.gpkg")
+    messages = []
+    engine = engine_module.Top10NLDownloadEngine(
+        server.collections[:collections], extent, output_file, True,
+        max_workers=workers, page_size=page_size, tile_size=tile_size,
+        base_url=server.url, log=messages.append,
+        properties=None if properties is None else {name: properties for name in server.collections},
+        bulk_load=bulk_load)
+    requests_before, bytes_before = server.requests, server.bytes_sent
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    engine.run()
+    wall = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    written = sum(record["features_written"] for record in engine.metrics)
+    errors = [message for message in messages if "Error" in message]
+    result = {
+        "extent_m": extent_size,
+        "collections": collections,
+        "workers": workers,
+        "features": written,
+        "requests": server.requests - requests_before,
+        "retries": engine.scheduler.retry_count,
+        "mb_on_wire": round((server.bytes_sent - bytes_before) / 1e6, 2),
+        "wall_s": round(wall, 3),
+        "features_per_s": round(written / wall) if wall else 0,
+        "peak_mb": round(peak / 1e6, 1),
+        "gpkg_mb": round(os.path.getsize(output_file) / 1e6, 2),
+        "errors": len(errors),
+    }
+    for error in errors[:3]:
+        print(error, file=sys.stderr)
+    os.remove(output_file)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--extents", type=int_list, default=[1000, 4000],
+                        help="comma separated extent sizes in metres")
+    parser.add_argument("--collections", type=int_list, default=[1, 4],
+                        help="comma separated numbers of collections")
+    parser.add_argument("--workers", type=int_list, default=[1, 4],
+                        help="comma separated numbers of parallel downloads")
+    parser.add_argument("--tile-size", type=int, default=2000)
+    parser.add_argument("--page-size", type=int, default=1000)
+    parser.add_argument("--spacing", type=float, default=50, help="metres between mock features")
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds per mock request")
+    parser.add_argument("--payload", type=int, default=0, help="filler characters per mock feature")
+    parser.add_argument("--max-concurrent", type=int, default=0,
+                        help="mock answers HTTP 429 above this number of parallel requests")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of mock HTTP 503 responses")
+    parser.add_argument("--no-gzip", action="store_true", help="mock sends uncompressed responses")
+    parser.add_argument("--properties", help="comma separated properties to download; all when not given")
+    parser.add_argument("--no-bulk-load", action="store_true",
+                        help="update the spatial index on every write, as without bulk-load mode")
+    parser.add_argument("--output", help="append the results as JSON lines to this file")
+    args = parser.parse_args()
+
+    # Repeat the default collections under new names, keeping the geometry type suffix
+    collection_names = []
+    for index in range(max(args.collections)):
+        name = DEFAULT_COLLECTIONS[index % len(DEFAULT_COLLECTIONS)]
+        if index >= len(DEFAULT_COLLECTIONS):
+            base, suffix = name.rsplit("_", 1)
+            name = f"{base}{index // len(DEFAULT_COLLECTIONS)}_{suffix}"
+        collection_names.append(name)
+    properties = None if args.properties is None else [name for name in args.properties.split(",") if name]
+    engine_module = load_engine()
+    server = MockOapifServer(collections=collection_names, spacing=args.spacing,
+                             latency=args.latency, payload=args.payload,
+                             max_concurrent=args.max_concurrent, error_rate=args.error_rate,
+                             compress=not args.no_gzip).start()
+    columns = ["extent_m", "collections", "workers", "features", "requests", "retries", "mb_on_wire",
+               "wall_s", "features_per_s", "peak_mb", "gpkg_mb", "errors"]
+    print(" ".join(f"{column:>14}" for column in columns))
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            for extent_size, collections, workers in itertools.product(args.extents, args.collections, args.workers):
+                result = run_case(engine_module, server, extent_size, collections, workers,
+                                  args.tile_size, args.page_size, directory, properties, not args.no_bulk_load)
+                result.update(latency=args.latency, payload=args.payload, spacing=args.spacing,
+                              properties=args.properties, bulk_load=not args.no_bulk_load,
+                              max_concurrent=args.max_concurrent, error_rate=args.error_rate,
+                              gzip=not args.no_gzip)
+                print(" ".join(f"{result[column]:>14}" for column in columns))
+                if args.output:
+                    with open(args.output, 'a', encoding='utf-8') as output:
+                        output.write(json.dumps(result) + "\n")
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+On-disk cache of the collections catalogue of the Top10NL OGC API
+"""
+
+import datetime
+import json
+import os
+import urllib.error
+import urllib.parse
+
+from .http_session import default_session
+
+# A cached catalogue younger than this is used without asking the service
+CATALOGUE_TTL = datetime.timedelta(days=7)
+
+
+def parse_collections(data):
+    """Sorted collection IDs of a /collections response"""
+    features = []
+    if 'collections' in data:
+        for collection in data['collections']:
+            if 'id' in collection:
+                features.append(collection['id'])
+    features.sort()
+    return features
+
+
+def schema_properties(data):
+    """Property names of a JSON schema of a collection, without the geometry"""
+    names = []
+    for name, definition in (data.get('properties') or {}).items():
+        definition = definition or {}
+        if definition.get('x-ogc-role') == 'primary-geometry' or \
+                str(definition.get('format', '')).startswith('geometry-'):
+            continue
+        names.append(name)
+    return names
+
+
+def load_catalogue(path):
+    """Read the cached catalogue, or return None when there is no usable cache"""
+    try:
+        with open(path, 'r', encoding='utf-8') as cache_file:
+            catalogue = json.load(cache_file)
+        if catalogue.get("features"):
+            return catalogue
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def save_catalogue(path, catalogue):
+    """Write the catalogue to the cache file"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = path + ".tmp"
+    with open(temp_path, 'w', encoding='utf-8') as cache_file:
+        json.dump(catalogue, cache_file, indent=1)
+    os.replace(temp_path, path)
+
+
+def is_stale(catalogue, ttl=CATALOGUE_TTL):
+    """True when there is no cached catalogue or it is older than ttl"""
+    if not catalogue:
+        return True
+    try:
+        fetched = datetime.datetime.fromisoformat(catalogue["fetched"])
+    except (KeyError, TypeError, ValueError):
+        return True
+    return datetime.datetime.now() - fetched > ttl
+
+
+def fetch_catalogue(base_url, cached=None, timeout=30):
+    """Fetch the catalogue, revalidating a cached one with ETag/Last-Modified.
+
+    The cached property names of the collections that are still offered are
+    kept in a new catalogue.
+
+    :returns: (catalogue, modified): the new catalogue and True, or the
+        cached one and False when the service reports it is unchanged
+        (HTTP 304).
+    """
+    headers = {"Accept": "application/json"}
+    if cached and cached.get("etag"):
+        headers["If-None-Match"] = cached["etag"]
+    if cached and cached.get("last_modified"):
+        headers["If-Modified-Since"] = cached["last_modified"]
+    now = datetime.datetime.now().isoformat(timespec="seconds")
+    try:
+        response = default_session().get(f"{base_url}/collections?f=json", headers, timeout)
+        data = json.loads(response.body.decode('utf-8'))
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+    except urllib.error.HTTPError as e:
+        if e.code == 304 and cached:
+            # Caches written by earlier versions hold a not_modified flag
+            catalogue = {key: value for key, value in cached.items() if key != "not_modified"}
+            return dict(catalogue, fetched=now), False
+        raise
+    catalogue = {
+        "features": parse_collections(data),
+        "etag": etag,
+        "last_modified": last_modified,
+        "fetched": now,
+    }
+    properties = {collection: names for collection, names in ((cached or {}).get("properties") or {}).items()
+                  if collection in catalogue["features"]}
+    if properties:
+        catalogue["properties"] = properties
+    return catalogue, True
+
+
+def fetch_properties(base_url, collection, timeout=30):
+    """Property names of a collection, from its schema or else from one of its features"""
+    session = default_session()
+    collection_url = f"{base_url}/collections/{urllib.parse.quote(collection)}"
+    try:
+        response = session.get(f"{collection_url}/schema?f=json", {"Accept": "application/schema+json"}, timeout)
+        names = schema_properties(json.loads(response.body.decode('utf-8')))
+        if names:
+            return names
+    except urllib.error.HTTPError as e:
+        # Services without the schema endpoint
+        if e.code not in (400, 404, 406):
+            raise
+    response = session.get(f"{collection_url}/items?f=json&limit=1", {"Accept": "application/geo+json"}, timeout)
+    features = json.loads(response.body.decode('utf-8')).get('features') or []
+    return list(features[0].get('properties') or {}) if features else []
@@ -0,0 +1,69 @@
+"""
+Selection of changed and ended Top10NL features for the update mode
+"""
+
+import datetime
+
+# Lifecycle attributes of Top10NL objects, compared without case and underscores.
+# The first one present gives the time the feature version was registered.
+MUTATION_FIELDS = ("tijdstipregistratie", "mutatiedatum", "objectbegintijd")
+# A feature version with one of these set has ended and is removed from the layer
+END_FIELDS = ("eindregistratie", "objecteindtijd")
+
+
+def utc_now():
+    """Current time as an ISO 8601 UTC timestamp, the format of the sync times"""
+    return datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def parse_time(value):
+    """Parse an ISO 8601 date or timestamp into an aware UTC datetime, or None"""
+    if not isinstance(value, str) or not value:
+        return None
+    text = value.strip().replace("Z", "+00:00")
+    try:
+        parsed = datetime.datetime.fromisoformat(text)
+    except ValueError:
+        try:
+            parsed = datetime.datetime.fromisoformat(text[:10])
+        except ValueError:
+            return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+    return parsed.astimezone(datetime.timezone.utc)
+
+
+def datetime_interval(since):
+    """Value of the OGC API ``datetime`` parameter for features changed since a sync time"""
+    return f"{since}/.."
+
+
+def _lifecycle_values(feature, fields):
+    properties = feature.get("properties") or {}
+    normalized = {key.lower().replace("_", ""): value for key, value in properties.items()}
+    return [normalized[field] for field in fields if normalized.get(field) not in (None, "")]
+
+
+def mutation_time(feature):
+    """Registration time of a feature version, or None when it has no lifecycle attributes"""
+    for value in _lifecycle_values(feature, MUTATION_FIELDS):
+        parsed = parse_time(value)
+        if parsed is not None:
+            return parsed
+    return None
+
+
+def is_ended(feature):
+    """True when the feature version has an end of registration or end of object time"""
+    now = datetime.datetime.now(datetime.timezone.utc)
+    for value in _lifecycle_values(feature, END_FIELDS):
+        parsed = parse_time(value)
+        if parsed is None or parsed <= now:
+            return True
+    return False
+
+
+def changed_since(feature, since):
+    """True when the feature changed after the sync time; features without lifecycle attributes count as changed"""
+    changed = mutation_time(feature)
+    return changed is None or changed > parse_time(since)
@@ -0,0 +1,817 @@
+"""
+Top10NL Downloader - Download engine, independent of QGIS
+"""
+
+import datetime
+import itertools
+import re
+import threading
+import time
+import urllib.error
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from .delta_sync import changed_since, datetime_interval, is_ended, utc_now
+from .download_options import DEFAULT_PARALLEL_DOWNLOADS
+from .feature_selection import FeatureFilter, filter_features, project_features, requested_properties
+from .oapif_client import DEFAULT_PAGE_SIZE, TOP10NL_API_URL, OapifPager
+from .gpkg_maintenance import maintain_geopackage
+from .gpkg_writer import feature_id, prepare_features
+from .metrics import append_metrics, latency_summary
+from .output_writers import create_writer, state_file
+from .progress import DownloadProgress
+from .request_scheduler import RequestScheduler
+from .tiling import (DEFAULT_TILE_SIZE, MIN_TILE_SIZE, bounding_extent, can_split, extent_area, queue_tiles,
+                     split_extent, split_tile, uncovered_tiles)
+
+# Number of features written to the GeoPackage in one transaction
+WRITE_BATCH_SIZE = 10000
+# Number of features of a page that are selected and encoded together while the page streams in
+FEATURE_GROUP_SIZE = 50
+
+# Seconds between progress updates with the same percentage, and between progress lines in the log
+PROGRESS_INTERVAL = 1.0
+PROGRESS_LOG_INTERVAL = 60.0
+
+# Geometry type of a Top10NL collection, used for layers without features
+COLLECTION_GEOMETRY_TYPES = {
+    "multivlak": "MultiPolygon",
+    "vlak": "Polygon",
+    "lijn": "LineString",
+    "punt": "Point",
+}
+
+
+def transfer_summary(wire_bytes, decoded_bytes):
+    """Bytes on the wire against decoded bytes, as logged per collection and per run"""
+    text = f"{wire_bytes / 1e6:.2f} MB on the wire, {decoded_bytes / 1e6:.2f} MB decoded"
+    if decoded_bytes and wire_bytes < decoded_bytes:
+        text += f" ({1 - wire_bytes / decoded_bytes:.0%} saved by compression)"
+    return text
+
+
+def collection_geometry_type(collection):
+    """GeoJSON geometry type of a Top10NL collection, derived from its name"""
+    for suffix, geometry_type in COLLECTION_GEOMETRY_TYPES.items():
+        if collection.endswith(suffix):
+            return geometry_type
+    return None
+
+
+def optional_parameters(pager):
+    """Optional parameters sent by a pager that a service may not support.
+    
+    Each is a tuple of the pager attribute, the names of its query
+    parameters, the engine attribute that enables it and the engine method
+    that disables it.
+    """
+    parameters = []
+    if pager.properties:
+        parameters.append(("properties", ["properties"], "server_properties", "disable_property_selection"))
+    if pager.filter_params:
+        parameters.append(("filter_params", list(pager.filter_params), "server_filter", "disable_server_filter"))
+    if pager.datetime_filter:
+        parameters.append(("datetime_filter", ["datetime"], "server_datetime", "disable_datetime_filter"))
+    return parameters
+
+
+def error_message(error):
+    """Text of the body of an HTTPError, or an empty string"""
+    try:
+        return (error.read() or b"").decode("utf-8", "replace")
+    except Exception:
+        return ""
+
+
+class Top10NLDownloadEngine:
+    """Download Top10NL collections within an extent into a GeoPackage.
+    
+    An output file ending in .fgb or .parquet gives one FlatGeobuf or
+    GeoParquet file per collection instead, see output_writers.
+    
+    The engine has no QGIS dependencies, so the download task, scripts and
+    the benchmarks all use the same code. Log messages, progress and
+    cancellation are passed through the ``log``, ``progress`` and
+    ``is_canceled`` callables.
+    
+    With ``update`` the layers are brought up to date instead: only the
+    features changed since the last sync time of a layer are downloaded,
+    ended features are removed, and parts of the extent that were never
+    downloaded are downloaded in full.
+    
+    ``properties`` maps collections to the names of the properties to keep;
+    other collections keep all their properties. Only the selected
+    properties are requested from the service, and whatever else the
+    service returns is dropped before writing. ``filters`` maps collections
+    to a filter expression, see FeatureFilter; it is sent to the service and
+    applied to the downloaded features as well. With ``area``, an
+    AreaOfInterest, only the tiles that intersect its polygon are
+    downloaded, and its filter drops or clips the features outside it.
+    
+    ``extents`` queues many areas in one run instead of ``extent``: their
+    tiles share the worker pool, the HTTP session and the open GeoPackage,
+    overlapping parts are downloaded once, and each layer is completed and
+    deduplicated once, after the tiles of all areas are written.
+    
+    With ``bulk_load`` the GeoPackage is written in bulk-load mode, see
+    GeoPackageWriter: layers created or replaced by the download are loaded
+    without updating their spatial index, which is built at once when the
+    collection is complete. With ``maintain`` the GeoPackage is checked and
+    compacted after the download, see maintain_geopackage().
+    """
+    
+    def __init__(self, features, extent, output_file, overwrite,
+                 max_workers=DEFAULT_PARALLEL_DOWNLOADS, page_size=DEFAULT_PAGE_SIZE,
+                 tile_size=DEFAULT_TILE_SIZE, base_url=TOP10NL_API_URL,
+                 log=None, progress=None, is_canceled=None, resume=False, update=False, properties=None,
+                 filters=None, area=None, extents=None, bulk_load=True, maintain=False):
+        if area is not None and extents:
+            raise ValueError("An area of interest cannot be combined with a queue of extents")
+        self.features = features
+        # Polygon that limits the download; the extent is its bounding box
+        self.area = area
+        # Queued areas; the extent is their bounding box
+        self.extents = [list(item) for item in extents] if extents else None
+        if area is not None:
+            extent = area.extent
+        elif self.extents:
+            extent = bounding_extent(self.extents)
+        self.extent = extent
+        self.output_file = output_file
+        self.bulk_load = bulk_load
+        self.maintain = maintain
+        # Report of the maintenance after the download, see maintain_geopackage()
+        self.maintenance = None
+        self.overwrite = overwrite and not update
+        self.update = update
+        self.mode = "update" if update else ("overwrite" if overwrite else "append")
+        # Last sync time per collection in update mode; None for a full download
+        self.since = {}
+        # Cleared when the service rejects the datetime parameter; changes are then selected here
+        self.server_datetime = True
+        # Selected property names per collection
+        self.properties = {feature: list(names) for feature, names in (properties or {}).items()
+                           if names is not None}
+        # Cleared when the service rejects the properties parameter; properties are then dropped here
+        self.server_properties = True
+        # Filter per collection; raises ValueError for an expression that cannot be parsed
+        self.filters = {feature: FeatureFilter(expression) for feature, expression in (filters or {}).items()
+                        if expression and expression.strip()}
+        # Cleared when the service rejects the filter parameters; features are then only filtered here
+        self.server_filter = True
+        # Time the download started, recorded as the sync time of the completed layers
+        self.sync_start = None
+        # Continue the job stored in the GeoPackage instead of starting a new one
+        self.resume = resume
+        # Collections whose existing layer is replaced at the first write
+        self.replace_layers = set()
+        self.max_workers = max(1, int(max_workers))
+        self.page_size = page_size
+        self.tile_size = max(MIN_TILE_SIZE, tile_size)
+        self.base_url = base_url
+        self._log = log
+        self._progress = progress
+        self._is_canceled = is_canceled
+        # IDs written per collection in this run; features on tile borders come in more than once
+        self.seen_ids = {}
+        # Per collection metrics, see write_metrics()
+        self.metrics = []
+        self.latencies = []
+        self.start_time = None
+        # Features expected per collection (numberMatched), None when unknown
+        self.expected = {}
+        self.progress = DownloadProgress()
+        self.last_percent = 0
+        self.last_progress_time = 0.0
+        self.last_progress_log = 0.0
+        self.progress_lock = threading.Lock()
+        # Only one worker thread at a time finds out which parameter the service rejects
+        self.parameter_lock = threading.Lock()
+        # Only one worker thread at a time may write the GeoPackage
+        self.write_lock = threading.Lock()
+        # Shared by all workers: retries requests and adapts the number of parallel requests
+        self.scheduler = RequestScheduler(self.max_workers, log=self.log, is_canceled=self.is_canceled)
+        self.session_requests = 0
+        self.session_connections = 0
+        # Collections of which not all tiles could be downloaded
+        self.failed_features = []
+    
+    def log(self, message):
+        """Pass a log message to the log callable"""
+        if self._log is not None:
+            self._log(message)
+    
+    def set_progress(self, value, status=None):
+        """Pass the progress percentage and a status line to the progress callable"""
+        if self._progress is not None:
+            self._progress(value, status)
+    
+    def report_progress(self, force=False):
+        """Report the progress when the percentage changed or PROGRESS_INTERVAL passed.
+        
+        Called from the worker threads after every page and from the main loop
+        after every tile. The percentage never goes back, although splitting
+        tiles adds work when the feature counts are unknown.
+        """
+        now = time.monotonic()
+        with self.progress_lock:
+            percent = max(self.last_percent, self.progress.percent())
+            if not force and percent == self.last_percent and now - self.last_progress_time < PROGRESS_INTERVAL:
+                return
+            self.last_percent = percent
+            self.last_progress_time = now
+            log_line = now - self.last_progress_log >= PROGRESS_LOG_INTERVAL
+            if log_line:
+                self.last_progress_log = now
+        status = self.progress.status()
+        self.set_progress(percent, status)
+        if log_line:
+            self.log(f"Progress: {percent}% - {status}")
+    
+    def page_received(self, features, nbytes):
+        """Count a page of features for the progress"""
+        self.progress.add(features, nbytes)
+        self.report_progress()
+    
+    def count_features(self, features, executor):
+        """Ask the service for the number of features of each collection within the extent.
+        
+        The counts are requested in parallel, with one small request per
+        collection. Returns a dict with the count per collection, or None
+        when the service does not report it.
+        """
+        def count(feature):
+            pager = OapifPager(feature, self.extent, base_url=self.base_url, page_size=self.page_size,
+                               scheduler=self.scheduler, datetime_filter=self.datetime_filter(feature),
+                               filter_params=self.filter_params(feature))
+            try:
+                return pager.count_matched()
+            except urllib.error.HTTPError as e:
+                if not self.rejected_parameter(pager, e):
+                    raise
+                return count(feature)
+        
+        futures = {feature: executor.submit(count, feature) for feature in features}
+        counts = {}
+        for feature, future in futures.items():
+            try:
+                counts[feature] = future.result()
+            except Exception as e:
+                self.log(f"  Could not count the features of {feature}: {str(e)}")
+                counts[feature] = None
+        return counts
+    
+    def is_canceled(self):
+        """True when the download has to stop"""
+        return self._is_canceled is not None and self._is_canceled()
+    
+    def datetime_filter(self, feature):
+        """Value of the datetime parameter for the delta of a collection, or None"""
+        since = self.since.get(feature)
+        if since and self.server_datetime:
+            return datetime_interval(since)
+        return None
+    
+    def disable_datetime_filter(self, error):
+        """Select the changed features from full pages when the service rejects the datetime parameter"""
+        if self.server_datetime:
+            self.server_datetime = False
+            self.log(f"The service does not support the datetime filter ({str(error)}); "
+                     "changed features are selected from the downloaded features instead")
+    
+    def disable_property_selection(self, error):
+        """Drop the unselected properties from full pages when the service rejects the properties parameter"""
+        if self.server_properties:
+            self.server_properties = False
+            self.log(f"The service does not support selecting properties ({str(error)}); "
+                     "unselected properties are dropped from the downloaded features instead")
+    
+    def disable_server_filter(self, error):
+        """Filter the downloaded features only when the service rejects the filter parameters"""
+        if self.server_filter:
+            self.server_filter = False
+            self.log(f"The service does not support the filter ({str(error)}); "
+                     "the downloaded features are filtered instead")
+    
+    def coverage_filter(self, feature):
+        """What limits the features of a collection within a tile: filter, area filter and properties, or None.
+        
+        Tiles are recorded as covered with this, so they only count as
+        downloaded for later downloads with the same limits; a download of
+        all properties does not skip tiles downloaded with fewer.
+        """
+        limits = []
+        if feature in self.filters:
+            limits.append(self.filters[feature].expression)
+        if self.area is not None and self.area.area_filter != "tiles":
+            limits.append(f"area {self.area.key}")
+        if feature in self.properties:
+            limits.append(f"properties {','.join(sorted(self.properties[feature]))}")
+        return " AND ".join(limits) or None
+    
+    def filter_params(self, feature):
+        """Query parameters of the filter of a collection, or None"""
+        if feature in self.filters and self.server_filter:
+            return self.filters[feature].query_params()
+        return None
+    
+    def rejected_parameter(self, pager, error):
+        """Stop sending the optional parameter that made the service answer HTTP 400.
+        
+        The parameter is the one named in the error message of the service.
+        When the message names none or more than one of the parameters the
+        pager sent, a request for one feature is tried without each of them
+        in turn, and only the parameter without which it succeeds is
+        disabled; when only a request without all of them succeeds, all are.
+        Returns False when the error is not caused by the properties, filter
+        and datetime parameters, so the request fails.
+        """
+        if not (isinstance(error, urllib.error.HTTPError) and error.code == 400 and pager.page_count == 0):
+            return False
+        with self.parameter_lock:
+            sent = optional_parameters(pager)
+            if not sent:
+                return False
+            if not all(getattr(self, flag) for _, _, flag, _ in sent):
+                # Another worker disabled a parameter meanwhile; try again with the parameters left
+                return True
+            message = error_message(error)
+            named = [parameter for parameter in sent
+                     if any(re.search(rf"(?<![\w-]){re.escape(name)}(?![\w-])", message) for name in parameter[1])]
+            if len(named) == 1:
+                rejected = named
+                reason = "named in the error message"
+            else:
+                rejected = next(([parameter] for parameter in sent if self.accepted_without(pager, [parameter])),
+                                None)
+                reason = "the request succeeds without it"
+                if rejected is None:
+                    if len(sent) == 1 or not self.accepted_without(pager, sent):
+                        return False
+                    rejected = sent
+                    reason = "the request only succeeds without all of them"
+            names = ", ".join(name for _, parameter_names, _, _ in rejected for name in parameter_names)
+            self.log(f"The service rejected the {names} parameter of {pager.collection}: {reason}")
+            for _, _, _, disable in rejected:
+                getattr(self, disable)(error)
+            return True
+    
+    def accepted_without(self, pager, parameters):
+        """True when the service answers a request for one feature of the pager without the given parameters"""
+        dropped = {attribute for attribute, _, _, _ in parameters}
+        probe = OapifPager(pager.collection, pager.bbox, base_url=pager.base_url, crs=pager.crs,
+                           timeout=pager.timeout, scheduler=self.scheduler,
+                           **{attribute: None if attribute in dropped else getattr(pager, attribute)
+                              for attribute in ("datetime_filter", "properties", "filter_params")})
+        try:
+            probe.count_matched()
+        except Exception:
+            return False
+        return True
+    
+    def select_changes(self, page, since):
+        """Split a page into the features changed since the sync time and the IDs of ended features"""
+        changed = []
+        ended = []
+        for item in page:
+            if is_ended(item):
+                ended.append(feature_id(item))
+            elif self.server_datetime or changed_since(item, since):
+                changed.append(item)
+        return changed, ended
+    
+    def write_batch(self, feature, batch, writer, result, tile=None, next_url=None, ended=()):
+        """Write a batch of features, skipping features already written by another tile.
+        
+        When ``tile`` is given, its checkpoint is saved with the features:
+        ``next_url`` to resume the tile from, or without it, the tile as
+        downloaded. Features with an ID in ``ended`` are removed. The number
+        of features written and the time spent deduplicating and writing are
+        added to ``result``.
+        """
+        with self.write_lock:
+            start = time.perf_counter()
+            seen = self.seen_ids.setdefault(feature, set())
+            new_features = []
+            for item in batch:
+                item_id = item.id
+                if item_id is None or item_id not in seen:
+                    seen.add(item_id)
+                    new_features.append(item)
+            dedup_end = time.perf_counter()
+            result["written"] += writer.write_features(
+                feature, new_features, feature in self.replace_layers, tile, next_url, ended,
+                self.coverage_filter(feature))
+            result["removed"] += len(ended)
+            result["dedup_time"] += dedup_end - start
+            result["write_time"] += time.perf_counter() - dedup_end
+    
+    def download_tile(self, feature, tile, writer, start_url=None, since=None):
+        """Download the features of one collection within one tile.
+        
+        Runs in a worker thread. The items are parsed while each page
+        arrives and encoded in groups of FEATURE_GROUP_SIZE features, so the
+        batch holds compact prepared features instead of parsed pages. The
+        batches of WRITE_BATCH_SIZE features are written each in one
+        transaction together with the URL to resume from, so a canceled
+        or failed tile can be resumed from ``start_url``. When the first page
+        shows that the tile holds more than one page of features, the tile
+        is split in quadrants instead, until MIN_TILE_SIZE is reached, so
+        dense areas get smaller tiles. With ``since``, only the features
+        changed since that time are written and ended features are removed.
+        Returns a dict with the statistics and the tiles to download instead.
+        """
+        result = {"feature": feature, "written": 0, "removed": 0, "pages": 0, "children": [], "since": since,
+                  "received": 0, "bytes": 0, "wire_bytes": 0, "latencies": [],
+                  "write_time": 0.0, "dedup_time": 0.0,
+                  "error": None, "start": datetime.datetime.now()}
+        if self.is_canceled():
+            result["end"] = result["start"]
+            return result
+        
+        properties = self.properties.get(feature)
+        feature_filter = self.filters.get(feature)
+        if properties is not None and feature_filter:
+            # The properties of the filter are needed to filter the features here
+            requested = properties + [name for name in feature_filter.properties if name not in properties]
+        else:
+            requested = properties
+        pager = OapifPager(feature, tile, base_url=self.base_url, page_size=self.page_size,
+                           scheduler=self.scheduler,
+                           datetime_filter=datetime_interval(since) if since and self.server_datetime else None,
+                           properties=(requested_properties(requested, self.update)
+                                       if requested is not None and self.server_properties else None),
+                           filter_params=self.filter_params(feature))
+        batch = []
+        ended = []
+        wire_bytes_counted = 0
+        try:
+            for page in pager.pages(start_url):
+                splittable = not start_url and pager.page_count == 0 and can_split(tile)
+                split = False
+                received = 0
+                while True:
+                    group = list(itertools.islice(page, FEATURE_GROUP_SIZE))
+                    if not group:
+                        break
+                    if splittable and not received and pager.announces_next_page():
+                        # Split before the features of the page are processed
+                        split = True
+                        break
+                    received += len(group)
+                    if since:
+                        group, group_ended = self.select_changes(group, since)
+                        ended.extend(group_ended)
+                    if feature_filter:
+                        group = filter_features(group, feature_filter)
+                    if self.area is not None:
+                        group = self.area.select_features(group)
+                    if properties is not None:
+                        project_features(group, properties)
+                    batch.extend(prepare_features(group))
+                    if self.is_canceled():
+                        break
+                # Leaving a page before its end closes its connection
+                page.close()
+                split = split or (splittable and pager.page_complete and pager.next_url)
+                # The features of a split tile are downloaded again with its quadrants
+                self.page_received(0 if split else received, pager.wire_bytes - wire_bytes_counted)
+                wire_bytes_counted = pager.wire_bytes
+                if split:
+                    batch = []
+                    ended = []
+                    result["children"] = [child for child in split_tile(tile)
+                                          if self.area is None or self.area.intersects_extent(child)]
+                    break
+                if self.is_canceled():
+                    if splittable and not pager.page_complete:
+                        # Part of a first page that may still be split is not kept
+                        batch = []
+                        ended = []
+                    break
+                if len(batch) + len(ended) >= WRITE_BATCH_SIZE and pager.next_url:
+                    self.write_batch(feature, batch, writer, result, tile, pager.next_url, ended)
+                    batch = []
+                    ended = []
+            if self.is_canceled():
+                # Keep the features downloaded so far, the tile is resumed after them
+                if batch or ended:
+                    self.write_batch(feature, batch, writer, result, tile, pager.resume_url, ended)
+            elif not result["children"]:
+                self.write_batch(feature, batch, writer, result, tile, ended=ended)
+        except Exception as e:
+            if self.rejected_parameter(pager, e):
+                return self.download_tile(feature, tile, writer, start_url, since)
+            result["error"] = f"  Error processing feature {feature} in tile {','.join(str(c) for c in tile)}: {str(e)}"
+        
+        result["pages"] = pager.page_count
+        result["received"] = pager.feature_count
+        result["bytes"] = pager.bytes_received
+        result["wire_bytes"] = pager.wire_bytes
+        result["latencies"] = pager.latencies
+        result["end"] = datetime.datetime.now()
+        return result
+    
+    def finish_feature(self, feature, stats, writer):
+        """Complete a collection of which all tiles are downloaded and log its statistics"""
+        duplicates_removed = 0
+        exported = None
+        index_time = None
+        try:
+            with self.write_lock:
+                # Also create the layer when there are no features within the extent
+                layer = writer.ensure_layer(feature, feature in self.replace_layers,
+                                            collection_geometry_type(feature))
+                duplicates_removed = layer["duplicates_removed"]
+                # The extent is read from the spatial index
+                index_time = writer.build_spatial_index(feature)
+                writer.update_extent(feature)
+                # Collections with failed tiles stay incomplete, so Resume downloads those tiles
+                if not stats["errors"]:
+                    # FlatGeobuf and GeoParquet files are only written for complete layers
+                    exported = writer.export_layer(feature)
+                    writer.set_collection_status(feature, "complete")
+                    if self.mode != "append":
+                        writer.set_sync_time(feature, self.sync_start, self.extent)
+                    elif not stats["covered"]:
+                        # Only a first download makes the whole layer as new as this run
+                        writer.set_sync_time(feature, self.sync_start, self.extent, keep_existing=True)
+        except Exception as e:
+            stats["errors"].append(f"  Error processing feature {feature}: {str(e)}")
+        if stats["errors"]:
+            self.failed_features.append(feature)
+        
+        self.log(f"  Top10NL-object: {feature}")
+        self.log(f"  Extent: {self.extent[0]},{self.extent[1]},{self.extent[2]},{self.extent[3]}")
+        self.log(f"  Start Time: {stats['start'].strftime('%H:%M:%S')}")
+        if stats["covered"]:
+            self.log(f"  Already downloaded: {stats['covered']:.0%} of the extent is skipped")
+        for error in stats["errors"]:
+            self.log(error)
+        if duplicates_removed:
+            self.log(f"  {duplicates_removed} duplicate features removed from existing layer {feature}")
+        self.log(f"  Feature {feature} processed: {stats['written']} features in {stats['tiles']} tiles ({stats['pages']} pages)")
+        if self.update:
+            self.log(f"  Changes since {self.since.get(feature) or 'never (full download)'}: "
+                     f"{stats['written']} features added or updated, {stats['removed']} ended features removed")
+        if stats["bytes"]:
+            self.log(f"  Transferred: {transfer_summary(stats['wire_bytes'], stats['bytes'])}")
+        if index_time is not None:
+            self.log(f"  Spatial index of {feature} built in {index_time:.1f} s")
+        if exported:
+            self.log(f"  Exported {exported[1]} features to {exported[0]} in {exported[2]:.1f} s")
+        self.log(f"  Finish Time: {stats['end'].strftime('%H:%M:%S')}")
+        self.log("-------------------------")
+        
+        self.latencies.extend(stats["latencies"])
+        self.metrics.append({
+            "type": "collection",
+            "run": self.start_time.isoformat(timespec="seconds"),
+            "collection": feature,
+            "features_expected": self.expected.get(feature),
+            "features_received": stats["received"],
+            "features_written": stats["written"],
+            "features_removed": stats["removed"],
+            "tiles": stats["tiles"],
+            "pages": stats["pages"],
+            "bytes": stats["bytes"],
+            "wire_bytes": stats["wire_bytes"],
+            "latency": latency_summary(stats["latencies"]),
+            "write_s": round(stats["write_time"], 3),
+            "index_s": round(index_time, 3) if index_time is not None else None,
+            "dedup_s": round(stats["dedup_time"], 3),
+            "duration_s": round((stats["end"] - stats["start"]).total_seconds(), 3),
+            "covered": round(stats["covered"], 4),
+            "errors": len(stats["errors"]),
+        })
+    
+    def run(self):
+        """Download the tiles of all features; returns False when canceled"""
+        self.start_time = datetime.datetime.now()
+        # The session is shared with other downloads, so count from here
+        self.session_requests = self.scheduler.session.requests
+        self.session_connections = self.scheduler.session.connections_opened
+        # Process the tiles of all features with a bounded pool of worker threads
+        features = [feature.strip() for feature in self.features if feature.strip()]
+        if self.extents:
+            tiles = queue_tiles(self.extents, self.tile_size)
+            queued_area = sum(extent_area(extent) for extent in self.extents)
+            tiles_area = sum(extent_area(tile) for tile in tiles)
+            self.log(f"Queue of {len(self.extents)} extents: {tiles_area / 1e6:.2f} km2 to download"
+                     f"{f', {1 - tiles_area / queued_area:.0%} overlap skipped' if queued_area > tiles_area else ''}")
+        else:
+            tiles = split_extent(self.extent, self.tile_size)
+        if self.area is not None:
+            all_tiles = len(tiles)
+            tiles = [tile for tile in tiles if self.area.intersects_extent(tile)]
+            self.log(f"Area of interest: {self.area.area() / 1e6:.2f} km2, "
+                     f"{self.area.area() / extent_area(self.extent):.0%} of its bounding box; "
+                     f"{len(tiles)} of {all_tiles} tiles intersect it")
+        # Area of the tiles to download; less than the extent with an area of interest
+        tiles_area = sum(extent_area(tile) for tile in tiles)
+        self.log(f"Tiles: {len(tiles)} of at most {self.tile_size} m; parallel requests: {self.max_workers}")
+        for feature in features:
+            if feature in self.properties:
+                self.log(f"Attributes of {feature}: {', '.join(self.properties[feature]) or 'only ID'}")
+            if feature in self.filters:
+                self.log(f"Filter of {feature} ({self.filters[feature].language}): {self.filters[feature].expression}")
+
+        download_time = datetime.timedelta(0)
+        self.seen_ids = {}
+        stats = {feature: {"pending": 0, "tiles": 0, "pages": 0, "written": 0, "removed": 0, "errors": [],
+                           "received": 0, "bytes": 0, "wire_bytes": 0, "latencies": [],
+                           "write_time": 0.0, "dedup_time": 0.0,
+                           "covered": 0, "start": None, "end": None}
+                 for feature in features}
+        tiles_done = 0
+        tiles_total = 0
+        writer = create_writer(self.output_file, self.bulk_load)
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        pending = set()
+
+        def submit(feature, tile, start_url=None, since=None):
+            nonlocal tiles_total
+            pending.add(executor.submit(self.download_tile, feature, tile, writer, start_url, since))
+            stats[feature]["pending"] += 1
+            tiles_total += 1
+
+        try:
+            job_started = None
+            if self.resume:
+                # Layers of the job that are not written to yet still have to be replaced
+                job = writer.job() or {}
+                status = job.get("status", {})
+                job_started = job.get("started")
+                if self.overwrite:
+                    self.replace_layers = {feature for feature in features if status.get(feature) == "pending"}
+                self.log(f"Resuming download: {sum(status.get(feature) == 'complete' for feature in features)} "
+                         f"of {len(features)} features complete")
+            else:
+                writer.start_job(features, self.extent, self.mode, self.tile_size, self.properties,
+                                 {feature: feature_filter.expression for feature, feature_filter in self.filters.items()},
+                                 self.area.to_json() if self.area is not None else None, self.extents)
+                if self.overwrite:
+                    self.replace_layers = set(features)
+                    # Layers are replaced, so earlier downloads no longer count
+                    for feature in features:
+                        writer.clear_coverage(feature)
+            # Changes made during the download are picked up by the next update
+            self.sync_start = job_started or utc_now()
+            feature_tiles = {}
+            delta_tiles = {}
+            checkpoints = {}
+            for feature in features:
+                feature_tiles[feature] = tiles
+                delta_tiles[feature] = []
+                checkpoints[feature] = writer.checkpoints(feature) if self.resume else []
+                if self.update:
+                    sync = writer.sync_time(feature)
+                    self.since[feature] = sync[0] if sync else None
+                if self.resume or self.mode == "append":
+                    # Only download the parts of the extent that are not downloaded before;
+                    # an update only skips the parts already updated by this job
+                    covered = writer.covered_extents(feature, self.extent, job_started if self.update else None,
+                                                     self.coverage_filter(feature))
+                    covered += [tile for tile, _ in checkpoints[feature]]
+                    feature_tiles[feature] = uncovered_tiles(tiles, covered)
+                    uncovered_area = sum(extent_area(tile) for tile in feature_tiles[feature])
+                    stats[feature]["covered"] = 1 - uncovered_area / tiles_area if tiles_area else 1
+                if self.since.get(feature):
+                    # Parts that were never downloaded are downloaded in full, the rest only the changes
+                    never = uncovered_tiles(feature_tiles[feature],
+                                            writer.covered_extents(feature, self.extent,
+                                                                   filter=self.coverage_filter(feature)))
+                    delta_tiles[feature] = [tile for tile in feature_tiles[feature] if tile not in never]
+                    feature_tiles[feature] = never
+            
+            # Progress is measured in features, so count them first
+            to_download = [feature for feature in features
+                           if feature_tiles[feature] or delta_tiles[feature] or checkpoints[feature]]
+            counts = self.count_features(to_download, executor)
+            # The counts are for the whole extent; assume the features are spread evenly over it
+            share = tiles_area / extent_area(self.extent) if extent_area(self.extent) else 1
+            self.expected = {feature: (round(count * share * (1 - stats[feature]["covered"]))
+                                       if count is not None else None)
+                             for feature, count in counts.items()}
+            if to_download and None not in self.expected.values():
+                self.progress = DownloadProgress(sum(self.expected.values()))
+                self.log(f"Features to download: ~{self.progress.expected:,}")
+            else:
+                self.progress = DownloadProgress()
+                self.log("Feature counts unknown, progress is based on tiles")
+            self.last_progress_log = time.monotonic()
+            
+            for feature in features:
+                # Partly downloaded tiles continue from their checkpoint
+                for tile, next_url in checkpoints[feature]:
+                    # A checkpoint URL with a datetime parameter belongs to a tile with only the changes
+                    since = self.since.get(feature) if "datetime=" in next_url else None
+                    submit(feature, tile, next_url, since)
+                for tile in feature_tiles[feature]:
+                    submit(feature, tile)
+                for tile in delta_tiles[feature]:
+                    submit(feature, tile, since=self.since[feature])
+                if feature not in to_download:
+                    stats[feature]["start"] = stats[feature]["end"] = datetime.datetime.now()
+                    self.finish_feature(feature, stats[feature], writer)
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                if self.is_canceled():
+                    for future in pending:
+                        future.cancel()
+                    self.log("Download canceled")
+                    return False
+
+                for future in done:
+                    result = future.result()
+                    feature = result["feature"]
+                    feature_stats = stats[feature]
+                    feature_stats["pending"] -= 1
+                    feature_stats["pages"] += result["pages"]
+                    for key in ("written", "removed", "received", "bytes", "wire_bytes", "write_time", "dedup_time"):
+                        feature_stats[key] += result[key]
+                    feature_stats["latencies"].extend(result["latencies"])
+                    if result["error"]:
+                        feature_stats["errors"].append(result["error"])
+                    if feature_stats["start"] is None or result["start"] < feature_stats["start"]:
+                        feature_stats["start"] = result["start"]
+                    if feature_stats["end"] is None or result["end"] > feature_stats["end"]:
+                        feature_stats["end"] = result["end"]
+                    download_time += result["end"] - result["start"]
+                    tiles_done += 1
+                    # Dense tiles are replaced by their quadrants
+                    for child in result["children"]:
+                        submit(feature, child, since=result["since"])
+                    if not result["children"]:
+                        feature_stats["tiles"] += 1
+                    if feature_stats["pending"] == 0:
+                        self.finish_feature(feature, feature_stats, writer)
+
+                self.progress.set_tiles(tiles_done, tiles_total)
+                self.report_progress()
+        finally:
+            executor.shutdown(wait=True)
+            writer.close()
+
+        # Final progress update
+        wall_seconds = max((datetime.datetime.now() - self.start_time).total_seconds(), 0.001)
+        summary = (f"{self.progress.features:,} features ({self.progress.bytes / 1e6:.1f} MB) received: "
+                   f"{self.progress.features / wall_seconds:,.0f} features/s, "
+                   f"{self.progress.bytes / 1e6 / wall_seconds:.2f} MB/s")
+        self.set_progress(100, summary)
+        self.log(summary)
+        session = self.scheduler.session
+        wire_bytes = sum(record["wire_bytes"] for record in self.metrics)
+        decoded_bytes = sum(record["bytes"] for record in self.metrics)
+        self.log(f"Transferred: {transfer_summary(wire_bytes, decoded_bytes)}; "
+                 f"{session.requests - self.session_requests} requests over "
+                 f"{session.connections_opened - self.session_connections} new connections")
+
+        download_wall_time = datetime.datetime.now() - self.start_time
+        self.log(f"Download time (sum of tiles): {download_time}")
+        self.log(f"Download time (wall clock): {download_wall_time}")
+        self.log(f"Time saved by parallel downloads: {max(download_time - download_wall_time, datetime.timedelta(0))}")
+        if self.scheduler.retry_count:
+            self.log(f"Requests retried: {self.scheduler.retry_count}; "
+                     f"parallel requests at the end: {self.scheduler.limiter.limit}")
+        if self.failed_features:
+            self.log(f"Not all tiles could be downloaded for: {', '.join(self.failed_features)}")
+        if self.maintain:
+            try:
+                self.maintenance = maintain_geopackage(state_file(self.output_file), self.log)
+            except Exception as e:
+                # The download itself is complete
+                self.log(f"Error during GeoPackage maintenance: {str(e)}")
+        
+        return True
+    
+    def write_metrics(self, path, result):
+        """Append the collection metrics and the totals of this run to a JSON lines file"""
+        if self.start_time is None:
+            return
+        totals = {
+            "type": "run",
+            "run": self.start_time.isoformat(timespec="seconds"),
+            "result": "finished" if result else ("canceled" if self.is_canceled() else "failed"),
+            "collections": len(self.metrics),
+            "mode": self.mode,
+            "resumed": self.resume,
+            "extent": list(self.extent),
+            "extents": len(self.extents) if self.extents else 1,
+            "tile_size": self.tile_size,
+            "parallel_downloads": self.max_workers,
+            "page_size": self.page_size,
+            "bulk_load": self.bulk_load,
+            "wall_s": round((datetime.datetime.now() - self.start_time).total_seconds(), 3),
+        }
+        for key in ("features_received", "features_written", "features_removed", "tiles", "pages", "bytes",
+                    "wire_bytes", "errors"):
+            totals[key] = sum(record[key] for record in self.metrics)
+        for key in ("write_s", "dedup_s", "index_s"):
+            totals[key] = round(sum(record[key] or 0 for record in self.metrics), 3)
+        totals["latency"] = latency_summary(self.latencies)
+        totals["retries"] = self.scheduler.retry_count
+        totals["parallel_requests"] = self.scheduler.limiter.limit
+        records = self.metrics + [totals]
+        if self.maintenance:
+            records.append(dict(self.maintenance, run=totals["run"]))
+        append_metrics(path, records)
@@ -0,0 +1,16 @@
+"""
+Top10NL Downloader - Defaults and limits of a download, importable without loading the download engine
+
+The Processing provider is registered when QGIS starts; it takes its
+parameter defaults from here, so the engine is only imported when a
+download runs.
+"""
+
+# Number of tile and page requests that run in parallel, for all collections together
+DEFAULT_PARALLEL_DOWNLOADS = 4
+MAX_PARALLEL_DOWNLOADS = 8
+
+# Operation modes of a download, as in the dialog
+MODES = ("append", "overwrite", "update")
+# Collections downloaded when none are given, the default selection of the dialog
+DEFAULT_COLLECTIONS = ["wegdeel_vlak", "gebouw_vlak", "waterdeel_vlak", "terrein_vlak"]
@@ -0,0 +1,289 @@
+"""
+Selection of the attributes and features of Top10NL collections that are downloaded
+"""
+
+import re
+
+from .delta_sync import END_FIELDS, MUTATION_FIELDS
+from .gpkg_writer import ID_FIELD
+
+# Tokens of the CQL2 text subset that can be evaluated in the stream
+CQL2_TOKEN = re.compile(r"""
+    \s*(?:
+        (?P<string>'(?:[^']|'')*')
+      | (?P<number>-?\d+(?:\.\d*)?(?:[eE][-+]?\d+)?)
+      | (?P<operator><>|<=|>=|=|<|>|\(|\)|,)
+      | (?P<quoted>"(?:[^"]|"")+")
+      | (?P<word>[A-Za-z_][\w.:-]*)
+    )""", re.VERBOSE)
+CQL2_KEYWORDS = {"AND", "OR", "NOT", "IN", "LIKE", "IS", "NULL", "BETWEEN", "TRUE", "FALSE"}
+# property=value pairs joined by '&', sent as query parameters
+QUERY_PAIR = re.compile(r"^([A-Za-z_][\w.-]*)=([^=&'\"\s][^=&'\"]*)$")
+
+
+def requested_properties(properties, update=False):
+    """Property names to request from the service for a selection of properties.
+
+    The ID is always requested, as the layers are keyed on it. For an update
+    the lifecycle attributes are requested too, to select the changed and
+    ended features when the service ignores the datetime filter.
+    """
+    names = [ID_FIELD] + [name for name in properties if name.lower() != ID_FIELD.lower()]
+    if update:
+        requested = {name.lower() for name in names}
+        names += [name for name in MUTATION_FIELDS + END_FIELDS if name not in requested]
+    return names
+
+
+def project_features(features, properties):
+    """Drop the properties of features that are not in the selection; the ID is always kept"""
+    keep = {name.lower() for name in properties}
+    keep.add(ID_FIELD.lower())
+    for feature in features:
+        values = feature.get("properties")
+        if values:
+            feature["properties"] = {key: value for key, value in values.items() if key.lower() in keep}
+    return features
+
+
+def _normalized(properties):
+    return {key.lower(): value for key, value in (properties or {}).items()}
+
+
+def _coerce(left, right):
+    """Make two values comparable: numbers stay numbers, other mixes are compared as text"""
+    numeric = (int, float)
+    if isinstance(left, numeric) != isinstance(right, numeric) and not isinstance(left, bool) \
+            and not isinstance(right, bool):
+        try:
+            return float(left), float(right)
+        except (TypeError, ValueError):
+            return str(left), str(right)
+    return left, right
+
+
+def _pair_matches(value, literal):
+    """True when a property value equals the text of a property=value pair read as the JSON type of the value"""
+    if value is None:
+        return False
+    try:
+        if isinstance(value, bool):
+            return value == {"true": True, "false": False}.get(literal.lower())
+        if isinstance(value, (int, float)):
+            return value == float(literal)
+    except ValueError:
+        return False
+    return str(value) == literal
+
+
+def _compare(left, operator, right):
+    if left is None or right is None:
+        return False
+    left, right = _coerce(left, right)
+    try:
+        if operator == "=":
+            return left == right
+        if operator == "<>":
+            return left != right
+        if operator == "<":
+            return left < right
+        if operator == ">":
+            return left > right
+        if operator == "<=":
+            return left <= right
+        return left >= right
+    except TypeError:
+        return False
+
+
+def _like(value, pattern):
+    if value is None:
+        return False
+    expression = "".join(".*" if char == "%" else "." if char == "_" else re.escape(char) for char in pattern)
+    return re.fullmatch(expression, str(value), re.DOTALL) is not None
+
+
+class _Cql2Parser:
+    """Parse a CQL2 text expression into a predicate on the properties of a feature.
+
+    Supports comparisons, AND, OR, NOT, parentheses, IN, LIKE, BETWEEN and
+    IS NULL on properties and literals; spatial and temporal functions are
+    left to the service.
+    """
+
+    def __init__(self, text):
+        self.tokens = []
+        position = 0
+        while position < len(text):
+            match = CQL2_TOKEN.match(text, position)
+            if not match or match.end() == position:
+                if text[position:].strip():
+                    raise ValueError(f"Unsupported filter syntax at: {text[position:position + 20]}")
+                break
+            position = match.end()
+            kind = match.lastgroup
+            value = match.group(kind)
+            if kind == "word" and value.upper() in CQL2_KEYWORDS:
+                kind, value = "keyword", value.upper()
+            self.tokens.append((kind, value))
+        self.index = 0
+        self.properties = []
+
+    def parse(self):
+        predicate = self.expression()
+        if self.index < len(self.tokens):
+            raise ValueError(f"Unexpected '{self.tokens[self.index][1]}' in filter")
+        return predicate
+
+    def peek(self, kind=None, value=None):
+        if self.index >= len(self.tokens):
+            return False
+        token_kind, token_value = self.tokens[self.index]
+        return (kind is None or token_kind == kind) and (value is None or token_value == value)
+
+    def take(self, kind=None, value=None):
+        if not self.peek(kind, value):
+            found = self.tokens[self.index][1] if self.index < len(self.tokens) else "end of filter"
+            raise ValueError(f"Expected {value or kind} in filter, found '{found}'")
+        self.index += 1
+        return self.tokens[self.index - 1][1]
+
+    def expression(self):
+        terms = [self.conjunction()]
+        while self.peek("keyword", "OR"):
+            self.take()
+            terms.append(self.conjunction())
+        return terms[0] if len(terms) == 1 else lambda values: any(term(values) for term in terms)
+
+    def conjunction(self):
+        terms = [self.negation()]
+        while self.peek("keyword", "AND"):
+            self.take()
+            terms.append(self.negation())
+        return terms[0] if len(terms) == 1 else lambda values: all(term(values) for term in terms)
+
+    def negation(self):
+        if self.peek("keyword", "NOT"):
+            self.take()
+            term = self.negation()
+            return lambda values: not term(values)
+        if self.peek("operator", "("):
+            self.take()
+            term = self.expression()
+            self.take("operator", ")")
+            return term
+        return self.predicate()
+
+    def operand(self):
+        if self.peek("string"):
+            literal = self.take()[1:-1].replace("''", "'")
+            return lambda values: literal
+        if self.peek("number"):
+            text = self.take()
+            number = float(text) if any(char in text for char in ".eE") else int(text)
+            return lambda values: number
+        if self.peek("keyword", "TRUE") or self.peek("keyword", "FALSE"):
+            literal = self.take() == "TRUE"
+            return lambda values: literal
+        if self.peek("quoted"):
+            name = self.take()[1:-1].replace('""', '"')
+        else:
+            name = self.take("word")
+        self.properties.append(name)
+        key = name.lower()
+        return lambda values: values.get(key)
+
+    def predicate(self):
+        left = self.operand()
+        negate = False
+        if self.peek("keyword", "IS"):
+            self.take()
+            negate = self.peek("keyword", "NOT")
+            if negate:
+                self.take()
+            self.take("keyword", "NULL")
+            return lambda values: (left(values) is None) != negate
+        if self.peek("keyword", "NOT"):
+            self.take()
+            negate = True
+        if self.peek("keyword", "IN"):
+            self.take()
+            self.take("operator", "(")
+            options = [self.operand()]
+            while self.peek("operator", ","):
+                self.take()
+                options.append(self.operand())
+            self.take("operator", ")")
+            return lambda values: any(_compare(left(values), "=", option(values))
+                                      for option in options) != negate
+        if self.peek("keyword", "LIKE"):
+            self.take()
+            pattern = self.take("string")[1:-1].replace("''", "'")
+            return lambda values: _like(left(values), pattern) != negate
+        if self.peek("keyword", "BETWEEN"):
+            self.take()
+            low = self.operand()
+            self.take("keyword", "AND")
+            high = self.operand()
+            return lambda values: (_compare(left(values), ">=", low(values))
+                                   and _compare(left(values), "<=", high(values))) != negate
+        if negate:
+            raise ValueError("Expected IN, LIKE or BETWEEN after NOT in filter")
+        operator = self.take("operator")
+        if operator not in ("=", "<>", "<", ">", "<=", ">="):
+            raise ValueError(f"Unexpected '{operator}' in filter")
+        right = self.operand()
+        return lambda values: _compare(left(values), operator, right(values))
+
+
+class FeatureFilter:
+    """Filter expression for the features of a collection.
+
+    ``property=value`` pairs joined by ``&`` are sent as query parameters,
+    any other expression as a CQL2 text ``filter``. Both are also evaluated
+    on the downloaded features, for services that cannot filter.
+    Raises ValueError for an expression that cannot be parsed.
+    """
+
+    def __init__(self, expression):
+        self.expression = expression.strip()
+        if not self.expression:
+            raise ValueError("Empty filter")
+        pairs = [QUERY_PAIR.match(part.strip()) for part in self.expression.split("&")]
+        if all(pairs):
+            self.pairs = [(match.group(1), match.group(2).strip()) for match in pairs]
+            names = [name.lower() for name, _ in self.pairs]
+            duplicates = sorted({name for name in names if names.count(name) > 1})
+            if duplicates:
+                # A query parameter can only be sent once
+                raise ValueError(f"Property {', '.join(duplicates)} occurs more than once in the filter")
+            self.properties = [name for name, _ in self.pairs]
+            self._predicate = self._match_pairs
+        else:
+            self.pairs = None
+            parser = _Cql2Parser(self.expression)
+            self._predicate = parser.parse()
+            self.properties = list(dict.fromkeys(parser.properties))
+
+    @property
+    def language(self):
+        """'query' for property=value parameters, else 'cql2-text'"""
+        return "query" if self.pairs is not None else "cql2-text"
+
+    def query_params(self):
+        """Query parameters that let the service apply the filter"""
+        if self.pairs is not None:
+            return dict(self.pairs)
+        return {"filter": self.expression, "filter-lang": "cql2-text"}
+
+    def _match_pairs(self, values):
+        return all(_pair_matches(values.get(name.lower()), value) for name, value in self.pairs)
+
+    def matches(self, feature):
+        """True when the feature passes the filter"""
+        return bool(self._predicate(_normalized(feature.get("properties"))))
+
+
+def filter_features(features, feature_filter):
+    """The features that pass a FeatureFilter"""
+    return [feature for feature in features if feature_filter.matches(feature)]
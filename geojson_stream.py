@@ -0,0 +1,145 @@
+"""
+Incremental parser for GeoJSON FeatureCollections, so features can be handled while a page is still arriving
+"""
+
+import codecs
+import json
+import re
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_NUMBER_CHARS = "0123456789.eE+-"
+
+# States of the parser within the top level object
+(_START, _FIRST_KEY, _KEY, _COLON, _VALUE, _NEXT_MEMBER,
+ _FIRST_FEATURE, _FEATURE, _NEXT_FEATURE, _END) = range(10)
+
+
+class FeatureStreamParser:
+    """Parse a GeoJSON FeatureCollection from chunks of bytes.
+
+    feed() returns the features of which the last byte has arrived, so
+    only the features of one chunk and the unparsed rest are held in
+    memory instead of the whole response. The other members of the
+    collection, such as ``links`` and ``numberMatched``, are collected in
+    ``members``; members that follow the features are only known after
+    close(). Raises ValueError when the data is not a JSON object.
+    """
+
+    def __init__(self):
+        self.members = {}
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._json = json.JSONDecoder()
+        self._text = ""
+        self._pos = 0
+        self._state = _START
+        self._key = None
+        # Length of unparsed text needed before an incomplete value is parsed again
+        self._wanted = 0
+
+    def feed(self, data):
+        """Add a chunk of bytes and return the features completed by it"""
+        self._text = self._text[self._pos:] + self._decoder.decode(data)
+        self._pos = 0
+        return self._parse(final=False)
+
+    def close(self):
+        """Parse the rest of the data and return its features; raises ValueError when the data is incomplete"""
+        self._text = self._text[self._pos:] + self._decoder.decode(b"", final=True)
+        self._pos = 0
+        features = self._parse(final=True)
+        if self._state != _END:
+            raise ValueError("Incomplete GeoJSON response")
+        return features
+
+    def _skip(self):
+        self._pos = _WHITESPACE.match(self._text, self._pos).end()
+        return self._text[self._pos] if self._pos < len(self._text) else None
+
+    def _expect(self, char, found):
+        if found != char:
+            raise ValueError(f"Invalid GeoJSON response: expected '{char}' at {found!r}")
+        self._pos += 1
+
+    def _value(self, final):
+        """Decode the JSON value at the position, or raise _Incomplete when it has not arrived completely"""
+        if not final and len(self._text) - self._pos < self._wanted:
+            raise _Incomplete()
+        try:
+            value, end = self._json.raw_decode(self._text, self._pos)
+        except json.JSONDecodeError:
+            if final:
+                raise
+            # Parse again once the unparsed text has doubled, so large values are not parsed for every chunk
+            self._wanted = 2 * (len(self._text) - self._pos)
+            raise _Incomplete() from None
+        if not final and isinstance(value, (int, float)) and not isinstance(value, bool) \
+                and (end == len(self._text) or self._text[end] in _NUMBER_CHARS):
+            # A number may continue in the next chunk, as with '2.' followed by '5'
+            raise _Incomplete()
+        self._wanted = 0
+        self._pos = end
+        return value
+
+    def _parse(self, final):
+        features = []
+        try:
+            while True:
+                char = self._skip()
+                if char is None:
+                    break
+                state = self._state
+                if state == _START:
+                    self._expect("{", char)
+                    self._state = _FIRST_KEY
+                elif state in (_FIRST_KEY, _KEY):
+                    if char == "}" and state == _FIRST_KEY:
+                        self._pos += 1
+                        self._state = _END
+                        continue
+                    key = self._value(final)
+                    if not isinstance(key, str):
+                        raise ValueError("Invalid GeoJSON response: expected a member name")
+                    self._key = key
+                    self._state = _COLON
+                elif state == _COLON:
+                    self._expect(":", char)
+                    self._state = _VALUE
+                elif state == _VALUE:
+                    if self._key == "features" and char == "[":
+                        self._pos += 1
+                        self._state = _FIRST_FEATURE
+                    else:
+                        self.members[self._key] = self._value(final)
+                        self._state = _NEXT_MEMBER
+                elif state == _NEXT_MEMBER:
+                    self._pos += 1
+                    if char == ",":
+                        self._state = _KEY
+                    elif char == "}":
+                        self._state = _END
+                    else:
+                        raise ValueError(f"Invalid GeoJSON response: unexpected {char!r}")
+                elif state in (_FIRST_FEATURE, _FEATURE):
+                    if char == "]" and state == _FIRST_FEATURE:
+                        self._pos += 1
+                        self._state = _NEXT_MEMBER
+                        continue
+                    features.append(self._value(final))
+                    self._state = _NEXT_FEATURE
+                elif state == _NEXT_FEATURE:
+                    self._pos += 1
+                    if char == ",":
+                        self._state = _FEATURE
+                    elif char == "]":
+                        self._state = _NEXT_MEMBER
+                    else:
+                        raise ValueError(f"Invalid GeoJSON response: unexpected {char!r}")
+                else:
+                    raise ValueError("Invalid GeoJSON response: data after the end")
+        except _Incomplete:
+            pass
+        return features
+
+
+class _Incomplete(Exception):
+    """The value at the position has not arrived completely"""
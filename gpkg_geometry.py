@@ -0,0 +1,307 @@
+"""
+Conversion of GeoJSON geometries to GeoPackage geometry blobs
+"""
+
+import struct
+import sys
+from array import array
+from itertools import chain
+
+try:
+    import numpy
+except ImportError:
+    # NumPy ships with QGIS; without it encode_geometries() encodes one geometry at a time
+    numpy = None
+
+# WKB geometry type codes
+GEOMETRY_TYPE_CODES = {
+    "Point": 1,
+    "LineString": 2,
+    "Polygon": 3,
+    "MultiPoint": 4,
+    "MultiLineString": 5,
+    "MultiPolygon": 6,
+    "GeometryCollection": 7,
+}
+
+# Geometry type names as registered in gpkg_geometry_columns
+GEOMETRY_TYPE_NAMES = {
+    "Point": "POINT",
+    "LineString": "LINESTRING",
+    "Polygon": "POLYGON",
+    "MultiPoint": "MULTIPOINT",
+    "MultiLineString": "MULTILINESTRING",
+    "MultiPolygon": "MULTIPOLYGON",
+    "GeometryCollection": "GEOMETRYCOLLECTION",
+}
+
+# Single part geometry types and the multi part type they can be promoted to
+MULTI_TYPES = {
+    "Point": "MultiPoint",
+    "LineString": "MultiLineString",
+    "Polygon": "MultiPolygon",
+}
+
+_LITTLE_ENDIAN = sys.byteorder == "little"
+_EMPTY_ENVELOPE = (float("inf"), float("-inf"), float("inf"), float("-inf"))
+
+
+def _coordinates(points):
+    """Pack a list of positions as little endian x,y doubles"""
+    values = array("d")
+    for point in points:
+        values.append(point[0])
+        values.append(point[1])
+    if not _LITTLE_ENDIAN:
+        values.byteswap()
+    return values
+
+
+def _extend_envelope(envelope, values):
+    """Grow envelope (minx, maxx, miny, maxy) with packed x,y doubles"""
+    if not values:
+        return envelope
+    if not _LITTLE_ENDIAN:
+        values = array("d", values)
+        values.byteswap()
+    xs = values[0::2]
+    ys = values[1::2]
+    return (min(envelope[0], min(xs)), max(envelope[1], max(xs)),
+            min(envelope[2], min(ys)), max(envelope[3], max(ys)))
+
+
+def _write_wkb(geom_type, coordinates, parts, envelope):
+    """Append the little endian WKB of one geometry to parts and return the grown envelope"""
+    code = GEOMETRY_TYPE_CODES[geom_type]
+    parts.append(struct.pack("<BI", 1, code))
+    if geom_type == "Point":
+        values = _coordinates([coordinates])
+        parts.append(values.tobytes())
+        return _extend_envelope(envelope, values)
+    if geom_type == "LineString":
+        values = _coordinates(coordinates)
+        parts.append(struct.pack("<I", len(coordinates)))
+        parts.append(values.tobytes())
+        return _extend_envelope(envelope, values)
+    if geom_type == "Polygon":
+        parts.append(struct.pack("<I", len(coordinates)))
+        for ring in coordinates:
+            values = _coordinates(ring)
+            parts.append(struct.pack("<I", len(ring)))
+            parts.append(values.tobytes())
+            envelope = _extend_envelope(envelope, values)
+        return envelope
+    part_type = geom_type[len("Multi"):]
+    parts.append(struct.pack("<I", len(coordinates)))
+    for part in coordinates:
+        envelope = _write_wkb(part_type, part, parts, envelope)
+    return envelope
+
+
+def _write_collection(geometries, parts, envelope):
+    """Append the WKB of a GeometryCollection to parts and return the grown envelope"""
+    parts.append(struct.pack("<BII", 1, GEOMETRY_TYPE_CODES["GeometryCollection"], len(geometries)))
+    for geometry in geometries:
+        if geometry["type"] == "GeometryCollection":
+            envelope = _write_collection(geometry.get("geometries", []), parts, envelope)
+        else:
+            envelope = _write_wkb(geometry["type"], geometry["coordinates"], parts, envelope)
+    return envelope
+
+
+def encode_geometry(geometry, srs_id, promote_to=None):
+    """Return the GeoPackage geometry blob of a GeoJSON geometry.
+
+    :param geometry: GeoJSON geometry object, or None.
+    :param srs_id: srs_id written in the blob header.
+    :param promote_to: optional multi part type a single part geometry is wrapped into.
+    :returns: the blob, or None when there is no geometry.
+    """
+    if not geometry:
+        return None
+    geom_type = geometry["type"]
+    parts = []
+    if geom_type == "GeometryCollection":
+        envelope = _write_collection(geometry.get("geometries", []), parts, _EMPTY_ENVELOPE)
+    else:
+        coordinates = geometry["coordinates"]
+        if promote_to and MULTI_TYPES.get(geom_type) == promote_to:
+            geom_type, coordinates = promote_to, [coordinates]
+        envelope = _write_wkb(geom_type, coordinates, parts, _EMPTY_ENVELOPE)
+    return gpkg_header(srs_id, envelope, geom_type == "Point") + b"".join(parts)
+
+
+def _write_layout(geom_type, coordinates, parts, sequences):
+    """Append the WKB of one geometry to parts as _write_wkb(), with the index of a coordinate
+    sequence in sequences in place of each block of packed coordinates"""
+    code = GEOMETRY_TYPE_CODES[geom_type]
+    parts.append(struct.pack("<BI", 1, code))
+    if geom_type == "Point":
+        sequences.append((coordinates,))
+        parts.append(len(sequences) - 1)
+    elif geom_type == "LineString":
+        parts.append(struct.pack("<I", len(coordinates)))
+        sequences.append(coordinates)
+        parts.append(len(sequences) - 1)
+    elif geom_type == "Polygon":
+        parts.append(struct.pack("<I", len(coordinates)))
+        for ring in coordinates:
+            parts.append(struct.pack("<I", len(ring)))
+            sequences.append(ring)
+            parts.append(len(sequences) - 1)
+    else:
+        part_type = geom_type[len("Multi"):]
+        parts.append(struct.pack("<I", len(coordinates)))
+        for part in coordinates:
+            _write_layout(part_type, part, parts, sequences)
+
+
+def encode_geometries(geometries, srs_id):
+    """Return the GeoPackage geometry blobs of a batch of GeoJSON geometries, as encode_geometry() does.
+
+    With NumPy the coordinates of the whole batch are gathered in one array,
+    packed to little endian doubles at once, and the envelopes are the
+    minima and maxima of its slices, so no Python code runs per
+    coordinate. Geometry collections and batches with coordinates that are
+    not x,y pairs are encoded one geometry at a time.
+    """
+    if numpy is None:
+        return [encode_geometry(geometry, srs_id) for geometry in geometries]
+    layouts = []
+    sequences = []
+    for geometry in geometries:
+        if not geometry or geometry["type"] == "GeometryCollection":
+            layouts.append(None)
+            continue
+        parts = []
+        first = len(sequences)
+        _write_layout(geometry["type"], geometry["coordinates"], parts, sequences)
+        layouts.append((geometry["type"], parts, first, len(sequences)))
+    counts = numpy.fromiter((len(sequence) for sequence in sequences), numpy.int64, len(sequences))
+    coordinates = chain.from_iterable(chain.from_iterable(sequences))
+    try:
+        values = numpy.fromiter(coordinates, numpy.float64, 2 * int(counts.sum()))
+    except ValueError:
+        values = None
+    if values is None or next(coordinates, None) is not None:
+        # Coordinates with a z or m value, or positions without y
+        return [encode_geometry(geometry, srs_id) for geometry in geometries]
+    # Offsets of the sequences in points, and their coordinates as bytes
+    offsets = numpy.zeros(len(sequences) + 1, numpy.int64)
+    numpy.cumsum(counts, out=offsets[1:])
+    data = values.astype("<f8", copy=False).tobytes()
+    starts = [int(offset) * 16 for offset in offsets]
+
+    # Envelopes of the geometries with points, from the ranges of their sequences
+    located = [layout for layout in layouts if layout is not None and offsets[layout[3]] > offsets[layout[2]]]
+    envelopes = {}
+    if located:
+        first_points = numpy.array([offsets[layout[2]] for layout in located])
+        xs = values[0::2]
+        ys = values[1::2]
+        # Each range runs to the first point of the next located geometry; the geometries in between have none
+        bounds = zip(numpy.minimum.reduceat(xs, first_points).tolist(),
+                     numpy.maximum.reduceat(xs, first_points).tolist(),
+                     numpy.minimum.reduceat(ys, first_points).tolist(),
+                     numpy.maximum.reduceat(ys, first_points).tolist())
+        envelopes = {id(layout): envelope for layout, envelope in zip(located, bounds)}
+
+    blobs = []
+    for geometry, layout in zip(geometries, layouts):
+        if layout is None:
+            blobs.append(encode_geometry(geometry, srs_id))
+            continue
+        geom_type, parts, _, _ = layout
+        wkb = b"".join(data[starts[part]:starts[part + 1]] if isinstance(part, int) else part for part in parts)
+        envelope = envelopes.get(id(layout), _EMPTY_ENVELOPE)
+        blobs.append(gpkg_header(srs_id, envelope, geom_type == "Point") + wkb)
+    return blobs
+
+
+def gpkg_header(srs_id, envelope, is_point=False):
+    """GeoPackage binary header: magic, version, flags, srs_id and xy envelope"""
+    empty = envelope[0] > envelope[1]
+    # Flags: little endian; xy envelope unless the geometry is empty or a single point
+    flags = 0x01
+    if empty:
+        flags |= 0x10
+    if empty or is_point:
+        return struct.pack("<2sBBi", b"GP", 0, flags, srs_id)
+    flags |= 0x02
+    return struct.pack("<2sBBi4d", b"GP", 0, flags, srs_id, *envelope)
+
+
+def _read_wkb_envelope(wkb, offset, envelope):
+    """Grow envelope with the coordinates of the WKB geometry at offset; return the new offset and envelope"""
+    endian = "<" if wkb[offset] == 1 else ">"
+    code = struct.unpack_from(endian + "I", wkb, offset + 1)[0]
+    offset += 5
+    # ISO (1000, 2000, 3000) and extended (high bit flags) dimension encodings
+    dims = 2 + (1 if code & 0x80000000 else 0) + (1 if code & 0x40000000 else 0)
+    code &= 0x0FFFFFFF
+    if code >= 1000:
+        dims = {0: 2, 1: 3, 2: 3, 3: 4}[code // 1000]
+        code %= 1000
+
+    def read_points(offset, count):
+        nonlocal envelope
+        values = struct.unpack_from(f"{endian}{count * dims}d", wkb, offset)
+        xs = values[0::dims]
+        ys = values[1::dims]
+        if xs and xs[0] == xs[0]:  # empty points are encoded as NaN
+            envelope = (min(envelope[0], min(xs)), max(envelope[1], max(xs)),
+                        min(envelope[2], min(ys)), max(envelope[3], max(ys)))
+        return offset + count * dims * 8
+
+    if code == 1:
+        return read_points(offset, 1), envelope
+    count = struct.unpack_from(endian + "I", wkb, offset)[0]
+    offset += 4
+    if code == 2:
+        return read_points(offset, count), envelope
+    if code == 3:
+        for _ in range(count):
+            points = struct.unpack_from(endian + "I", wkb, offset)[0]
+            offset = read_points(offset + 4, points)
+        return offset, envelope
+    for _ in range(count):
+        offset, envelope = _read_wkb_envelope(wkb, offset, envelope)
+    return offset, envelope
+
+
+def blob_envelope(blob):
+    """Return the envelope (minx, maxx, miny, maxy) of a GeoPackage blob, or None if it is empty"""
+    if blob is None or len(blob) < 8 or blob[:2] != b"GP":
+        return None
+    flags = blob[3]
+    if flags & 0x10:
+        return None
+    endian = "<" if flags & 0x01 else ">"
+    envelope_size = {0: 0, 1: 32, 2: 48, 3: 48, 4: 64}.get((flags >> 1) & 0x07, 0)
+    if envelope_size:
+        return struct.unpack_from(endian + "4d", blob, 8)
+    _, envelope = _read_wkb_envelope(blob, 8, _EMPTY_ENVELOPE)
+    if envelope[0] > envelope[1]:
+        return None
+    return envelope
+
+
+def promote_blob(blob, srs_id, promote_to):
+    """Wrap the single part geometry of a blob from encode_geometry() into the multi part type promote_to.
+
+    Returns the blob unchanged when it holds another type, so geometries
+    can be encoded before the geometry type of their layer is known.
+    """
+    if blob is None:
+        return None
+    header_size = 8 + (32 if blob[3] & 0x02 else 0)
+    code = struct.unpack_from("<I", blob, header_size + 1)[0]
+    single = next((name for name, multi in MULTI_TYPES.items() if multi == promote_to), None)
+    if single is None or code != GEOMETRY_TYPE_CODES[single]:
+        return blob
+    wkb = struct.pack("<BII", 1, GEOMETRY_TYPE_CODES[promote_to], 1) + blob[header_size:]
+    if single == "Point" and not blob[3] & 0x10:
+        # A multipoint gets the envelope that a single point leaves out
+        x, y = struct.unpack_from("<2d", blob, header_size + 5)
+        return gpkg_header(srs_id, (x, x, y, y)) + wkb
+    return blob[:header_size] + wkb
@@ -0,0 +1,175 @@
+"""
+Top10NL Downloader - Maintenance of a GeoPackage: free space, compaction, statistics and spatial indexes
+
+    python -m top10nl_downloader.gpkg_maintenance top10nl.gpkg
+
+Repeated appends, updates and overwrites leave free pages behind and
+scatter the pages of the tables over the file, so it grows and is slower
+to open and render. Maintenance rebuilds damaged or incomplete R-tree
+indexes, compacts the file with VACUUM when enough of it is free or
+fragmented, and refreshes the query planner statistics with ANALYZE.
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import time
+
+from .gpkg_writer import GeoPackage
+
+# Fraction of free pages, and of b-tree pages out of order, from which VACUUM compacts the file
+VACUUM_FREE_FRACTION = 0.1
+VACUUM_FRAGMENTATION = 0.5
+
+
+def fragmentation(conn):
+    """Fraction of the table and index pages that do not follow the previous page of their b-tree in the file.
+
+    Sequential reads, such as drawing a layer, then seek through the file.
+    Returns None when SQLite is built without the dbstat table.
+    """
+    scattered = 0
+    pages = 0
+    previous = {}
+    try:
+        # dbstat lists the pages of each b-tree in key order
+        for name, pageno in conn.execute("SELECT name, pageno FROM dbstat WHERE pagetype = 'leaf'"):
+            last = previous.get(name)
+            if last is not None:
+                pages += 1
+                if pageno != last + 1:
+                    scattered += 1
+            previous[name] = pageno
+    except sqlite3.OperationalError:
+        return None
+    return scattered / pages if pages else 0.0
+
+
+def space_usage(conn, with_fragmentation=True):
+    """Size and free space in bytes of a SQLite database and its fragmentation, see fragmentation()"""
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+    free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    return {
+        "size": page_size * page_count,
+        "free": page_size * free_pages,
+        "free_fraction": free_pages / page_count if page_count else 0.0,
+        "fragmentation": fragmentation(conn) if with_fragmentation else None,
+    }
+
+
+def usage_summary(usage):
+    """Text with the size, free space and fragmentation of space_usage()"""
+    summary = (f"{usage['size'] / 1e6:.1f} MB, of which {usage['free'] / 1e6:.1f} MB "
+               f"({usage['free_fraction']:.0%}) free")
+    if usage["fragmentation"] is not None:
+        summary += f"; {usage['fragmentation']:.0%} of the pages fragmented"
+    return summary
+
+
+def maintain_geopackage(path, log=None, vacuum=None, check_only=False):
+    """Check and compact a GeoPackage and return a report of what was done.
+
+    Each R-tree spatial index is checked and rebuilt when it does not
+    match its layer. ``vacuum`` None compacts the file when at least
+    VACUUM_FREE_FRACTION of it is free or VACUUM_FRAGMENTATION of its pages
+    are fragmented, True always and False never; ANALYZE then updates the
+    statistics. With ``check_only`` the GeoPackage is opened read-only and
+    only reported on. Raises ValueError when the file does not exist or is
+    not a GeoPackage; a VACUUM that cannot lock the file is skipped.
+    """
+    log = log or (lambda message: None)
+    if not os.path.isfile(path):
+        raise ValueError(f"{path} does not exist")
+    start = time.perf_counter()
+    geopackage = GeoPackage(path, read_only=check_only)
+    conn = geopackage.conn
+    try:
+        before = space_usage(conn)
+        log(f"GeoPackage maintenance of {path}")
+        log(f"  Size: {usage_summary(before)}")
+        fragmented = before["fragmentation"]
+        report = {
+            "type": "maintenance",
+            "path": path,
+            "size_before": before["size"],
+            "free_before": before["free"],
+            "fragmentation_before": round(fragmented, 4) if fragmented is not None else None,
+            "index_problems": {},
+            "indexes_rebuilt": {},
+            "vacuum_s": None,
+            "analyze_s": None,
+        }
+
+        for name in geopackage.spatial_index_layers():
+            problems = geopackage.check_spatial_index(name)
+            if not problems:
+                continue
+            report["index_problems"][name] = problems
+            log(f"  Spatial index of {name}: {'; '.join(problems)}")
+            if not check_only:
+                seconds = geopackage.rebuild_spatial_index(name)
+                report["indexes_rebuilt"][name] = round(seconds, 3)
+                log(f"  Spatial index of {name} rebuilt in {seconds:.1f} s")
+        if not report["index_problems"]:
+            log("  Spatial indexes: ok")
+
+        if vacuum is None:
+            vacuum = (before["free_fraction"] >= VACUUM_FREE_FRACTION
+                      or (fragmented or 0) >= VACUUM_FRAGMENTATION)
+        if check_only:
+            if vacuum:
+                log("  VACUUM recommended")
+        elif vacuum:
+            vacuum_start = time.perf_counter()
+            try:
+                conn.execute("VACUUM")
+                report["vacuum_s"] = round(time.perf_counter() - vacuum_start, 3)
+            except sqlite3.OperationalError as e:
+                # Another program, such as QGIS with a layer being edited, holds a lock on the file
+                log(f"  VACUUM skipped: {str(e)}")
+        else:
+            log("  VACUUM not needed")
+        if not check_only:
+            analyze_start = time.perf_counter()
+            conn.execute("ANALYZE")
+            report["analyze_s"] = round(time.perf_counter() - analyze_start, 3)
+
+        after = space_usage(conn, with_fragmentation=report["vacuum_s"] is not None)
+        report["size_after"] = after["size"]
+        report["free_after"] = after["free"]
+        report["reclaimed"] = before["size"] - after["size"]
+        if report["vacuum_s"] is not None:
+            log(f"  VACUUM reclaimed {report['reclaimed'] / 1e6:.1f} MB in {report['vacuum_s']:.1f} s; "
+                f"size now {usage_summary(after)}")
+        if report["analyze_s"] is not None:
+            log(f"  ANALYZE in {report['analyze_s']:.1f} s")
+    finally:
+        geopackage.close()
+    report["duration_s"] = round(time.perf_counter() - start, 3)
+    log(f"  Maintenance finished in {report['duration_s']:.1f} s")
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Report on, compact and check the spatial indexes of a Top10NL GeoPackage")
+    parser.add_argument("geopackage", help="GeoPackage to maintain")
+    parser.add_argument("--vacuum", choices=("auto", "always", "never"), default="auto",
+                        help=f"compact the file; auto when at least {VACUUM_FREE_FRACTION * 100:.0f}%% of it is free "
+                             f"or {VACUUM_FRAGMENTATION * 100:.0f}%% of its pages are fragmented "
+                             "(default: %(default)s)")
+    parser.add_argument("--check", action="store_true", help="only report, do not change the GeoPackage")
+    args = parser.parse_args(argv)
+    try:
+        maintain_geopackage(args.geopackage, print, {"auto": None, "always": True, "never": False}[args.vacuum],
+                            args.check)
+    except (ValueError, sqlite3.Error) as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
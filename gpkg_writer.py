@@ -0,0 +1,854 @@
+"""
+Batched writer for GeoPackage feature tables
+"""
+
+import json
+import sqlite3
+import time
+
+from .gpkg_geometry import GEOMETRY_TYPE_NAMES, MULTI_TYPES, blob_envelope, encode_geometries, promote_blob
+
+RD_NEW_SRS_ID = 28992
+RD_NEW_WKT = (
+    'PROJCS["Amersfoort / RD New",GEOGCS["Amersfoort",DATUM["Amersfoort",'
+    'SPHEROID["Bessel 1841",6377397.155,299.1528128,AUTHORITY["EPSG","7004"]],'
+    'TOWGS84[565.2369,50.0087,465.658,-0.406857,0.350733,-1.87035,4.0812],'
+    'AUTHORITY["EPSG","6289"]],PRIMEM["Greenwich",0,AUTHORITY["EPSG","8901"]],'
+    'UNIT["degree",0.0174532925199433,AUTHORITY["EPSG","9122"]],AUTHORITY["EPSG","4289"]],'
+    'PROJECTION["Oblique_Stereographic"],PARAMETER["latitude_of_origin",52.1561605555556],'
+    'PARAMETER["central_meridian",5.38763888888889],PARAMETER["scale_factor",0.9999079],'
+    'PARAMETER["false_easting",155000],PARAMETER["false_northing",463000],'
+    'UNIT["metre",1,AUTHORITY["EPSG","9001"]],AXIS["Easting",EAST],AXIS["Northing",NORTH],'
+    'AUTHORITY["EPSG","28992"]]'
+)
+
+# Attribute holding the unique Top10NL identifier of a feature
+ID_FIELD = "ID"
+GEOMETRY_COLUMN = "geom"
+
+# Table recording which extents of which collections have been downloaded
+COVERAGE_TABLE = "top10nl_coverage"
+# Tables with the parameters and state of the last download job, to resume it
+JOB_TABLE = "top10nl_job"
+CHECKPOINT_TABLE = "top10nl_checkpoint"
+# Table with the time of the last full or update download per layer
+SYNC_TABLE = "top10nl_sync"
+
+# Suffixes of the triggers that keep the R-tree spatial index of a feature table up to date
+RTREE_TRIGGERS = ("insert", "update1", "update2", "update3", "update4", "update5", "update6", "update7", "delete")
+
+# 'GPKG' and GeoPackage version 1.4, the version of the spatial index triggers that are written
+GPKG_APPLICATION_ID = 0x47504B47
+GPKG_USER_VERSION = 10400
+RTREE_EXTENSION_DEFINITION = "http://www.geopackage.org/spec140/#extension_rtree"
+
+
+def quote(identifier):
+    """Quote an SQLite identifier"""
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+def field_type(value):
+    """SQLite column type for a GeoJSON property value"""
+    if isinstance(value, bool):
+        return "BOOLEAN"
+    if isinstance(value, int):
+        return "INTEGER"
+    if isinstance(value, float):
+        return "REAL"
+    return "TEXT"
+
+
+def field_value(value):
+    """Convert a GeoJSON property value to a value SQLite can store"""
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return value
+
+
+def feature_id(feature):
+    """Top10NL identifier of a GeoJSON feature: its ID property or else the feature id"""
+    properties = feature.get("properties") or {}
+    for key, value in properties.items():
+        if key.lower() == ID_FIELD.lower():
+            return value
+    return feature.get("id")
+
+
+def property_values(feature):
+    """Properties of a feature as (name, value to store) by lower case name"""
+    properties = feature.get("properties") or {}
+    return {key.lower(): (key, field_value(value)) for key, value in properties.items()}
+
+
+class PreparedFeature:
+    """A GeoJSON feature encoded for writing: its ID, geometry type, geometry blob and attribute values.
+
+    Much smaller than the parsed feature, so features can be prepared as
+    they arrive and collected in a batch while later pages stream in.
+    Single part geometries are promoted when they are written to a multi
+    part layer.
+    """
+    __slots__ = ("id", "geometry_type", "blob", "values")
+
+    def __init__(self, feature, blob):
+        geometry = feature.get("geometry")
+        self.id = feature_id(feature)
+        self.geometry_type = geometry["type"] if geometry else None
+        self.blob = blob
+        self.values = property_values(feature)
+
+
+def prepare_features(features, srs_id=RD_NEW_SRS_ID):
+    """PreparedFeature objects for GeoJSON features; features that are prepared already are kept.
+
+    The geometries are encoded together, see encode_geometries().
+    """
+    features = list(features)
+    pending = [feature for feature in features if not isinstance(feature, PreparedFeature)]
+    if not pending:
+        return features
+    blobs = iter(encode_geometries([feature.get("geometry") for feature in pending], srs_id))
+    return [feature if isinstance(feature, PreparedFeature) else PreparedFeature(feature, next(blobs))
+            for feature in features]
+
+
+def _read_job(conn):
+    """The last download job stored in a GeoPackage, or None"""
+    cursor = conn.execute(f"SELECT * FROM {JOB_TABLE} ORDER BY rowid")
+    columns = [description[0] for description in cursor.description]
+    rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+    if not rows:
+        return None
+    first = rows[0]
+    # Job tables of earlier versions lack the later columns
+    mode = first.get("mode") or ("overwrite" if first["overwrite"] else "append")
+    return {
+        "collections": [row["collection"] for row in rows],
+        "extent": [first["min_x"], first["min_y"], first["max_x"], first["max_y"]],
+        "overwrite": bool(first["overwrite"]),
+        "tile_size": first["tile_size"],
+        "status": {row["collection"]: row["status"] for row in rows},
+        "mode": mode,
+        "started": first["started"],
+        "properties": {row["collection"]: json.loads(row["properties"])
+                       for row in rows if row.get("properties") is not None},
+        "filters": {row["collection"]: row["filter"] for row in rows if row.get("filter")},
+        "area": first.get("area"),
+        "extents": json.loads(first["extents"]) if first.get("extents") else None,
+    }
+
+
+def load_job(path):
+    """Read the last download job of a GeoPackage without changing the file.
+
+    :returns: a dict with the collections, extent, overwrite, mode
+        ('append', 'overwrite' or 'update'), tile_size, the status per
+        collection ('pending', 'started' or 'complete'), the selected
+        properties and the filter per collection, the area of interest
+        as JSON and the queued extents, or None when the GeoPackage has no job.
+    """
+    try:
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    except sqlite3.Error:
+        return None
+    try:
+        return _read_job(conn)
+    except sqlite3.Error:
+        return None
+    finally:
+        conn.close()
+
+
+def _envelope_function(index, empty_value):
+    def envelope_value(blob):
+        envelope = blob_envelope(blob)
+        return envelope[index] if envelope else empty_value
+    return envelope_value
+
+
+def _is_empty(blob):
+    return 1 if blob_envelope(blob) is None else 0
+
+
+class GeoPackage:
+    """Connection to an existing GeoPackage, to inspect its layers and maintain their spatial indexes.
+
+    Opening it creates no tables, unlike GeoPackageWriter; with
+    ``read_only`` nothing can be written at all. Raises ValueError when
+    the file has no gpkg_contents table. ``create`` opens or creates any
+    SQLite file, for GeoPackageWriter to set it up.
+    """
+
+    def __init__(self, path, read_only=False, create=False):
+        self.path = path
+        if create:
+            self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        else:
+            # A URI, so SQLite neither creates a missing file nor writes to a read-only one
+            self.conn = sqlite3.connect(f"file:{path}?mode={'ro' if read_only else 'rw'}", uri=True,
+                                        check_same_thread=False, isolation_level=None)
+        # The spatial index triggers of the GeoPackage call these functions
+        self.conn.create_function("ST_MinX", 1, _envelope_function(0, None), deterministic=True)
+        self.conn.create_function("ST_MaxX", 1, _envelope_function(1, None), deterministic=True)
+        self.conn.create_function("ST_MinY", 1, _envelope_function(2, None), deterministic=True)
+        self.conn.create_function("ST_MaxY", 1, _envelope_function(3, None), deterministic=True)
+        self.conn.create_function("ST_IsEmpty", 1, _is_empty, deterministic=True)
+        if not create and not self._table_exists("gpkg_contents"):
+            self.conn.close()
+            raise ValueError(f"{path} is not a GeoPackage")
+
+    def close(self):
+        """Close the connection to the GeoPackage"""
+        self.conn.close()
+
+    def _table_exists(self, name):
+        return self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND lower(name) = lower(?)",
+            (name,)).fetchone() is not None
+
+    def layer_exists(self, name):
+        """True when the GeoPackage has a feature table with this name"""
+        return self.conn.execute(
+            "SELECT 1 FROM gpkg_contents WHERE lower(table_name) = lower(?)",
+            (name,)).fetchone() is not None
+
+    def geometry_column(self, name):
+        """Name of the geometry column of a feature table"""
+        row = self.conn.execute(
+            "SELECT column_name FROM gpkg_geometry_columns WHERE lower(table_name) = lower(?)",
+            (name,)).fetchone()
+        return row[0] if row else GEOMETRY_COLUMN
+
+    def layer_fields(self, name):
+        """Lower case names of the columns of a feature table"""
+        return {row[1].lower() for row in self.conn.execute(f"PRAGMA table_info({quote(name)})")}
+
+    def primary_key(self, name):
+        """Name of the integer primary key column of a feature table"""
+        for row in self.conn.execute(f"PRAGMA table_info({quote(name)})"):
+            if row[5]:
+                return row[1]
+        return "fid"
+
+    def create_spatial_index_triggers(self, name, geom):
+        """(Re)create the triggers that keep the R-tree index of a table up to date.
+
+        These are the triggers of GeoPackage 1.4. Unlike the 1.2 'update1'
+        and 'update3' triggers they do not rely on INSERT OR REPLACE, which
+        is overruled by the conflict clause of an upsert on the table.
+        """
+        conn = self.conn
+        rtree = f"rtree_{name}_{geom}"
+        t, c, r = quote(name), quote(geom), quote(rtree)
+        for suffix in RTREE_TRIGGERS:
+            conn.execute(f"DROP TRIGGER IF EXISTS {quote(f'{rtree}_{suffix}')}")
+        new_bounds = f"ST_MinX(NEW.{c}), ST_MaxX(NEW.{c}), ST_MinY(NEW.{c}), ST_MaxY(NEW.{c})"
+        new_geom = f"(NEW.{c} NOTNULL AND NOT ST_IsEmpty(NEW.{c}))"
+        conn.execute(
+            f"CREATE TRIGGER {quote(rtree + '_insert')} AFTER INSERT ON {t} "
+            f"WHEN {new_geom} BEGIN "
+            f"INSERT OR REPLACE INTO {r} VALUES (NEW.fid, {new_bounds}); END")
+        conn.execute(
+            f"CREATE TRIGGER {quote(rtree + '_update6')} AFTER UPDATE OF {c} ON {t} "
+            f"WHEN OLD.fid = NEW.fid AND {new_geom} "
+            f"AND (OLD.{c} NOTNULL AND NOT ST_IsEmpty(OLD.{c})) BEGIN "
+            f"UPDATE {r} SET minx = ST_MinX(NEW.{c}), maxx = ST_MaxX(NEW.{c}), "
+            f"miny = ST_MinY(NEW.{c}), maxy = ST_MaxY(NEW.{c}) WHERE id = NEW.fid; END")
+        conn.execute(
+            f"CREATE TRIGGER {quote(rtree + '_update7')} AFTER UPDATE OF {c} ON {t} "
+            f"WHEN OLD.fid = NEW.fid AND {new_geom} "
+            f"AND (OLD.{c} ISNULL OR ST_IsEmpty(OLD.{c})) BEGIN "
+            f"INSERT INTO {r} VALUES (NEW.fid, {new_bounds}); END")
+        conn.execute(
+            f"CREATE TRIGGER {quote(rtree + '_update2')} AFTER UPDATE OF {c} ON {t} "
+            f"WHEN OLD.fid = NEW.fid AND (NEW.{c} ISNULL OR ST_IsEmpty(NEW.{c})) BEGIN "
+            f"DELETE FROM {r} WHERE id = OLD.fid; END")
+        conn.execute(
+            f"CREATE TRIGGER {quote(rtree + '_update5')} AFTER UPDATE ON {t} "
+            f"WHEN OLD.fid != NEW.fid AND {new_geom} BEGIN "
+            f"DELETE FROM {r} WHERE id = OLD.fid; "
+            f"INSERT OR REPLACE INTO {r} VALUES (NEW.fid, {new_bounds}); END")
+        conn.execute(
+            f"CREATE TRIGGER {quote(rtree + '_update4')} AFTER UPDATE ON {t} "
+            f"WHEN OLD.fid != NEW.fid AND (NEW.{c} ISNULL OR ST_IsEmpty(NEW.{c})) BEGIN "
+            f"DELETE FROM {r} WHERE id IN (OLD.fid, NEW.fid); END")
+        conn.execute(
+            f"CREATE TRIGGER {quote(rtree + '_delete')} AFTER DELETE ON {t} "
+            f"WHEN OLD.{c} NOT NULL BEGIN DELETE FROM {r} WHERE id = OLD.fid; END")
+        # A GeoPackage of an earlier version, e.g. written by GDAL, now declares the version of these triggers
+        if self._table_exists("gpkg_extensions"):
+            conn.execute(
+                "UPDATE gpkg_extensions SET definition = ? WHERE lower(table_name) = lower(?) "
+                "AND extension_name = 'gpkg_rtree_index'", (RTREE_EXTENSION_DEFINITION, name))
+        if conn.execute("PRAGMA user_version").fetchone()[0] < GPKG_USER_VERSION:
+            conn.execute(f"PRAGMA user_version = {GPKG_USER_VERSION}")
+
+    def spatial_index_suspended(self, name):
+        """True when a layer has an R-tree index without the triggers that maintain it.
+
+        This is the state of a layer during a bulk load, and after a bulk
+        load that was killed before its index was built.
+        """
+        rtree = f"rtree_{name}_{self.geometry_column(name)}"
+        return self._table_exists(rtree) and not self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = ?", (f"{rtree}_insert",)).fetchone()
+
+    def spatial_index_layers(self):
+        """Names of the feature tables with an R-tree spatial index"""
+        names = [row[0] for row in self.conn.execute("SELECT table_name FROM gpkg_geometry_columns")]
+        return [name for name in names if self._table_exists(f"rtree_{name}_{self.geometry_column(name)}")]
+
+    def check_spatial_index(self, name):
+        """Problems of the R-tree index of a layer, an empty list when it matches the geometries.
+
+        Checks the triggers that maintain the index, the structure of the
+        R-tree and that each non-empty geometry has exactly one entry. The
+        bounding boxes of the entries themselves are not compared.
+        """
+        conn = self.conn
+        geom = self.geometry_column(name)
+        rtree = f"rtree_{name}_{geom}"
+        t, c, r = quote(name), quote(geom), quote(rtree)
+        pk = quote(self.primary_key(name))
+        problems = []
+        if self.spatial_index_suspended(name):
+            problems.append("the triggers that update the index are missing")
+        try:
+            result = conn.execute("SELECT rtreecheck(?)", (rtree,)).fetchone()[0]
+            if result != "ok":
+                problems.append(f"damaged R-tree: {result.splitlines()[0]}")
+        except sqlite3.OperationalError:
+            # rtreecheck() is only available since SQLite 3.24
+            pass
+        missing = conn.execute(
+            f"SELECT count(*) FROM {t} LEFT JOIN {r} AS r ON r.id = {t}.{pk} "
+            f"WHERE {t}.{c} NOT NULL AND NOT ST_IsEmpty({t}.{c}) AND r.id IS NULL").fetchone()[0]
+        if missing:
+            problems.append(f"{missing} features are missing from the index")
+        orphaned = conn.execute(f"SELECT count(*) FROM {r} WHERE id NOT IN (SELECT {pk} FROM {t})").fetchone()[0]
+        if orphaned:
+            problems.append(f"{orphaned} index entries have no feature")
+        return problems
+
+    def rebuild_spatial_index(self, name):
+        """Build the R-tree index of a layer again from its geometries and restore its triggers.
+
+        :returns: the seconds it took.
+        """
+        start = time.perf_counter()
+        conn = self.conn
+        geom = self.geometry_column(name)
+        t, c, r = quote(name), quote(geom), quote(f"rtree_{name}_{geom}")
+        conn.execute("BEGIN")
+        try:
+            conn.execute(f"DELETE FROM {r}")
+            # One envelope per row, instead of the four calls of the ST_ functions of the triggers
+            rows = conn.execute(f"SELECT {quote(self.primary_key(name))}, {c} FROM {t} WHERE {c} NOT NULL")
+            entries = ((fid,) + envelope for fid, envelope in ((fid, blob_envelope(blob)) for fid, blob in rows)
+                       if envelope is not None)
+            conn.executemany(f"INSERT INTO {r} VALUES (?, ?, ?, ?, ?)", entries)
+            self.create_spatial_index_triggers(name, geom)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return time.perf_counter() - start
+
+
+class GeoPackageWriter(GeoPackage):
+    """Write GeoJSON features into feature tables of a GeoPackage.
+
+    The writer keeps one SQLite connection open for all layers and writes
+    every batch of features in a single transaction. Existing layers, also
+    those created by GDAL/OGR, are appended to; missing attribute columns
+    are added on the fly. The connection may be shared between threads as
+    long as the caller serializes the calls.
+
+    With ``bulk_load`` the GeoPackage is written with a write-ahead log and
+    fewer syncs to disk, and layers created or replaced by the writer are
+    loaded without their R-tree triggers; build_spatial_index() or close()
+    then builds each spatial index at once. close() switches the journal
+    back, so the GeoPackage is a single file again.
+    """
+
+    def __init__(self, path, srs_id=RD_NEW_SRS_ID, bulk_load=False):
+        super().__init__(path, create=True)
+        self.srs_id = srs_id
+        self.bulk_load = bulk_load
+        if bulk_load:
+            self.conn.execute("PRAGMA journal_mode = WAL")
+            # Commits are not synced to disk, only checkpoints; a crash cannot corrupt the file
+            self.conn.execute("PRAGMA synchronous = NORMAL")
+        self._layers = {}
+        # Layers loaded without spatial index triggers, of which the index still has to be built
+        self._unindexed = set()
+        # Switch the journal back from the write-ahead log of a bulk load on close
+        self._restore_journal = bulk_load
+        self._init_geopackage()
+
+    def close(self):
+        """Build the spatial indexes that are still missing and close the connection to the GeoPackage"""
+        try:
+            for name in list(self._unindexed):
+                self.build_spatial_index(name)
+            if self._restore_journal:
+                # Checkpoints the write-ahead log into the GeoPackage and removes it
+                self.conn.execute("PRAGMA journal_mode = DELETE")
+        finally:
+            super().close()
+
+    def _init_geopackage(self):
+        """Create the GeoPackage system tables when the file is new"""
+        conn = self.conn
+        conn.execute("BEGIN")
+        if not self._table_exists("gpkg_contents"):
+            conn.execute(f"PRAGMA application_id = {GPKG_APPLICATION_ID}")
+            conn.execute(f"PRAGMA user_version = {GPKG_USER_VERSION}")
+            conn.execute(
+                "CREATE TABLE gpkg_spatial_ref_sys (srs_name TEXT NOT NULL, "
+                "srs_id INTEGER NOT NULL PRIMARY KEY, organization TEXT NOT NULL, "
+                "organization_coordsys_id INTEGER NOT NULL, definition TEXT NOT NULL, "
+                "description TEXT)")
+            conn.executemany(
+                "INSERT INTO gpkg_spatial_ref_sys VALUES (?, ?, ?, ?, ?, ?)",
+                [("Undefined cartesian SRS", -1, "NONE", -1, "undefined", "undefined cartesian coordinate reference system"),
+                 ("Undefined geographic SRS", 0, "NONE", 0, "undefined", "undefined geographic coordinate reference system"),
+                 ("WGS 84 geodetic", 4326, "EPSG", 4326,
+                  'GEOGCS["WGS 84",DATUM["WGS_1984",SPHEROID["WGS 84",6378137,298.257223563,'
+                  'AUTHORITY["EPSG","7030"]],AUTHORITY["EPSG","6326"]],PRIMEM["Greenwich",0,'
+                  'AUTHORITY["EPSG","8901"]],UNIT["degree",0.0174532925199433,AUTHORITY["EPSG","9122"]],'
+                  'AXIS["Latitude",NORTH],AXIS["Longitude",EAST],AUTHORITY["EPSG","4326"]]',
+                  "longitude/latitude coordinates in decimal degrees on the WGS 84 spheroid")])
+            conn.execute(
+                "CREATE TABLE gpkg_contents (table_name TEXT NOT NULL PRIMARY KEY, "
+                "data_type TEXT NOT NULL, identifier TEXT UNIQUE, description TEXT DEFAULT '', "
+                "last_change DATETIME NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ','now')), "
+                "min_x DOUBLE, min_y DOUBLE, max_x DOUBLE, max_y DOUBLE, srs_id INTEGER, "
+                "CONSTRAINT fk_gc_r_srs_id FOREIGN KEY (srs_id) REFERENCES gpkg_spatial_ref_sys(srs_id))")
+            conn.execute(
+                "CREATE TABLE gpkg_geometry_columns (table_name TEXT NOT NULL, "
+                "column_name TEXT NOT NULL, geometry_type_name TEXT NOT NULL, "
+                "srs_id INTEGER NOT NULL, z TINYINT NOT NULL, m TINYINT NOT NULL, "
+                "CONSTRAINT pk_geom_cols PRIMARY KEY (table_name, column_name), "
+                "CONSTRAINT uk_gc_table_name UNIQUE (table_name), "
+                "CONSTRAINT fk_gc_tn FOREIGN KEY (table_name) REFERENCES gpkg_contents(table_name), "
+                "CONSTRAINT fk_gc_srs FOREIGN KEY (srs_id) REFERENCES gpkg_spatial_ref_sys (srs_id))")
+        if not self._table_exists("gpkg_extensions"):
+            conn.execute(
+                "CREATE TABLE gpkg_extensions (table_name TEXT, column_name TEXT, "
+                "extension_name TEXT NOT NULL, definition TEXT NOT NULL, scope TEXT NOT NULL, "
+                "CONSTRAINT ge_tce UNIQUE (table_name, column_name, extension_name))")
+        conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {COVERAGE_TABLE} (collection TEXT NOT NULL, "
+            "min_x DOUBLE NOT NULL, min_y DOUBLE NOT NULL, max_x DOUBLE NOT NULL, max_y DOUBLE NOT NULL, "
+            "downloaded DATETIME NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ','now')), "
+            "filter TEXT NOT NULL DEFAULT '')")
+        if "filter" not in self.layer_fields(COVERAGE_TABLE):
+            conn.execute(f"ALTER TABLE {COVERAGE_TABLE} ADD COLUMN filter TEXT NOT NULL DEFAULT ''")
+        conn.execute(
+            f"CREATE INDEX IF NOT EXISTS idx_{COVERAGE_TABLE}_collection ON {COVERAGE_TABLE} (collection)")
+        conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {JOB_TABLE} (collection TEXT NOT NULL PRIMARY KEY, "
+            "min_x DOUBLE NOT NULL, min_y DOUBLE NOT NULL, max_x DOUBLE NOT NULL, max_y DOUBLE NOT NULL, "
+            "overwrite BOOLEAN NOT NULL, tile_size INTEGER NOT NULL, status TEXT NOT NULL, "
+            "started DATETIME NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ','now')), "
+            "mode TEXT NOT NULL DEFAULT 'append', properties TEXT, filter TEXT, area TEXT, extents TEXT)")
+        job_fields = self.layer_fields(JOB_TABLE)
+        if "mode" not in job_fields:
+            # Job tables of earlier versions have no mode; overwrite is derived from it
+            conn.execute(f"ALTER TABLE {JOB_TABLE} ADD COLUMN mode TEXT NOT NULL DEFAULT 'append'")
+            conn.execute(f"UPDATE {JOB_TABLE} SET mode = 'overwrite' WHERE overwrite")
+        if "properties" not in job_fields:
+            conn.execute(f"ALTER TABLE {JOB_TABLE} ADD COLUMN properties TEXT")
+        if "filter" not in job_fields:
+            conn.execute(f"ALTER TABLE {JOB_TABLE} ADD COLUMN filter TEXT")
+        if "area" not in job_fields:
+            conn.execute(f"ALTER TABLE {JOB_TABLE} ADD COLUMN area TEXT")
+        if "extents" not in job_fields:
+            conn.execute(f"ALTER TABLE {JOB_TABLE} ADD COLUMN extents TEXT")
+        conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {CHECKPOINT_TABLE} (collection TEXT NOT NULL, "
+            "min_x DOUBLE NOT NULL, min_y DOUBLE NOT NULL, max_x DOUBLE NOT NULL, max_y DOUBLE NOT NULL, "
+            "next_url TEXT NOT NULL, "
+            "updated DATETIME NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ','now')))")
+        conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {SYNC_TABLE} (collection TEXT NOT NULL PRIMARY KEY, "
+            "synced DATETIME NOT NULL, "
+            "min_x DOUBLE NOT NULL, min_y DOUBLE NOT NULL, max_x DOUBLE NOT NULL, max_y DOUBLE NOT NULL)")
+        if not conn.execute("SELECT 1 FROM gpkg_spatial_ref_sys WHERE srs_id = ?",
+                            (self.srs_id,)).fetchone():
+            conn.execute(
+                "INSERT INTO gpkg_spatial_ref_sys VALUES (?, ?, ?, ?, ?, ?)",
+                ("Amersfoort / RD New", RD_NEW_SRS_ID, "EPSG", RD_NEW_SRS_ID, RD_NEW_WKT, None))
+        conn.execute("COMMIT")
+
+    def drop_layer(self, name):
+        """Remove a feature table, its spatial index and its metadata"""
+        conn = self.conn
+        geom = self.geometry_column(name)
+        conn.execute(f"DROP TABLE IF EXISTS {quote(f'rtree_{name}_{geom}')}")
+        conn.execute(f"DROP TABLE IF EXISTS {quote(name)}")
+        for table in ("gpkg_geometry_columns", "gpkg_extensions", "gpkg_contents"):
+            conn.execute(f"DELETE FROM {table} WHERE lower(table_name) = lower(?)", (name,))
+        if self._table_exists("gpkg_ogr_contents"):
+            conn.execute("DELETE FROM gpkg_ogr_contents WHERE lower(table_name) = lower(?)", (name,))
+        self._layers.pop(name, None)
+        self._unindexed.discard(name)
+
+    def create_layer(self, name, geometry_type_name, fields):
+        """Create a feature table with a spatial index.
+
+        :param fields: list of (column name, column type) for the attributes.
+        """
+        conn = self.conn
+        geom = GEOMETRY_COLUMN
+        columns = ["fid INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL",
+                   f"{quote(geom)} {geometry_type_name}"]
+        columns += [f"{quote(column)} {column_type}" for column, column_type in fields]
+        conn.execute(f"CREATE TABLE {quote(name)} ({', '.join(columns)})")
+        conn.execute(
+            "INSERT INTO gpkg_contents (table_name, data_type, identifier, srs_id) "
+            "VALUES (?, 'features', ?, ?)", (name, name, self.srs_id))
+        conn.execute(
+            "INSERT INTO gpkg_geometry_columns VALUES (?, ?, ?, ?, 0, 0)",
+            (name, geom, geometry_type_name, self.srs_id))
+        self.create_spatial_index(name, geom)
+
+    def create_spatial_index(self, name, geom):
+        """Create the R-tree spatial index of a feature table and the triggers that maintain it"""
+        conn = self.conn
+        rtree = f"rtree_{name}_{geom}"
+        t, c, r = quote(name), quote(geom), quote(rtree)
+        conn.execute(f"CREATE VIRTUAL TABLE {r} USING rtree(id, minx, maxx, miny, maxy)")
+        conn.execute(
+            f"INSERT INTO {r} SELECT fid, ST_MinX({c}), ST_MaxX({c}), ST_MinY({c}), ST_MaxY({c}) "
+            f"FROM {t} WHERE {c} NOT NULL AND NOT ST_IsEmpty({c})")
+        self.create_spatial_index_triggers(name, geom)
+        conn.execute(
+            "INSERT OR REPLACE INTO gpkg_extensions VALUES (?, ?, 'gpkg_rtree_index', ?, 'write-only')",
+            (name, geom, RTREE_EXTENSION_DEFINITION))
+
+    def suspend_spatial_index(self, name):
+        """Drop the R-tree triggers of a layer, so rows are written without updating the index"""
+        rtree = f"rtree_{name}_{self.geometry_column(name)}"
+        for suffix in RTREE_TRIGGERS:
+            self.conn.execute(f"DROP TRIGGER IF EXISTS {quote(f'{rtree}_{suffix}')}")
+        self._unindexed.add(name)
+
+    def build_spatial_index(self, name):
+        """Build the R-tree index of a layer loaded without it and restore its triggers.
+
+        :returns: the seconds it took, or None when the index was up to date.
+        """
+        if name not in self._unindexed:
+            return None
+        seconds = self.rebuild_spatial_index(name)
+        self._unindexed.discard(name)
+        return seconds
+
+    def upgrade_spatial_index_triggers(self, name):
+        """Replace GeoPackage 1.2 spatial index triggers of an existing table by those of 1.4"""
+        geom = self.geometry_column(name)
+        rtree = f"rtree_{name}_{geom}"
+        if self.conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = ?",
+                             (f"{rtree}_update1",)).fetchone():
+            self.create_spatial_index_triggers(name, geom)
+
+    def ensure_layer(self, name, overwrite, geometry_type=None, features=()):
+        """Prepare a layer for writing, once per run.
+
+        In overwrite mode an existing layer is dropped first. A new layer
+        gets its geometry type and columns from the first features, or from
+        ``geometry_type`` (a GeoJSON type name) when there are none.
+        """
+        if name in self._layers:
+            return self._layers[name]
+        if self.conn.in_transaction:
+            return self._prepare_layer(name, overwrite, geometry_type, features)
+        self.conn.execute("BEGIN")
+        try:
+            layer = self._prepare_layer(name, overwrite, geometry_type, features)
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            self._layers.pop(name, None)
+            self._unindexed.discard(name)
+            raise
+        return layer
+
+    def _prepare_layer(self, name, overwrite, geometry_type, features):
+        if overwrite and self.layer_exists(name):
+            self.drop_layer(name)
+        created = not self.layer_exists(name)
+        if created:
+            for feature in features:
+                if feature.geometry_type:
+                    geometry_type = feature.geometry_type
+                    break
+            geometry_type_name = GEOMETRY_TYPE_NAMES.get(geometry_type, "GEOMETRY")
+            self.create_layer(name, geometry_type_name, self._new_fields(set(), features))
+        self.upgrade_spatial_index_triggers(name)
+        if self.bulk_load and created:
+            self.suspend_spatial_index(name)
+        elif self.spatial_index_suspended(name):
+            # The layer of a bulk load that was killed; its index is built this time
+            self.suspend_spatial_index(name)
+            self._restore_journal = True
+        duplicates_removed = self.ensure_id_index(name)
+        row = self.conn.execute(
+            "SELECT geometry_type_name FROM gpkg_geometry_columns WHERE lower(table_name) = lower(?)",
+            (name,)).fetchone()
+        layer_type = row[0].upper() if row else "GEOMETRY"
+        promote_to = next((multi for multi in MULTI_TYPES.values() if multi.upper() == layer_type), None)
+        self._layers[name] = {
+            "geom": self.geometry_column(name),
+            "fields": self.layer_fields(name),
+            "promote_to": promote_to,
+            "duplicates_removed": duplicates_removed,
+        }
+        return self._layers[name]
+
+    def ensure_id_index(self, name):
+        """Create the unique index on the ID attribute that the upserts rely on.
+
+        Layers written by earlier versions of the plugin may hold duplicate
+        IDs; all but the first feature with the same ID are removed once,
+        before the index is created. Returns the number of removed features.
+        """
+        conn = self.conn
+        index = f"uk_{name}_{ID_FIELD}"
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?",
+                        (index,)).fetchone():
+            return 0
+        if ID_FIELD.lower() not in self.layer_fields(name):
+            conn.execute(f"ALTER TABLE {quote(name)} ADD COLUMN {quote(ID_FIELD)} TEXT")
+        t, c = quote(name), quote(ID_FIELD)
+        pk = self.primary_key(name)
+        removed = conn.execute(
+            f"DELETE FROM {t} WHERE {c} IS NOT NULL AND {quote(pk)} NOT IN "
+            f"(SELECT min({quote(pk)}) FROM {t} WHERE {c} IS NOT NULL GROUP BY {c})").rowcount
+        conn.execute(f"CREATE UNIQUE INDEX {quote(index)} ON {t} ({c})")
+        return removed
+
+    def _new_fields(self, existing, features):
+        """Columns for the properties of prepared features that are not yet in existing"""
+        fields = {}
+        if ID_FIELD.lower() not in existing:
+            fields[ID_FIELD.lower()] = (ID_FIELD, "TEXT")
+        for feature in features:
+            for lower, (key, value) in feature.values.items():
+                if lower in existing or value is None:
+                    continue
+                if lower == ID_FIELD.lower() or lower not in fields:
+                    fields[lower] = (key, field_type(value))
+        return list(fields.values())
+
+    def feature_values(self, feature):
+        """Values of a prepared feature, with the feature id stored in the ID attribute"""
+        values = feature.values
+        if ID_FIELD.lower() not in values:
+            values = dict(values)
+            values[ID_FIELD.lower()] = (ID_FIELD, feature.id)
+        return values
+
+    def write_features(self, name, features, overwrite=False, tile=None, next_url=None, delete_ids=(),
+                       filter=None):
+        """Upsert a batch of GeoJSON features or PreparedFeature objects into a layer in one transaction.
+
+        A feature with an ID that is already in the layer replaces the
+        stored attributes and geometry; other features are inserted.
+        When ``tile`` is given, its download state is saved in the same
+        transaction, see save_tile_state(). Features with an ID in
+        ``delete_ids`` are removed from the layer in the same transaction.
+
+        :returns: the number of features written.
+        """
+        if not features and tile is None and not delete_ids:
+            return 0
+        conn = self.conn
+        prepared = name in self._layers
+        conn.execute("BEGIN")
+        try:
+            if features:
+                self._upsert_features(name, features, overwrite)
+                # The layer is replaced now, a resumed job must not replace it again
+                self.set_collection_status(name, "started", "pending")
+            if delete_ids:
+                self.delete_features(name, delete_ids)
+            if tile is not None:
+                self.save_tile_state(name, tile, next_url, filter)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            if not prepared:
+                self._layers.pop(name, None)
+                self._unindexed.discard(name)
+            raise
+        return len(features)
+
+    def _upsert_features(self, name, features, overwrite):
+        conn = self.conn
+        features = prepare_features(features, self.srs_id)
+        layer = self.ensure_layer(name, overwrite, features=features)
+        for column, column_type in self._new_fields(layer["fields"], features):
+            conn.execute(f"ALTER TABLE {quote(name)} ADD COLUMN {quote(column)} {column_type}")
+            layer["fields"].add(column.lower())
+        promote_to = layer["promote_to"]
+        rows = {}
+        for feature in features:
+            properties = self.feature_values(feature)
+            columns = tuple(properties)
+            blob = feature.blob
+            if promote_to and feature.geometry_type != promote_to:
+                blob = promote_blob(blob, self.srs_id, promote_to)
+            values = [blob]
+            values.extend(value for _, value in properties.values())
+            rows.setdefault(columns, []).append(values)
+        # Features with the same set of properties share one INSERT statement
+        for columns, values in rows.items():
+            columns = (layer["geom"],) + columns
+            names = ", ".join(quote(column) for column in columns)
+            placeholders = ", ".join("?" * len(columns))
+            updates = ", ".join(f"{quote(column)} = excluded.{quote(column)}" for column in columns)
+            conn.executemany(
+                f"INSERT INTO {quote(name)} ({names}) VALUES ({placeholders}) "
+                f"ON CONFLICT ({quote(ID_FIELD)}) DO UPDATE SET {updates}", values)
+        conn.execute(
+            "UPDATE gpkg_contents SET last_change = strftime('%Y-%m-%dT%H:%M:%fZ', 'now') "
+            "WHERE lower(table_name) = lower(?)", (name,))
+
+    def covered_extents(self, collection, extent=None, since=None, filter=None):
+        """Extents (xmin, ymin, xmax, ymax) of a collection downloaded before.
+
+        :param extent: only return the covered extents that intersect this extent.
+        :param since: only return the extents downloaded at or after this UTC time.
+        :param filter: the filter expression of the download; extents downloaded
+            with another filter do not count, those downloaded without one do.
+        """
+        sql = f"SELECT min_x, min_y, max_x, max_y FROM {COVERAGE_TABLE} WHERE collection = ? AND filter IN ('', ?)"
+        params = (collection, filter or "")
+        if extent:
+            sql += " AND min_x < ? AND max_x > ? AND min_y < ? AND max_y > ?"
+            params += (extent[2], extent[0], extent[3], extent[1])
+        if since:
+            sql += " AND downloaded >= ?"
+            params += (since,)
+        return self.conn.execute(sql, params).fetchall()
+
+    def add_coverage(self, collection, extent, filter=None):
+        """Record that all features of a collection within extent, or those passing filter, have been downloaded"""
+        self.conn.execute(
+            f"INSERT INTO {COVERAGE_TABLE} (collection, min_x, min_y, max_x, max_y, filter) VALUES (?, ?, ?, ?, ?, ?)",
+            (collection,) + tuple(extent) + (filter or "",))
+
+    def clear_coverage(self, collection):
+        """Forget the downloaded extents of a collection"""
+        self.conn.execute(f"DELETE FROM {COVERAGE_TABLE} WHERE collection = ?", (collection,))
+
+    def start_job(self, collections, extent, mode, tile_size, properties=None, filters=None, area=None,
+                  extents=None):
+        """Store the parameters of a new download job, replacing the state of the previous job.
+
+        :param mode: 'append', 'overwrite' or 'update'.
+        :param properties: the selected property names per collection; all when not given.
+        :param filters: the filter expression per collection; none when not given.
+        :param area: the area of interest as JSON, see AreaOfInterest.to_json().
+        :param extents: the extents of a queue of areas; extent is then their bounding box.
+        """
+        properties = properties or {}
+        filters = filters or {}
+        conn = self.conn
+        conn.execute("BEGIN")
+        conn.execute(f"DELETE FROM {JOB_TABLE}")
+        conn.execute(f"DELETE FROM {CHECKPOINT_TABLE}")
+        conn.executemany(
+            f"INSERT INTO {JOB_TABLE} (collection, min_x, min_y, max_x, max_y, overwrite, tile_size, status, mode, "
+            "properties, filter, area, extents) VALUES (?, ?, ?, ?, ?, ?, ?, 'pending', ?, ?, ?, ?, ?)",
+            [(collection,) + tuple(extent) + (mode == "overwrite", tile_size, mode,
+                                              json.dumps(properties[collection]) if collection in properties else None,
+                                              filters.get(collection), area,
+                                              json.dumps([list(item) for item in extents]) if extents else None)
+             for collection in collections])
+        conn.execute("COMMIT")
+
+    def job(self):
+        """The last download job, see load_job()"""
+        return _read_job(self.conn)
+
+    def set_collection_status(self, collection, status, previous=None):
+        """Mark a collection of the job 'started' or 'complete', optionally only when its status is previous"""
+        sql = f"UPDATE {JOB_TABLE} SET status = ? WHERE collection = ?"
+        params = (status, collection)
+        if previous:
+            sql += " AND status = ?"
+            params += (previous,)
+        self.conn.execute(sql, params)
+
+    def checkpoints(self, collection):
+        """Tiles of a collection that are partly downloaded, with the URL of the next page to fetch"""
+        rows = self.conn.execute(
+            f"SELECT min_x, min_y, max_x, max_y, next_url FROM {CHECKPOINT_TABLE} WHERE collection = ?",
+            (collection,)).fetchall()
+        return [(row[:4], row[4]) for row in rows]
+
+    def save_tile_state(self, collection, tile, next_url=None, filter=None):
+        """Save how far a tile of a collection is downloaded.
+
+        With ``next_url`` the tile is partly downloaded and can be resumed
+        from that page; without it the tile is complete and its extent is
+        recorded as covered, for the filter expression it was downloaded with.
+        """
+        conn = self.conn
+        conn.execute(
+            f"DELETE FROM {CHECKPOINT_TABLE} WHERE collection = ? "
+            "AND min_x = ? AND min_y = ? AND max_x = ? AND max_y = ?", (collection,) + tuple(tile))
+        if next_url:
+            conn.execute(
+                f"INSERT INTO {CHECKPOINT_TABLE} (collection, min_x, min_y, max_x, max_y, next_url) "
+                "VALUES (?, ?, ?, ?, ?, ?)", (collection,) + tuple(tile) + (next_url,))
+        else:
+            self.add_coverage(collection, tile, filter)
+
+    def sync_time(self, collection):
+        """Time (ISO 8601 UTC) and extent of the last full or update download of a layer, or None"""
+        row = self.conn.execute(
+            f"SELECT synced, min_x, min_y, max_x, max_y FROM {SYNC_TABLE} WHERE collection = ?",
+            (collection,)).fetchone()
+        return (row[0], row[1:]) if row else None
+
+    def set_sync_time(self, collection, synced, extent, keep_existing=False):
+        """Record the time a layer was brought up to date within extent.
+
+        :param keep_existing: do not replace an earlier sync time, for downloads
+            that only added features and did not update the rest of the layer.
+        """
+        verb = "INSERT OR IGNORE" if keep_existing else "INSERT OR REPLACE"
+        self.conn.execute(
+            f"{verb} INTO {SYNC_TABLE} (collection, synced, min_x, min_y, max_x, max_y) VALUES (?, ?, ?, ?, ?, ?)",
+            (collection, synced) + tuple(extent))
+
+    def delete_features(self, name, ids):
+        """Remove the features with the given IDs from a layer; returns the number removed"""
+        if not ids or not self.layer_exists(name):
+            return 0
+        self.ensure_id_index(name)
+        return self.conn.executemany(
+            f"DELETE FROM {quote(name)} WHERE {quote(ID_FIELD)} = ?", [(item,) for item in ids]).rowcount
+
+    def export_layer(self, name):
+        """Write a completed layer to the output; the GeoPackage is the output itself, so returns None"""
+        return None
+
+    def update_extent(self, name):
+        """Store the extent of a layer, taken from its spatial index, in gpkg_contents"""
+        geom = self.geometry_column(name)
+        rtree = f"rtree_{name}_{geom}"
+        if not self._table_exists(rtree):
+            return
+        extent = self.conn.execute(
+            f"SELECT min(minx), min(miny), max(maxx), max(maxy) FROM {quote(rtree)}").fetchone()
+        if extent[0] is not None:
+            self.conn.execute(
+                "UPDATE gpkg_contents SET min_x = ?, min_y = ?, max_x = ?, max_y = ? "
+                "WHERE lower(table_name) = lower(?)", extent + (name,))
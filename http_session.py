@@ -0,0 +1,351 @@
+"""
+Shared HTTP client with pooled keep-alive connections and gzip transfer
+"""
+
+import http.client
+import io
+import ssl
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+import zlib
+
+# Idle connections kept open per host
+MAX_IDLE_CONNECTIONS = 16
+MAX_REDIRECTS = 5
+# Bytes read from the socket at a time when a response body is streamed, and the
+# largest decoded chunk, as a small compressed chunk can hold much more data
+STREAM_CHUNK_SIZE = 64 * 1024
+# Bytes of an error response body kept in the HTTPError
+MAX_ERROR_BODY = 16 * 1024
+USER_AGENT = "Top10NL-Downloader QGIS plugin"
+
+
+class HttpResponse:
+    """Status, headers and decoded body of a response, with the number of bytes on the wire"""
+
+    def __init__(self, url, status, reason, headers, body, wire_bytes):
+        self.url = url
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.body = body
+        self.wire_bytes = wire_bytes
+
+
+def body_decoder(encoding):
+    """Decompressor for a streamed body with a Content-Encoding, or None when it is not compressed"""
+    encoding = (encoding or "").strip().lower()
+    if encoding in ("gzip", "x-gzip"):
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    if encoding == "deflate":
+        return DeflateDecoder()
+    return None
+
+
+class DeflateDecoder:
+    """Streaming deflate decoder that accepts bodies with and without the zlib header"""
+
+    def __init__(self):
+        self._decoder = None
+        self._head = b""
+
+    @property
+    def unconsumed_tail(self):
+        return self._decoder.unconsumed_tail if self._decoder is not None else b""
+
+    def decompress(self, data, max_length=0):
+        if self._decoder is None:
+            # The zlib header needs two bytes to be recognised
+            self._head += data
+            if len(self._head) < 2:
+                return b""
+            data, self._head = self._head, b""
+            wbits = zlib.MAX_WBITS if (data[0] & 0x0F) == 8 and (data[0] * 256 + data[1]) % 31 == 0 \
+                else -zlib.MAX_WBITS
+            self._decoder = zlib.decompressobj(wbits)
+        return self._decoder.decompress(data, max_length)
+
+    def flush(self):
+        if self._decoder is None:
+            return zlib.decompress(self._head, -zlib.MAX_WBITS) if self._head else b""
+        return self._decoder.flush()
+
+
+class StreamingResponse:
+    """Response of which the body is read and decoded chunk by chunk.
+
+    Iterate over chunks() to read the body; close() returns the connection
+    to the session when the body was read completely and closes it
+    otherwise. The wire and decoded byte counts grow while reading.
+    """
+
+    def __init__(self, session, url, response, release):
+        self.session = session
+        self.url = url
+        self.status = response.status
+        self.reason = response.reason
+        self.headers = response.headers
+        self.wire_bytes = 0
+        self.decoded_bytes = 0
+        self._response = response
+        self._release = release
+        self._complete = False
+        self._closed = False
+
+    def chunks(self, size=STREAM_CHUNK_SIZE):
+        """Yield the decoded body in chunks of at most ``size`` bytes as they arrive"""
+        decoder = body_decoder(self.headers.get("Content-Encoding"))
+        while True:
+            data = self._response.read(size)
+            if not data:
+                break
+            self.wire_bytes += len(data)
+            if decoder is None:
+                self.decoded_bytes += len(data)
+                yield data
+                continue
+            while data:
+                decoded = decoder.decompress(data, size)
+                data = decoder.unconsumed_tail
+                if decoded:
+                    self.decoded_bytes += len(decoded)
+                    yield decoded
+        if decoder is not None:
+            data = decoder.flush()
+            if data:
+                self.decoded_bytes += len(data)
+                yield data
+        self._complete = True
+
+    def close(self):
+        """Finish the response; only a completely read body leaves the connection reusable"""
+        if self._closed:
+            return
+        self._closed = True
+        with self.session._lock:
+            self.session.wire_bytes += self.wire_bytes
+            self.session.decoded_bytes += self.decoded_bytes
+        self._release(self._complete)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def qgis_proxies():
+    """Proxies and excluded URL prefixes of the network settings of QGIS.
+
+    Returns None outside QGIS, and when QGIS uses the system proxy, no
+    proxy or a SOCKS proxy, which urllib cannot use; the proxies of the
+    environment then apply.
+    """
+    try:
+        from qgis.core import QgsApplication, QgsNetworkAccessManager
+        from qgis.PyQt.QtNetwork import QNetworkProxy
+    except ImportError:
+        return None
+    if QgsApplication.instance() is None:
+        return None
+    manager = QgsNetworkAccessManager.instance()
+    proxy = manager.fallbackProxy()
+    if proxy.type() not in (QNetworkProxy.ProxyType.HttpProxy, QNetworkProxy.ProxyType.HttpCachingProxy) \
+            or not proxy.hostName():
+        return None
+    credentials = ""
+    if proxy.user():
+        credentials = urllib.parse.quote(proxy.user(), safe="")
+        if proxy.password():
+            credentials += ":" + urllib.parse.quote(proxy.password(), safe="")
+        credentials += "@"
+    proxy_url = f"http://{credentials}{proxy.hostName()}:{proxy.port()}"
+    excluded = list(manager.excludeList())
+    if hasattr(manager, "noProxyList"):
+        excluded += list(manager.noProxyList())
+    return {"http": proxy_url, "https": proxy_url}, [prefix.strip() for prefix in excluded if prefix.strip()]
+
+
+class HttpSession:
+    """HTTP GET client that reuses connections across requests and threads.
+
+    Idle connections are kept per host and handed to the next request, so
+    the pages, tiles and collections of a download share a few TCP and TLS
+    connections instead of opening one per request. Responses are requested
+    gzip compressed and decoded transparently. Requests through a proxy go
+    through urllib instead: the HTTP proxy of the network settings of QGIS
+    when running in QGIS, else a proxy configured in the environment.
+    Status codes other than 2xx raise urllib.error.HTTPError, as urlopen does.
+    """
+
+    def __init__(self, max_idle=MAX_IDLE_CONNECTIONS):
+        self.max_idle = max_idle
+        self._idle = {}
+        self._lock = threading.Lock()
+        self._ssl_context = ssl.create_default_context()
+        qgis = qgis_proxies()
+        if qgis is not None:
+            self._proxies, self._proxy_excluded = qgis
+        else:
+            self._proxies, self._proxy_excluded = urllib.request.getproxies(), None
+        self._opener = urllib.request.build_opener(urllib.request.ProxyHandler(self._proxies))
+        # Statistics of all requests of the session
+        self.requests = 0
+        self.connections_opened = 0
+        self.wire_bytes = 0
+        self.decoded_bytes = 0
+
+    def get(self, url, headers=None, timeout=60):
+        """GET a URL and return an HttpResponse with the decoded body"""
+        with self.open(url, headers, timeout) as response:
+            body = b"".join(response.chunks())
+        return HttpResponse(response.url, response.status, response.reason, response.headers, body,
+                            response.wire_bytes)
+
+    def open(self, url, headers=None, timeout=60):
+        """GET a URL and return a StreamingResponse, to read a large body without holding it in memory.
+
+        Redirects are followed; status codes other than 2xx raise HTTPError.
+        The caller must close the response.
+        """
+        headers = dict(headers or {})
+        headers.setdefault("Accept-Encoding", "gzip, deflate")
+        headers.setdefault("User-Agent", USER_AGENT)
+        for _ in range(MAX_REDIRECTS + 1):
+            if self._use_proxy(url):
+                response = self._open_urllib(url, headers, timeout)
+            else:
+                response = self._open_pooled(url, headers, timeout)
+            with self._lock:
+                self.requests += 1
+            if 200 <= response.status < 300:
+                return response
+            # Error and redirect bodies are small; read them so the connection can be reused,
+            # and keep the start of an error body, which may tell what was wrong with the request
+            body = b""
+            for chunk in response.chunks():
+                if len(body) < MAX_ERROR_BODY:
+                    body += chunk[:MAX_ERROR_BODY - len(body)]
+            response.close()
+            if response.status in (301, 302, 303, 307, 308) and response.headers.get("Location"):
+                url = urllib.parse.urljoin(url, response.headers["Location"])
+                continue
+            raise urllib.error.HTTPError(url, response.status, response.reason, response.headers, io.BytesIO(body))
+        raise urllib.error.HTTPError(url, response.status, "Too many redirects", response.headers, None)
+
+    def close(self):
+        """Close all idle connections"""
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for connection in connections:
+                connection.close()
+
+    def _use_proxy(self, url):
+        scheme, netloc = urllib.parse.urlsplit(url)[:2]
+        if scheme not in self._proxies:
+            return False
+        if self._proxy_excluded is not None:
+            # QGIS skips the proxy for URLs that start with an excluded prefix
+            return not any(url.startswith(prefix) for prefix in self._proxy_excluded)
+        return not urllib.request.proxy_bypass(netloc.split(":")[0])
+
+    def _connection(self, key, timeout):
+        """An idle connection to the host, or a new one; returns (connection, reused)"""
+        with self._lock:
+            connections = self._idle.get(key)
+            if connections:
+                connection = connections.pop()
+                connection.timeout = timeout
+                if connection.sock is not None:
+                    connection.sock.settimeout(timeout)
+                return connection, True
+            self.connections_opened += 1
+        scheme, host, port = key
+        if scheme == "https":
+            return http.client.HTTPSConnection(host, port, timeout=timeout, context=self._ssl_context), False
+        return http.client.HTTPConnection(host, port, timeout=timeout), False
+
+    def _keep(self, key, connection):
+        with self._lock:
+            connections = self._idle.setdefault(key, [])
+            if len(connections) < self.max_idle:
+                connections.append(connection)
+                return
+        connection.close()
+
+    def _open_pooled(self, url, headers, timeout):
+        parts = urllib.parse.urlsplit(url)
+        if parts.scheme not in ("http", "https"):
+            raise ValueError(f"Unsupported URL scheme: {url}")
+        key = (parts.scheme, parts.hostname, parts.port or (443 if parts.scheme == "https" else 80))
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+        while True:
+            connection, reused = self._connection(key, timeout)
+            try:
+                connection.request("GET", path, headers=headers)
+                response = connection.getresponse()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                connection.close()
+                # The server closed an idle connection; GET is safe to send again on a new one
+                if reused:
+                    continue
+                raise
+            except Exception:
+                connection.close()
+                raise
+
+            def release(complete, connection=connection, response=response):
+                if complete and not response.will_close:
+                    self._keep(key, connection)
+                else:
+                    connection.close()
+
+            return StreamingResponse(self, url, response, release)
+
+    def _open_urllib(self, url, headers, timeout):
+        request = urllib.request.Request(url, headers=headers)
+        try:
+            response = self._opener.open(request, timeout=timeout)
+        except urllib.error.HTTPError as e:
+            response = e
+        return StreamingResponse(self, url, _UrllibResponse(response), lambda complete: response.close())
+
+
+class _UrllibResponse:
+    """Status, reason, headers and read() of a urllib response or HTTPError"""
+
+    def __init__(self, response):
+        self._response = response
+        self.status = getattr(response, "status", None) or response.code
+        self.reason = response.reason
+        self.headers = response.headers
+
+    def read(self, size):
+        return self._response.read(size) if self._response.fp is not None else b""
+
+
+_default_session = None
+_default_lock = threading.Lock()
+
+
+def default_session():
+    """The HTTP session shared by the whole plugin"""
+    global _default_session
+    with _default_lock:
+        if _default_session is None:
+            _default_session = HttpSession()
+        return _default_session
+
+
+def close_default_session():
+    """Close the idle connections of the shared session, e.g. when the plugin is unloaded"""
+    global _default_session
+    with _default_lock:
+        session, _default_session = _default_session, None
+    if session is not None:
+        session.close()
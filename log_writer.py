@@ -0,0 +1,97 @@
+"""
+Buffered log writer for the download task
+"""
+
+import queue
+import threading
+import time
+
+# Seconds between flushes of the log file and between updates of the UI
+FLUSH_INTERVAL = 0.5
+UI_INTERVAL = 0.2
+
+
+class BufferedLogWriter:
+    """Write log lines to a file and to the UI from one background thread.
+
+    Lines are queued by any thread. The background thread keeps the log file
+    open, writes the lines in batches and flushes them every FLUSH_INTERVAL
+    seconds. Lines for the UI are collected and passed to ``on_lines`` at
+    most every UI_INTERVAL seconds, so the dialog is not repainted per line.
+    """
+
+    def __init__(self, path, on_lines=None, on_error=None,
+                 flush_interval=FLUSH_INTERVAL, ui_interval=UI_INTERVAL):
+        self.path = path
+        self.on_lines = on_lines
+        self.on_error = on_error
+        self.flush_interval = flush_interval
+        self.ui_interval = ui_interval
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="Top10NL log writer", daemon=True)
+        self._thread.start()
+
+    def log(self, message):
+        """Queue a log line for the log file and the UI"""
+        self._queue.put((message + "\n", message))
+
+    def write(self, text):
+        """Queue text for the log file only"""
+        self._queue.put((text, None))
+
+    def close(self):
+        """Write and show all queued lines and stop the background thread"""
+        self._queue.put(None)
+        self._thread.join()
+
+    def _open(self):
+        try:
+            return open(self.path, 'a', encoding='utf-8')
+        except OSError as e:
+            if self.on_error:
+                self.on_error(f"Error writing to log: {str(e)}")
+            return None
+
+    def _run(self):
+        log_file = self._open()
+        ui_lines = []
+        last_flush = last_ui = time.monotonic()
+        stopped = False
+        while not stopped:
+            try:
+                items = [self._queue.get(timeout=min(self.flush_interval, self.ui_interval))]
+            except queue.Empty:
+                items = []
+            # Take everything that is queued, to write it in one go
+            while True:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            text = []
+            for item in items:
+                if item is None:
+                    stopped = True
+                    continue
+                text.append(item[0])
+                if item[1] is not None:
+                    ui_lines.append(item[1])
+
+            now = time.monotonic()
+            if log_file is not None:
+                try:
+                    if text:
+                        log_file.write("".join(text))
+                    if stopped or now - last_flush >= self.flush_interval:
+                        log_file.flush()
+                        last_flush = now
+                except OSError as e:
+                    if self.on_error:
+                        self.on_error(f"Error writing to log: {str(e)}")
+            if ui_lines and self.on_lines and (stopped or now - last_ui >= self.ui_interval):
+                self.on_lines(ui_lines)
+                ui_lines = []
+                last_ui = now
+        if log_file is not None:
+            log_file.close()
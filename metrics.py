@@ -0,0 +1,32 @@
+"""
+Machine-readable metrics of download runs
+"""
+
+import json
+import math
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers, or None when it is empty"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def latency_summary(latencies):
+    """Count and percentiles in milliseconds of HTTP request latencies in seconds"""
+    summary = {"requests": len(latencies)}
+    for pct in (50, 90, 99):
+        value = percentile(latencies, pct)
+        summary[f"p{pct}_ms"] = round(value * 1000, 1) if value is not None else None
+    summary["max_ms"] = round(max(latencies) * 1000, 1) if latencies else None
+    return summary
+
+
+def append_metrics(path, records):
+    """Append records to a JSON lines file, one JSON object per line"""
+    with open(path, 'a', encoding='utf-8') as metrics_file:
+        for record in records:
+            metrics_file.write(json.dumps(record) + "\n")
@@ -0,0 +1,181 @@
+"""
+Streaming reader for the PDOK OGC API Features service
+"""
+
+import http.client
+import json
+import urllib.parse
+
+from .geojson_stream import FeatureStreamParser
+from .request_scheduler import RequestScheduler
+
+TOP10NL_API_URL = "https://api.pdok.nl/brt/top10nl/ogc/v1"
+RD_NEW_CRS_URI = "http://www.opengis.net/def/crs/EPSG/0/28992"
+# Largest page size the PDOK service accepts
+DEFAULT_PAGE_SIZE = 1000
+
+
+def next_link(data):
+    """Return the href of the 'next' link of an items response, or None on the last page"""
+    for link in data.get("links", []):
+        if link.get("rel") == "next" and link.get("href"):
+            return link["href"]
+    return None
+
+
+class OapifPager:
+    """Iterate over the items of an OGC API Features collection page by page.
+
+    Follows the ``next`` links of the service. Each page is parsed while it
+    arrives and its features are yielded one by one, so only a few features
+    are held in memory at a time, however large the pages are.
+    Coordinates are requested and returned in RD New (EPSG:28992).
+    Requests go through a RequestScheduler, which retries failed requests;
+    pass a shared scheduler to limit the parallel requests of many pagers.
+    ``datetime_filter`` is passed as the ``datetime`` parameter, to only get
+    the features of a time interval, ``properties`` as the ``properties``
+    parameter, to only get those attributes, and the ``filter_params`` query
+    parameters to only get the features that pass a filter.
+    """
+
+    def __init__(self, collection, bbox, base_url=TOP10NL_API_URL,
+                 page_size=DEFAULT_PAGE_SIZE, crs=RD_NEW_CRS_URI, timeout=60, scheduler=None,
+                 datetime_filter=None, properties=None, filter_params=None):
+        self.collection = collection
+        self.bbox = bbox
+        self.base_url = base_url.rstrip("/")
+        self.page_size = page_size
+        self.crs = crs
+        self.timeout = timeout
+        self.datetime_filter = datetime_filter
+        self.properties = properties
+        self.filter_params = filter_params
+        self.scheduler = scheduler or RequestScheduler()
+        # URL of the page being read, and of the page after it once it was read completely
+        self.page_url = None
+        self.next_url = None
+        self.page_complete = False
+        # Members of the page being read, other than its features, as far as they have been parsed
+        self.page_members = {}
+        # Statistics of the pages fetched so far
+        self.page_count = 0
+        self.feature_count = 0
+        # Decoded bytes, and bytes on the wire before decompression
+        self.bytes_received = 0
+        self.wire_bytes = 0
+        # Seconds from sending each request until the service answered: the headers of a streamed page,
+        # the whole body of a count request
+        self.latencies = []
+
+    @property
+    def resume_url(self):
+        """URL to continue from: the next page after a complete page, else the page being read again.
+
+        Features of a page that is read again are written again, which the
+        upserts by ID make harmless.
+        """
+        return self.next_url if self.page_complete else self.page_url
+
+    def announces_next_page(self):
+        """True when the members of the page parsed so far show that there is a next page.
+
+        Services that send the links or numberMatched before the features
+        tell this before the features of a page are read.
+        """
+        matched = self.page_members.get("numberMatched")
+        return bool(next_link(self.page_members)) or (
+            isinstance(matched, (int, float)) and matched > self.page_size)
+
+    def first_page_url(self, limit=None):
+        """URL of the first page of items within the bounding box"""
+        params = {
+            "f": "json",
+            "limit": limit or self.page_size,
+            "bbox": ",".join(str(coord) for coord in self.bbox),
+            "bbox-crs": self.crs,
+            "crs": self.crs,
+        }
+        if self.datetime_filter:
+            params["datetime"] = self.datetime_filter
+        if self.properties:
+            params["properties"] = ",".join(self.properties)
+        if self.filter_params:
+            params.update(self.filter_params)
+        collection = urllib.parse.quote(self.collection)
+        return f"{self.base_url}/collections/{collection}/items?{urllib.parse.urlencode(params)}"
+
+    def fetch(self, url):
+        """Fetch one page and return the parsed GeoJSON response"""
+        response, latency = self.scheduler.fetch(url, {"Accept": "application/geo+json"}, self.timeout)
+        self.latencies.append(latency)
+        self.bytes_received += len(response.body)
+        self.wire_bytes += response.wire_bytes
+        return json.loads(response.body)
+
+    def count_matched(self):
+        """Number of items within the bounding box, or None when the service does not report it"""
+        data = self.fetch(self.first_page_url(limit=1))
+        matched = data.get("numberMatched")
+        return int(matched) if isinstance(matched, (int, float)) else None
+
+    def pages(self, start_url=None):
+        """Yield the pages of the collection, each an iterator over its features as they arrive.
+
+        ``next_url`` is known once a page has been read completely; the
+        pages stop when a page is left before its end.
+
+        :param start_url: URL of the page to start from, to resume an earlier download.
+        """
+        url = start_url or self.first_page_url()
+        while url:
+            self.page_url = url
+            self.next_url = None
+            self.page_complete = False
+            yield self.page_features(url)
+            if not self.page_complete:
+                return
+            url = self.next_url
+
+    def page_features(self, url):
+        """Yield the features of one page while its response is parsed.
+
+        When the connection fails while the body is read, the page is
+        requested again and the features that were yielded already are
+        skipped, as the same URL returns the same page.
+        """
+        received = 0
+        attempt = 0
+        while True:
+            response = self.scheduler.open(url, {"Accept": "application/geo+json"}, self.timeout)
+            parser = FeatureStreamParser()
+            self.page_members = parser.members
+            index = 0
+            try:
+                for chunk in response.chunks():
+                    for feature in parser.feed(chunk):
+                        index += 1
+                        if index > received:
+                            received += 1
+                            yield feature
+                for feature in parser.close():
+                    index += 1
+                    if index > received:
+                        received += 1
+                        yield feature
+            except (OSError, http.client.HTTPException) as e:
+                attempt += 1
+                if attempt > self.scheduler.retries:
+                    raise
+                response.close()
+                self.scheduler.retry_wait(attempt, f"{str(e) or type(e).__name__} after {received} features")
+                continue
+            finally:
+                response.close()
+                self.bytes_received += response.decoded_bytes
+                self.wire_bytes += response.wire_bytes
+            break
+        self.latencies.append(response.latency)
+        self.page_count += 1
+        self.feature_count += received
+        self.next_url = next_link(parser.members) if received else None
+        self.page_complete = True
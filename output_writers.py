@@ -0,0 +1,189 @@
+"""
+Output formats of a download: GeoPackage, FlatGeobuf and GeoParquet
+"""
+
+import os
+import time
+
+try:
+    from osgeo import ogr
+except ImportError:
+    # FlatGeobuf and GeoParquet are written with GDAL/OGR, which ships with QGIS
+    ogr = None
+
+from .gpkg_writer import GeoPackageWriter, quote
+
+# Output formats by file extension: name, OGR driver and layer creation options
+OUTPUT_FORMATS = {
+    ".gpkg": ("GeoPackage", None, []),
+    ".fgb": ("FlatGeobuf", "FlatGeobuf", ["SPATIAL_INDEX=YES"]),
+    ".parquet": ("GeoParquet", "Parquet", ["ROW_GROUP_SIZE={row_group_size}"]),
+}
+# Features per row group of a GeoParquet file; row groups are filtered on their bounding box when read
+PARQUET_ROW_GROUP_SIZE = 65536
+# Bits per axis of the Hilbert curve that orders GeoParquet rows
+HILBERT_ORDER = 16
+
+
+def output_extension(output_file):
+    """Extension of the output format of a file name, '.gpkg' when it is not a known format"""
+    extension = os.path.splitext(output_file)[1].lower()
+    return extension if extension in OUTPUT_FORMATS else ".gpkg"
+
+
+def state_file(output_file):
+    """GeoPackage that holds the features and download state of an output.
+
+    A GeoPackage output holds them itself. Other formats are written from a
+    working GeoPackage next to the output, which keeps the features for the
+    append and update modes and the tiles for Resume.
+    """
+    if output_extension(output_file) == ".gpkg":
+        return output_file
+    return os.path.splitext(output_file)[0] + ".work.gpkg"
+
+
+def layer_file(output_file, collection):
+    """File with the layer of one collection; FlatGeobuf and GeoParquet hold one layer per file"""
+    base, extension = os.path.splitext(output_file)
+    return f"{base}_{collection}{extension}"
+
+
+def layer_source(output_file, collection):
+    """OGR data source of the layer of a collection, to add it to a project"""
+    if output_extension(output_file) == ".gpkg":
+        return f"{output_file}|layername={collection}"
+    return layer_file(output_file, collection)
+
+
+def check_output_format(output_file):
+    """Raise ValueError when the output format cannot be written here"""
+    name, driver, _ = OUTPUT_FORMATS[output_extension(output_file)]
+    if driver is None:
+        return
+    if ogr is None:
+        raise ValueError(f"Writing {name} needs GDAL/OGR (osgeo.ogr)")
+    if ogr.GetDriverByName(driver) is None:
+        raise ValueError(f"The GDAL of this installation has no {driver} driver to write {name}")
+
+
+def hilbert_index(x, y, order=HILBERT_ORDER):
+    """Distance along a Hilbert curve of the cell (x, y) of a 2**order by 2**order grid"""
+    index = 0
+    s = 1 << (order - 1)
+    while s:
+        rx = 1 if x & s else 0
+        ry = 1 if y & s else 0
+        index += s * s * ((3 * rx) ^ ry)
+        # Rotate the quadrant, so the curve stays continuous
+        if not ry:
+            if rx:
+                x = s - 1 - x
+                y = s - 1 - y
+            x, y = y, x
+        s >>= 1
+    return index
+
+
+def spatial_order(centres, order=HILBERT_ORDER):
+    """Keys of (key, x, y) centres sorted along a Hilbert curve; keys without a centre come last"""
+    located = [(key, x, y) for key, x, y in centres if x is not None]
+    if not located:
+        return [key for key, _, _ in centres]
+    xmin = min(x for _, x, _ in located)
+    ymin = min(y for _, _, y in located)
+    span = max(max(x for _, x, _ in located) - xmin, max(y for _, _, y in located) - ymin) or 1
+    cells = (1 << order) - 1
+    located.sort(key=lambda item: hilbert_index(int((item[1] - xmin) / span * cells),
+                                                int((item[2] - ymin) / span * cells), order))
+    return [key for key, _, _ in located] + [key for key, x, _ in centres if x is None]
+
+
+class ExportingWriter(GeoPackageWriter):
+    """Write a download to FlatGeobuf or GeoParquet files, one per collection.
+
+    Features are streamed into the working GeoPackage of the output, see
+    state_file(), so upserts by ID, coverage and Resume work as for a
+    GeoPackage output. When a collection is complete, export_layer()
+    writes its layer to a new file that replaces the previous one:
+    FlatGeobuf with its packed Hilbert R-tree index, GeoParquet with its
+    rows ordered along a Hilbert curve, so each row group covers a
+    compact area.
+    """
+
+    def __init__(self, output_file, bulk_load=False):
+        check_output_format(output_file)
+        super().__init__(state_file(output_file), bulk_load=bulk_load)
+        self.output_file = output_file
+        self.extension = output_extension(output_file)
+
+    def _spatial_order(self, name):
+        """Primary keys of a layer ordered along a Hilbert curve through their bounding box centres"""
+        t = quote(name)
+        pk = quote(self.primary_key(name))
+        rtree = f"rtree_{name}_{self.geometry_column(name)}"
+        if not self._table_exists(rtree):
+            return None
+        rows = self.conn.execute(
+            f"SELECT {t}.{pk}, (r.minx + r.maxx) / 2, (r.miny + r.maxy) / 2 FROM {t} "
+            f"LEFT JOIN {quote(rtree)} AS r ON r.id = {t}.{pk}").fetchall()
+        return spatial_order(rows)
+
+    def export_layer(self, name):
+        """Write the layer of a collection to its output file; returns (path, features, seconds)"""
+        start = time.perf_counter()
+        format_name, driver_name, options = OUTPUT_FORMATS[self.extension]
+        options = [option.format(row_group_size=PARQUET_ROW_GROUP_SIZE) for option in options]
+        path = layer_file(self.output_file, name)
+        temporary = path + ".tmp" + self.extension
+        order = self._spatial_order(name) if self.extension == ".parquet" else None
+        driver = ogr.GetDriverByName(driver_name)
+        source = None
+        target = None
+        complete = False
+        try:
+            source = ogr.Open(self.path)
+            if source is None:
+                raise RuntimeError(f"Cannot open {self.path} to export {name}")
+            source_layer = source.GetLayerByName(name)
+            if os.path.exists(temporary):
+                driver.DeleteDataSource(temporary)
+            target = driver.CreateDataSource(temporary)
+            if target is None:
+                raise RuntimeError(f"Cannot create {format_name} file {temporary}")
+            target_layer = target.CreateLayer(name, source_layer.GetSpatialRef(), source_layer.GetGeomType(),
+                                              options)
+            if target_layer is None:
+                raise RuntimeError(f"Cannot create layer {name} in {temporary}")
+            source_defn = source_layer.GetLayerDefn()
+            for index in range(source_defn.GetFieldCount()):
+                target_layer.CreateField(source_defn.GetFieldDefn(index))
+            target_defn = target_layer.GetLayerDefn()
+            count = 0
+            features = (source_layer.GetFeature(fid) for fid in order) if order is not None else source_layer
+            for feature in features:
+                copy = ogr.Feature(target_defn)
+                copy.SetFrom(feature)
+                if target_layer.CreateFeature(copy) != 0:
+                    raise RuntimeError(f"Cannot write feature {feature.GetFID()} of {name} to {temporary}")
+                count += 1
+            # Closing the file writes the FlatGeobuf index and the Parquet footer
+            target_layer = None
+            target = None
+            os.replace(temporary, path)
+            complete = True
+        finally:
+            # Features and layers keep their dataset open; release them all, so the files are closed
+            feature = copy = features = source_layer = target_layer = None
+            target = None
+            source = None
+            if not complete and os.path.exists(temporary):
+                os.remove(temporary)
+        return path, count, time.perf_counter() - start
+
+
+def create_writer(output_file, bulk_load=False):
+    """Writer for the output format of a file name, see OUTPUT_FORMATS"""
+    if output_extension(output_file) == ".gpkg":
+        return GeoPackageWriter(output_file, bulk_load=bulk_load)
+    return ExportingWriter(output_file, bulk_load)
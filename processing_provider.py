@@ -0,0 +1,251 @@
+"""
+Top10NL Downloader - Processing provider, for the toolbox, the graphical modeler and qgis_process
+"""
+
+import json
+import os
+
+from qgis.PyQt.QtGui import QIcon
+from qgis.core import (QgsCoordinateReferenceSystem, QgsCoordinateTransform, QgsGeometry, QgsProcessing,
+                       QgsProcessingAlgorithm, QgsProcessingException, QgsProcessingOutputNumber,
+                       QgsProcessingParameterBoolean, QgsProcessingParameterEnum, QgsProcessingParameterExtent,
+                       QgsProcessingParameterFeatureSource, QgsProcessingParameterFile,
+                       QgsProcessingParameterFileDestination, QgsProcessingParameterNumber,
+                       QgsProcessingParameterString, QgsProcessingProvider)
+
+# Only modules without the engine are imported here, since the provider is registered when QGIS starts
+from .download_options import DEFAULT_COLLECTIONS, DEFAULT_PARALLEL_DOWNLOADS, MAX_PARALLEL_DOWNLOADS, MODES
+from .tiling import DEFAULT_TILE_SIZE, MIN_TILE_SIZE
+
+ICON_PATH = os.path.join(os.path.dirname(__file__), 'icon.png')
+
+
+class Top10NLDownloadAlgorithm(QgsProcessingAlgorithm):
+    """Download Top10NL collections within an extent into a GeoPackage, FlatGeobuf or GeoParquet files"""
+
+    COLLECTIONS = "COLLECTIONS"
+    EXTENT = "EXTENT"
+    EXTENTS = "EXTENTS"
+    AREA = "AREA"
+    AREA_FILTER = "AREA_FILTER"
+    MODE = "MODE"
+    RESUME = "RESUME"
+    CONCURRENCY = "CONCURRENCY"
+    TILE_SIZE = "TILE_SIZE"
+    MAINTAIN = "MAINTAIN"
+    OUTPUT = "OUTPUT"
+
+    # Options of the AREA_FILTER parameter and the filter of the AreaOfInterest, as in the dialog
+    AREA_FILTER_OPTIONS = (("In tiles intersecting the polygon", "tiles"), ("Intersecting the polygon", "intersects"),
+                           ("Clipped to the polygon", "clip"))
+
+    def createInstance(self):
+        return Top10NLDownloadAlgorithm()
+
+    def name(self):
+        return "download"
+
+    def displayName(self):
+        return "Download Top10NL"
+
+    def shortHelpString(self):
+        return (
+            "Downloads Top10NL collections from the PDOK OGC API Features service into a GeoPackage, "
+            "one layer per collection.\n\n"
+            "Collections: comma separated names, such as gebouw_vlak,wegdeel_vlak.\n"
+            "Extents layer: download the extent of each of its features as a queue in one run, "
+            "instead of the extent; overlapping parts are downloaded once.\n"
+            "Area of interest: download within the union of the polygons of a layer instead of the extent; "
+            "use Selected features only to download within some of them. Features: keep all features of "
+            "the tiles that intersect the polygons, only the features that intersect them, or clip the "
+            "features to them, which needs GDAL/OGR.\n"
+            "Mode: Append adds to existing layers and skips areas downloaded before, Overwrite replaces "
+            "the layers, Update only downloads the features changed since the last download.\n"
+            "Resume continues the unfinished download in the GeoPackage with its own parameters; "
+            "collections, extent and mode are then ignored.\n"
+            "Maintain runs Maintain GeoPackage after the download.\n"
+            "Output file: a GeoPackage, or FlatGeobuf or GeoParquet files, one per collection, named after "
+            "the output file and the collection. These are written when a collection is complete, from a "
+            "working GeoPackage next to them (name.work.gpkg) that keeps the features for Append, Update "
+            "and Resume.\n"
+            "The log and metrics are written next to the output file."
+        )
+
+    def icon(self):
+        return QIcon(ICON_PATH)
+
+    def initAlgorithm(self, config=None):
+        self.addParameter(QgsProcessingParameterString(
+            self.COLLECTIONS, "Collections", defaultValue=",".join(DEFAULT_COLLECTIONS)))
+        self.addParameter(QgsProcessingParameterExtent(self.EXTENT, "Extent", optional=True))
+        self.addParameter(QgsProcessingParameterFeatureSource(
+            self.EXTENTS, "Extents layer (one extent per feature)", [QgsProcessing.SourceType.TypeVectorAnyGeometry],
+            optional=True))
+        self.addParameter(QgsProcessingParameterFeatureSource(
+            self.AREA, "Area of interest (polygon layer)", [QgsProcessing.SourceType.TypeVectorPolygon],
+            optional=True))
+        self.addParameter(QgsProcessingParameterEnum(
+            self.AREA_FILTER, "Features within the area of interest",
+            options=[label for label, _ in self.AREA_FILTER_OPTIONS], defaultValue=0))
+        self.addParameter(QgsProcessingParameterEnum(
+            self.MODE, "Mode", options=[mode.capitalize() for mode in MODES], defaultValue=0))
+        self.addParameter(QgsProcessingParameterBoolean(
+            self.RESUME, "Resume the unfinished download in the GeoPackage", defaultValue=False))
+        self.addParameter(QgsProcessingParameterNumber(
+            self.CONCURRENCY, "Parallel requests", QgsProcessingParameterNumber.Type.Integer,
+            defaultValue=DEFAULT_PARALLEL_DOWNLOADS, minValue=1, maxValue=MAX_PARALLEL_DOWNLOADS))
+        self.addParameter(QgsProcessingParameterNumber(
+            self.TILE_SIZE, "Tile size (m)", QgsProcessingParameterNumber.Type.Integer,
+            defaultValue=DEFAULT_TILE_SIZE, minValue=MIN_TILE_SIZE))
+        self.addParameter(QgsProcessingParameterBoolean(
+            self.MAINTAIN, "Maintain the GeoPackage after the download", defaultValue=False))
+        self.addParameter(QgsProcessingParameterFileDestination(
+            self.OUTPUT, "Output file", "GeoPackage (*.gpkg);;FlatGeobuf, one file per collection (*.fgb);;"
+                                        "GeoParquet, one file per collection (*.parquet)"))
+
+    def processAlgorithm(self, parameters, context, feedback):
+        from .batch_download import parse_collections, run_download
+
+        resume = self.parameterAsBoolean(parameters, self.RESUME, context)
+        output_file = self.parameterAsFileOutput(parameters, self.OUTPUT, context)
+        rd_new = QgsCoordinateReferenceSystem("EPSG:28992")
+        extent = self.parameterAsExtent(parameters, self.EXTENT, context, rd_new)
+        extents = None
+        source = self.parameterAsSource(parameters, self.EXTENTS, context)
+        if source is not None:
+            transform = QgsCoordinateTransform(source.sourceCrs(), rd_new, context.transformContext())
+            extents = []
+            for feature in source.getFeatures():
+                if feature.hasGeometry():
+                    box = transform.transformBoundingBox(feature.geometry().boundingBox())
+                    extents.append([box.xMinimum(), box.yMinimum(), box.xMaximum(), box.yMaximum()])
+            if not extents and not resume:
+                raise QgsProcessingException("The extents layer has no features with a geometry.")
+        area = None
+        area_source = self.parameterAsSource(parameters, self.AREA, context)
+        if area_source is not None and not resume:
+            if extents is not None:
+                raise QgsProcessingException("An area of interest cannot be combined with an extents layer.")
+            area_filter = self.AREA_FILTER_OPTIONS[self.parameterAsEnum(parameters, self.AREA_FILTER, context)][1]
+            area = self.area_of_interest(area_source, area_filter, rd_new, context)
+        elif extents is None and not resume and (extent.isEmpty() or extent.width() <= 0 or extent.height() <= 0):
+            raise QgsProcessingException("Please specify a valid extent for the download.")
+        try:
+            collections = parse_collections(self.parameterAsString(parameters, self.COLLECTIONS, context))
+        except ValueError as e:
+            raise QgsProcessingException(str(e))
+
+        def progress(value, status=None):
+            feedback.setProgress(value)
+            if status:
+                feedback.setProgressText(status)
+
+        try:
+            run_download(
+                collections,
+                [extent.xMinimum(), extent.yMinimum(), extent.xMaximum(), extent.yMaximum()],
+                output_file,
+                MODES[self.parameterAsEnum(parameters, self.MODE, context)],
+                self.parameterAsInt(parameters, self.CONCURRENCY, context),
+                tile_size=self.parameterAsInt(parameters, self.TILE_SIZE, context),
+                resume=resume,
+                log=feedback.pushInfo,
+                progress=progress,
+                is_canceled=feedback.isCanceled,
+                extents=extents,
+                area=area,
+                maintain=self.parameterAsBoolean(parameters, self.MAINTAIN, context)
+            )
+        except Exception as e:
+            raise QgsProcessingException(f"Error during download: {str(e)}")
+        return {self.OUTPUT: output_file}
+
+    def area_of_interest(self, source, area_filter, rd_new, context):
+        """AreaOfInterest of the union of the polygons of a feature source, in RD New"""
+        from .area_of_interest import AreaOfInterest
+
+        geometries = [feature.geometry() for feature in source.getFeatures() if feature.hasGeometry()]
+        if not geometries:
+            raise QgsProcessingException("The area of interest has no features with a geometry.")
+        geometry = QgsGeometry.unaryUnion(geometries)
+        geometry.transform(QgsCoordinateTransform(source.sourceCrs(), rd_new, context.transformContext()))
+        if geometry.isEmpty():
+            raise QgsProcessingException("The area of interest is empty.")
+        try:
+            # Millimetre precision, as the area drawn or selected in the dialog
+            return AreaOfInterest(json.loads(geometry.asJson(3)), area_filter)
+        except ValueError as e:
+            raise QgsProcessingException(str(e))
+
+
+class Top10NLMaintenanceAlgorithm(QgsProcessingAlgorithm):
+    """Check, compact and analyze a GeoPackage, see maintain_geopackage()"""
+
+    INPUT = "INPUT"
+    VACUUM = "VACUUM"
+    CHECK_ONLY = "CHECK_ONLY"
+    RECLAIMED = "RECLAIMED"
+
+    # Options of the VACUUM parameter and the vacuum argument of maintain_geopackage()
+    VACUUM_OPTIONS = (("When needed", None), ("Always", True), ("Never", False))
+
+    def createInstance(self):
+        return Top10NLMaintenanceAlgorithm()
+
+    def name(self):
+        return "maintain"
+
+    def displayName(self):
+        return "Maintain GeoPackage"
+
+    def shortHelpString(self):
+        return (
+            "Reports the size, free space and fragmentation of a GeoPackage, rebuilds spatial indexes "
+            "that do not match their layer, compacts the file with VACUUM and updates its statistics "
+            "with ANALYZE.\n\n"
+            "Compact: When needed compacts the file when at least 10% of it is free or half of its pages "
+            "are fragmented.\n"
+            "Only report: check the GeoPackage without changing it.\n"
+            "Close layers that are being edited in the GeoPackage first; otherwise VACUUM is skipped."
+        )
+
+    def icon(self):
+        return QIcon(ICON_PATH)
+
+    def initAlgorithm(self, config=None):
+        self.addParameter(QgsProcessingParameterFile(
+            self.INPUT, "GeoPackage", extension="gpkg"))
+        self.addParameter(QgsProcessingParameterEnum(
+            self.VACUUM, "Compact", options=[label for label, _ in self.VACUUM_OPTIONS], defaultValue=0))
+        self.addParameter(QgsProcessingParameterBoolean(
+            self.CHECK_ONLY, "Only report", defaultValue=False))
+        self.addOutput(QgsProcessingOutputNumber(self.RECLAIMED, "Bytes reclaimed"))
+
+    def processAlgorithm(self, parameters, context, feedback):
+        from .gpkg_maintenance import maintain_geopackage
+
+        path = self.parameterAsFile(parameters, self.INPUT, context)
+        vacuum = self.VACUUM_OPTIONS[self.parameterAsEnum(parameters, self.VACUUM, context)][1]
+        try:
+            report = maintain_geopackage(path, feedback.pushInfo, vacuum,
+                                         self.parameterAsBoolean(parameters, self.CHECK_ONLY, context))
+        except Exception as e:
+            raise QgsProcessingException(f"Error during maintenance: {str(e)}")
+        return {self.RECLAIMED: report["reclaimed"]}
+
+
+class Top10NLProcessingProvider(QgsProcessingProvider):
+    """Processing provider with the Top10NL download algorithm"""
+
+    def id(self):
+        return "top10nl"
+
+    def name(self):
+        return "Top10NL Downloader"
+
+    def icon(self):
+        return QIcon(ICON_PATH)
+
+    def loadAlgorithms(self):
+        self.addAlgorithm(Top10NLDownloadAlgorithm())
+        self.addAlgorithm(Top10NLMaintenanceAlgorithm())
@@ -0,0 +1,103 @@
+"""
+Feature-count based progress, throughput and ETA of a download
+"""
+
+import collections
+import datetime
+import threading
+import time
+
+# Seconds of recent samples the throughput is computed over, so a stall shows as 0 features/s
+RATE_WINDOW = 15.0
+
+
+class DownloadProgress:
+    """Track the features and bytes received against the expected number of features.
+
+    ``expected`` is the sum of the ``numberMatched`` counts of the collections.
+    When a count is unknown the progress falls back to the fraction of tiles
+    downloaded. All methods may be called from any thread.
+    """
+
+    def __init__(self, expected=None, window=RATE_WINDOW):
+        self.expected = expected
+        self.window = window
+        self.features = 0
+        self.bytes = 0
+        self.tiles_done = 0
+        self.tiles_total = 0
+        self.start = time.monotonic()
+        self.last_received = self.start
+        self._samples = collections.deque([(self.start, 0, 0)])
+        self._lock = threading.Lock()
+
+    def add(self, features, nbytes):
+        """Record a page of features and its size in bytes"""
+        with self._lock:
+            now = time.monotonic()
+            self.features += features
+            self.bytes += nbytes
+            if features:
+                self.last_received = now
+            self._samples.append((now, self.features, self.bytes))
+            while len(self._samples) > 2 and now - self._samples[1][0] > self.window:
+                self._samples.popleft()
+
+    def set_tiles(self, done, total):
+        """Record the number of tiles downloaded and known so far"""
+        with self._lock:
+            self.tiles_done = done
+            self.tiles_total = total
+
+    def rates(self):
+        """Features per second and bytes per second over the last ``window`` seconds"""
+        with self._lock:
+            now = time.monotonic()
+            first_time, first_features, first_bytes = self._samples[0]
+            elapsed = now - first_time
+            if elapsed <= 0:
+                return 0.0, 0.0
+            return (self.features - first_features) / elapsed, (self.bytes - first_bytes) / elapsed
+
+    def fraction(self):
+        """Fraction of the download done, between 0 and 1"""
+        if self.expected:
+            # Features on tile borders are received more than once, so stay below 1 until finished
+            return min(self.features / self.expected, 0.99)
+        if self.tiles_total:
+            return self.tiles_done / self.tiles_total
+        return 0.0
+
+    def percent(self):
+        return int(self.fraction() * 100)
+
+    def eta(self):
+        """Estimated time remaining as a timedelta, or None when it cannot be estimated"""
+        fraction = self.fraction()
+        if self.expected:
+            features_per_second = self.rates()[0]
+            if features_per_second <= 0:
+                return None
+            remaining = max(self.expected - self.features, 0) / features_per_second
+        elif fraction > 0:
+            elapsed = time.monotonic() - self.start
+            remaining = elapsed * (1 - fraction) / fraction
+        else:
+            return None
+        return datetime.timedelta(seconds=round(remaining))
+
+    def status(self):
+        """One-line summary: features, throughput and ETA"""
+        features_per_second, bytes_per_second = self.rates()
+        if self.expected:
+            text = f"{self.features:,} of ~{self.expected:,} features"
+        else:
+            text = f"{self.features:,} features, {self.tiles_done} of {self.tiles_total} tiles"
+        text += f" - {features_per_second:,.0f} features/s, {bytes_per_second / 1e6:.2f} MB/s"
+        stalled = time.monotonic() - self.last_received
+        if stalled > self.window:
+            text += f" - no data for {stalled:.0f} s"
+        eta = self.eta()
+        if eta is not None:
+            text += f" - ETA {eta}"
+        return text
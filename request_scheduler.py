@@ -0,0 +1,304 @@
+"""
+Retries, backoff and adaptive concurrency for requests to the PDOK service
+"""
+
+import datetime
+import email.utils
+import http.client
+import random
+import threading
+import time
+import urllib.error
+
+from .http_session import default_session
+from .metrics import percentile
+
+# Responses that mean the service is overloaded; their Retry-After header is honoured
+THROTTLE_STATUS = {429, 503}
+# Other responses that are worth another try
+RETRY_STATUS = {500, 502, 504}
+MAX_RETRIES = 5
+# Seconds before the first retry; doubled on every next retry, up to BACKOFF_MAX
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+# Longest Retry-After that is waited for
+RETRY_AFTER_MAX = 300.0
+# Number of requests after which the number of parallel requests is reconsidered
+ADJUST_WINDOW = 20
+
+
+class RequestCanceled(Exception):
+    """Raised when the download is canceled while a request waits for its turn"""
+
+
+def retry_after(headers):
+    """Seconds to wait according to a Retry-After header (seconds or HTTP date), or None"""
+    value = headers.get("Retry-After") if headers else None
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            date = email.utils.parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        seconds = (date - datetime.datetime.now(datetime.timezone.utc)).total_seconds()
+    return min(max(seconds, 0.0), RETRY_AFTER_MAX)
+
+
+def backoff_delay(attempt, base=BACKOFF_BASE, maximum=BACKOFF_MAX):
+    """Exponential backoff with jitter for the given retry (1, 2, ...)"""
+    delay = min(base * 2 ** (attempt - 1), maximum)
+    return random.uniform(delay / 2, delay)
+
+
+class AdaptiveLimiter:
+    """Limit the number of requests in flight and adapt the limit to the service.
+
+    The limit grows by one while requests succeed without the latency
+    rising, and shrinks by one on errors or rising latency. When the
+    service throttles (HTTP 429/503) it is halved, and all requests wait
+    until the Retry-After time has passed. Requests that were already in
+    flight when the limit was lowered do not lower it again.
+    """
+
+    def __init__(self, maximum, minimum=1, window=ADJUST_WINDOW):
+        self.maximum = max(minimum, maximum)
+        self.minimum = minimum
+        self.limit = self.maximum
+        self.window = window
+        self.active = 0
+        # Incremented on every decrease of the limit
+        self.epoch = 0
+        self.paused_until = 0.0
+        # Lowest median latency seen, the reference for a rising latency
+        self.baseline = None
+        self._latencies = []
+        self._errors = 0
+        self._condition = threading.Condition()
+
+    def acquire(self, is_canceled=None):
+        """Wait until a request may be sent; returns the epoch to pass to release()"""
+        with self._condition:
+            while True:
+                if is_canceled is not None and is_canceled():
+                    raise RequestCanceled()
+                pause = self.paused_until - time.monotonic()
+                if pause <= 0 and self.active < self.limit:
+                    self.active += 1
+                    return self.epoch
+                self._condition.wait(timeout=min(max(pause, 0.1), 1.0))
+
+    def release(self, epoch, outcome, latency=None):
+        """Report the outcome of a request: 'ok', 'throttled', 'error' or 'aborted'.
+
+        An aborted request, of which the response was not read completely on
+        purpose, frees its place without counting for the limit.
+
+        :returns: (old limit, new limit, reason) when the limit changed, else None.
+        """
+        with self._condition:
+            self.active -= 1
+            old = self.limit
+            reason = None
+            if outcome == "throttled":
+                if epoch == self.epoch:
+                    self.limit = max(self.minimum, self.limit // 2)
+                    reason = "throttled by the service"
+                    self._reset_window()
+            elif outcome != "aborted" and epoch == self.epoch:
+                if outcome == "ok":
+                    self._latencies.append(latency)
+                else:
+                    self._errors += 1
+                if len(self._latencies) + self._errors >= self.window:
+                    reason = self._adjust()
+            if self.limit < old:
+                self.epoch += 1
+            self._condition.notify_all()
+            if self.limit != old:
+                return old, self.limit, reason
+            return None
+
+    def pause(self, seconds):
+        """Hold all requests for the given number of seconds"""
+        with self._condition:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def _adjust(self):
+        error_rate = self._errors / (len(self._latencies) + self._errors)
+        median = percentile(self._latencies, 50)
+        self._reset_window()
+        if median is not None and (self.baseline is None or median < self.baseline):
+            self.baseline = median
+        if error_rate > 0.1:
+            self.limit = max(self.minimum, self.limit - 1)
+            return f"{error_rate:.0%} of the requests failed"
+        if median is not None and median > 2 * self.baseline:
+            self.limit = max(self.minimum, self.limit - 1)
+            return f"latency rose to {median * 1000:.0f} ms"
+        if error_rate == 0 and median is not None and median <= 1.5 * self.baseline:
+            self.limit = min(self.maximum, self.limit + 1)
+            return "requests succeed"
+        return None
+
+    def _reset_window(self):
+        self._latencies = []
+        self._errors = 0
+
+
+class ScheduledResponse:
+    """A streamed response that keeps its place among the parallel requests until it is closed.
+
+    ``latency`` runs until the response headers arrived: the body is read
+    as fast as the caller handles its features, so the time until it was
+    read includes local work, such as writing the GeoPackage, that says
+    nothing about the service. The outcome is reported to the limiter
+    when the response is closed.
+    """
+
+    def __init__(self, scheduler, response, epoch, latency):
+        self.response = response
+        self.url = response.url
+        self.headers = response.headers
+        self.latency = latency
+        self._scheduler = scheduler
+        self._epoch = epoch
+        self._outcome = "aborted"
+
+    @property
+    def wire_bytes(self):
+        return self.response.wire_bytes
+
+    @property
+    def decoded_bytes(self):
+        return self.response.decoded_bytes
+
+    def chunks(self):
+        """Yield the decoded body in chunks of bytes as they arrive"""
+        try:
+            yield from self.response.chunks()
+        except Exception:
+            self._outcome = "error"
+            raise
+        self._outcome = "ok"
+
+    def close(self):
+        if self._scheduler is None:
+            return
+        scheduler, self._scheduler = self._scheduler, None
+        try:
+            self.response.close()
+        finally:
+            scheduler._release(self._epoch, self._outcome, self.latency)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class RequestScheduler:
+    """Send HTTP GET requests with retries, backoff and an adaptive number of parallel requests.
+
+    Failed requests are retried up to ``retries`` times with exponential
+    backoff. On HTTP 429 and 503 the Retry-After header of the service is
+    honoured. One scheduler is shared by all worker threads of a download,
+    so its AdaptiveLimiter sees the latency and errors of all requests.
+    Requests are sent through ``session``, by default the shared HttpSession.
+    """
+
+    def __init__(self, max_parallel=4, retries=MAX_RETRIES, log=None, is_canceled=None, session=None):
+        self.limiter = AdaptiveLimiter(max_parallel)
+        self.session = session or default_session()
+        self.retries = retries
+        self._log = log
+        self._is_canceled = is_canceled
+        self.retry_count = 0
+        self._lock = threading.Lock()
+
+    def log(self, message):
+        if self._log is not None:
+            self._log(message)
+
+    def is_canceled(self):
+        return self._is_canceled is not None and self._is_canceled()
+
+    def fetch(self, url, headers=None, timeout=60):
+        """GET a URL and return the HttpResponse and the latency of the successful attempt"""
+        response, epoch, start = self._send(lambda: self.session.get(url, headers, timeout))
+        latency = time.perf_counter() - start
+        self._release(epoch, "ok", latency)
+        return response, latency
+
+    def open(self, url, headers=None, timeout=60):
+        """GET a URL and return a ScheduledResponse, to stream its body.
+
+        The request is retried as by fetch() until the service answers.
+        Errors while the body is read are raised from its chunks(), for
+        the caller to retry with retry_wait(). The caller must close the
+        response.
+        """
+        response, epoch, start = self._send(lambda: self.session.open(url, headers, timeout))
+        return ScheduledResponse(self, response, epoch, time.perf_counter() - start)
+
+    def retry_wait(self, attempt, error, delay=None, throttled=False):
+        """Count, log and wait for retry number ``attempt`` after ``error``"""
+        with self._lock:
+            self.retry_count += 1
+        if delay is None:
+            delay = backoff_delay(attempt)
+        if throttled:
+            self.limiter.pause(delay)
+        self.log(f"  Retry {attempt}/{self.retries} in {delay:.1f} s: {error}")
+        self._sleep(delay)
+
+    def _send(self, send):
+        """Call send() with retries; returns its result, the limiter epoch and the start time of the last attempt.
+
+        The place of the request in the limiter is still held on return.
+        """
+        attempt = 0
+        while True:
+            epoch = self.limiter.acquire(self._is_canceled)
+            start = time.perf_counter()
+            delay = None
+            try:
+                response = send()
+            except urllib.error.HTTPError as e:
+                throttled = e.code in THROTTLE_STATUS
+                self._release(epoch, "throttled" if throttled else "error")
+                if not (throttled or e.code in RETRY_STATUS) or attempt >= self.retries:
+                    raise
+                if throttled:
+                    delay = retry_after(e.headers)
+                error = f"HTTP {e.code} {e.reason}"
+            except (OSError, http.client.HTTPException) as e:
+                self._release(epoch, "error")
+                if attempt >= self.retries:
+                    raise
+                throttled = False
+                error = str(e) or type(e).__name__
+            else:
+                return response, epoch, start
+
+            attempt += 1
+            self.retry_wait(attempt, error, delay, throttled)
+
+    def _release(self, epoch, outcome, latency=None):
+        change = self.limiter.release(epoch, outcome, latency)
+        if change:
+            old, new, reason = change
+            self.log(f"Parallel requests: {old} -> {new} ({reason})")
+
+    def _sleep(self, seconds):
+        """Sleep, but stop early when the download is canceled"""
+        end = time.monotonic() + seconds
+        while not self.is_canceled():
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                return
+            time.sleep(min(remaining, 0.5))
+        raise RequestCanceled()
@@ -0,0 +1,28 @@
+"""
+Import the plugin modules without QGIS, as the benchmarks do, and serve the mock OGC API Features service
+"""
+
+import os
+import sys
+import types
+
+import pytest
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(PLUGIN_DIR, "benchmarks"))
+
+# The plugin __init__ needs QGIS; the modules tested here do not
+package = types.ModuleType("top10nl_downloader")
+package.__path__ = [PLUGIN_DIR]
+sys.modules.setdefault("top10nl_downloader", package)
+
+from mock_oapif_server import MockOapifServer  # noqa: E402
+
+
+@pytest.fixture
+def server():
+    """Mock service with one small collection"""
+    mock = MockOapifServer(collections=["gebouw_vlak"], spacing=200)
+    mock.start()
+    yield mock
+    mock.stop()
@@ -0,0 +1,36 @@
+from top10nl_downloader.area_of_interest import AreaOfInterest
+
+# Square of 100 m with a hole of 20 m in its middle
+AREA = {"type": "Polygon", "coordinates": [
+    [[0, 0], [100, 0], [100, 100], [0, 100], [0, 0]],
+    [[40, 40], [40, 60], [60, 60], [60, 40], [40, 40]],
+]}
+
+
+def square(x, y, size):
+    return {"type": "Polygon", "coordinates": [[[x, y], [x + size, y], [x + size, y + size], [x, y + size], [x, y]]]}
+
+
+def test_intersects():
+    area = AreaOfInterest(AREA, "intersects")
+    assert area.intersects({"type": "Point", "coordinates": [10, 10]})
+    assert not area.intersects({"type": "Point", "coordinates": [50, 50]})
+    assert not area.intersects({"type": "Point", "coordinates": [150, 50]})
+    assert area.intersects({"type": "LineString", "coordinates": [[-10, 50], [10, 50]]})
+    assert not area.intersects({"type": "LineString", "coordinates": [[-10, 50], [-10, 150]]})
+    assert not area.intersects(square(45, 45, 10))
+    assert area.intersects(square(35, 45, 10))
+    assert area.intersects(square(-50, -50, 200))
+    assert not area.intersects(None)
+
+
+def test_multipolygon_part_within_a_tile_or_feature():
+    islands = {"type": "MultiPolygon", "coordinates": [
+        square(0, 0, 1000)["coordinates"],
+        square(4500, 200, 100)["coordinates"],
+        square(7000, 0, 1000)["coordinates"],
+    ]}
+    area = AreaOfInterest(islands, "intersects")
+    assert area.intersects_extent((4000, 0, 6000, 1000))
+    assert area.intersects(square(4000, 0, 1000))
+    assert not area.intersects(square(2000, 0, 1000))
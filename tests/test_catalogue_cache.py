@@ -0,0 +1,63 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from top10nl_downloader.catalogue_cache import fetch_catalogue, load_catalogue, save_catalogue
+
+ETAG = '"v2"'
+
+
+class CollectionsHandler(BaseHTTPRequestHandler):
+    """/collections with an ETag, answering HTTP 304 when it matches"""
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.headers.get("If-None-Match") == ETAG:
+            self.send_response(304)
+            self.send_header("ETag", ETAG)
+            self.end_headers()
+            return
+        body = json.dumps({"collections": [{"id": "wegdeel_vlak"}, {"id": "gebouw_vlak"}]}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("ETag", ETAG)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def base_url():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), CollectionsHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_changed_catalogue_keeps_the_properties_of_offered_collections(base_url):
+    cached = {"features": ["gebouw_vlak", "spoorbaandeel_lijn"], "etag": '"v1"', "fetched": "2025-01-01T00:00:00",
+              "properties": {"gebouw_vlak": ["typegebouw"], "spoorbaandeel_lijn": ["typespoorbaan"]}}
+    catalogue, modified = fetch_catalogue(base_url, cached)
+    assert modified
+    assert catalogue["features"] == ["gebouw_vlak", "wegdeel_vlak"]
+    assert catalogue["etag"] == ETAG
+    assert catalogue["properties"] == {"gebouw_vlak": ["typegebouw"]}
+
+
+def test_unchanged_catalogue_is_saved_without_flags(base_url, tmp_path):
+    cached = {"features": ["gebouw_vlak"], "etag": ETAG, "fetched": "2025-01-01T00:00:00",
+              "properties": {"gebouw_vlak": ["typegebouw"]}}
+    catalogue, modified = fetch_catalogue(base_url, cached)
+    assert not modified
+    assert catalogue["fetched"] != cached["fetched"]
+    path = str(tmp_path / "collections.json")
+    save_catalogue(path, catalogue)
+    saved = load_catalogue(path)
+    assert set(saved) == {"features", "etag", "fetched", "properties"}
+    assert saved["properties"] == {"gebouw_vlak": ["typegebouw"]}
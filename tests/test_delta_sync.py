@@ -0,0 +1,37 @@
+from top10nl_downloader.delta_sync import changed_since, is_ended, parse_time
+
+
+def feature(**properties):
+    return {"type": "Feature", "properties": properties}
+
+
+def test_is_ended():
+    assert not is_ended(feature(mutatiedatum="2024-01-01"))
+    assert not is_ended(feature(eindRegistratie=None, objectEindTijd=""))
+    assert is_ended(feature(eindRegistratie="2024-05-01T10:00:00Z"))
+    assert is_ended(feature(object_eind_tijd="2024-05-01"))
+    # An end time that cannot be parsed still ends the version
+    assert is_ended(feature(objecteindtijd="onbekend"))
+    # An end in the future has not happened yet
+    assert not is_ended(feature(objecteindtijd="2999-01-01"))
+    assert not is_ended({"type": "Feature", "properties": None})
+
+
+def test_changed_since():
+    since = "2024-03-01T12:00:00Z"
+    assert changed_since(feature(tijdstipRegistratie="2024-03-01T12:00:01Z"), since)
+    assert not changed_since(feature(tijdstipRegistratie="2024-03-01T12:00:00Z"), since)
+    assert not changed_since(feature(mutatiedatum="2024-02-29"), since)
+    # The registration time comes first, the mutation date is only a fallback
+    assert not changed_since(feature(tijdstipRegistratie="2024-01-01T00:00:00Z", mutatiedatum="2024-06-01"), since)
+    assert changed_since(feature(tijdstipRegistratie="", mutatiedatum="2024-06-01"), since)
+    assert changed_since(feature(tijdstipRegistratie="2024-03-01T14:00:00+01:00"), since)
+    # Without lifecycle attributes a feature cannot be skipped
+    assert changed_since(feature(typeobject="synthetisch"), since)
+    assert changed_since(feature(mutatiedatum="gisteren"), since)
+
+
+def test_parse_time():
+    assert parse_time("2024-03-01T13:00:00+01:00") == parse_time("2024-03-01T12:00:00Z")
+    assert parse_time("") is None
+    assert parse_time(20240301) is None
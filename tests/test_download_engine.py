@@ -0,0 +1,64 @@
+import sqlite3
+
+from top10nl_downloader.download_engine import Top10NLDownloadEngine
+
+EXTENT = [154000, 462000, 155000, 463000]
+
+
+def download(server, output_file, properties=None, **options):
+    messages = []
+    engine = Top10NLDownloadEngine(["gebouw_vlak"], EXTENT, output_file, False, max_workers=1, page_size=100,
+                                   base_url=server.url, log=messages.append, properties=properties, **options)
+    assert engine.run()
+    assert not engine.failed_features
+    return messages, engine
+
+
+def columns(output_file):
+    with sqlite3.connect(output_file) as conn:
+        return {row[1] for row in conn.execute('PRAGMA table_info("gebouw_vlak")')}
+
+
+def test_append_with_more_properties_downloads_again(server, tmp_path):
+    output_file = str(tmp_path / "top10nl.gpkg")
+    download(server, output_file, {"gebouw_vlak": ["typeobject"]})
+    assert "hoogte" not in columns(output_file)
+
+    messages, _ = download(server, output_file)
+    assert not any("Already downloaded" in message for message in messages)
+    assert {"typeobject", "hoogte", "aantal"} <= columns(output_file)
+
+
+def test_append_with_the_same_properties_skips_covered_tiles(server, tmp_path):
+    output_file = str(tmp_path / "top10nl.gpkg")
+    download(server, output_file, {"gebouw_vlak": ["typeobject"]})
+    messages, _ = download(server, output_file, {"gebouw_vlak": ["typeobject"]})
+    assert any("Already downloaded: 100%" in message for message in messages)
+
+
+def test_rejected_filter_is_found_by_probing(server, tmp_path):
+    output_file = str(tmp_path / "top10nl.gpkg")
+    messages, engine = download(server, output_file, {"gebouw_vlak": ["typeobject"]},
+                                filters={"gebouw_vlak": "aantal > 2"})
+    assert not engine.server_filter
+    assert engine.server_properties
+    assert any("rejected the filter, filter-lang parameter" in message for message in messages)
+    assert columns(output_file) >= {"typeobject"} and "hoogte" not in columns(output_file)
+
+
+def test_rejected_parameter_named_in_the_error_message(server, tmp_path, monkeypatch):
+    items = server.items
+
+    def items_without_properties(collection, query, path):
+        if "properties" in query:
+            raise ValueError("Unknown parameter: properties")
+        return items(collection, query, path)
+
+    monkeypatch.setattr(server, "items", items_without_properties)
+    output_file = str(tmp_path / "top10nl.gpkg")
+    messages, engine = download(server, output_file, {"gebouw_vlak": ["typeobject"]},
+                                filters={"gebouw_vlak": "typeobject=synthetisch"})
+    assert not engine.server_properties
+    assert engine.server_filter
+    assert any("rejected the properties parameter of gebouw_vlak: named in the error message" in message
+               for message in messages)
@@ -0,0 +1,41 @@
+import pytest
+
+from top10nl_downloader.feature_selection import FeatureFilter
+
+
+def feature(**properties):
+    return {"type": "Feature", "properties": properties}
+
+
+def test_pairs_compare_numbers_as_numbers():
+    feature_filter = FeatureFilter("hoogte=5&aantal=3")
+    assert feature_filter.matches(feature(hoogte=5.0, aantal=3))
+    assert feature_filter.matches(feature(hoogte=5, aantal=3.0))
+    assert not feature_filter.matches(feature(hoogte=5.5, aantal=3))
+    assert not feature_filter.matches(feature(hoogte="vijf", aantal=3))
+    assert FeatureFilter("hoogte=5.50").matches(feature(hoogte=5.5))
+    assert not FeatureFilter("hoogte=hoog").matches(feature(hoogte=5.0))
+
+
+def test_pairs_compare_booleans_as_booleans():
+    assert FeatureFilter("brug=true").matches(feature(brug=True))
+    assert FeatureFilter("brug=False").matches(feature(brug=False))
+    assert not FeatureFilter("brug=true").matches(feature(brug=False))
+    assert not FeatureFilter("brug=1").matches(feature(brug=True))
+
+
+def test_pairs_compare_text_as_text():
+    feature_filter = FeatureFilter("typeweg=autosnelweg")
+    assert feature_filter.matches(feature(TypeWeg="autosnelweg"))
+    assert not feature_filter.matches(feature(typeweg="autoweg"))
+    assert not feature_filter.matches(feature(typeweg=None))
+    assert not feature_filter.matches(feature())
+    assert FeatureFilter("status=007").matches(feature(status="007"))
+
+
+def test_pairs_with_a_repeated_property_are_refused():
+    with pytest.raises(ValueError):
+        FeatureFilter("aantal=1&aantal=2")
+    with pytest.raises(ValueError):
+        FeatureFilter("typeweg=autosnelweg&TypeWeg=autoweg")
+    assert FeatureFilter("aantal=1&hoogte=2").query_params() == {"aantal": "1", "hoogte": "2"}
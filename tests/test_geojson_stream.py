@@ -0,0 +1,54 @@
+import json
+import random
+
+import pytest
+
+from top10nl_downloader.geojson_stream import FeatureStreamParser
+
+COLLECTION = {
+    "type": "FeatureCollection",
+    "numberMatched": 3,
+    "features": [
+        {"type": "Feature", "id": "a.1", "geometry": {"type": "Point", "coordinates": [155000.5, 463000.25]},
+         "properties": {"naam": "Sint-Oedenrode éè – \U0001F30D", "hoogte": -1.5e3, "brug": True,
+                        "ending": None, "tekst": "a \"quoted\" \\ } ] , value"}},
+        {"type": "Feature", "id": "a.2", "geometry": None, "properties": {}},
+        {"type": "Feature", "id": "a.3",
+         "geometry": {"type": "Polygon", "coordinates": [[[0, 0], [1, 0], [1, 1], [0, 0]]]},
+         "properties": {"lijst": [1, [2, {"x": "]"}]]}},
+    ],
+    "links": [{"rel": "next", "href": "https://example.com/items?offset=3"}],
+    "numberReturned": 3,
+}
+
+
+def parse(chunks):
+    parser = FeatureStreamParser()
+    features = []
+    for chunk in chunks:
+        features.extend(parser.feed(chunk))
+    features.extend(parser.close())
+    return features, parser.members
+
+
+def test_features_and_members_at_every_chunk_size():
+    data = json.dumps(COLLECTION, ensure_ascii=False, indent=1).encode("utf-8")
+    for size in range(1, 40):
+        features, members = parse(data[start:start + size] for start in range(0, len(data), size))
+        assert features == COLLECTION["features"]
+        assert members == {key: value for key, value in COLLECTION.items() if key != "features"}
+
+
+def test_random_chunk_boundaries():
+    data = json.dumps(COLLECTION).encode("utf-8")
+    generator = random.Random(10)
+    for _ in range(200):
+        cuts = sorted(generator.sample(range(1, len(data)), 8))
+        chunks = [data[start:end] for start, end in zip([0] + cuts, cuts + [len(data)])]
+        assert parse(chunks)[0] == COLLECTION["features"]
+
+
+def test_incomplete_response():
+    data = json.dumps(COLLECTION).encode("utf-8")
+    with pytest.raises(ValueError):
+        parse([data[:-20]])
@@ -0,0 +1,33 @@
+from top10nl_downloader.gpkg_geometry import blob_envelope, encode_geometries, encode_geometry
+
+SRS_ID = 28992
+
+GEOMETRIES = [
+    {"type": "Point", "coordinates": [155000.5, 463000.25]},
+    None,
+    {"type": "LineString", "coordinates": [[1, 2], [3, -4], [0.5, 6]]},
+    {"type": "Polygon", "coordinates": [[[0, 0], [10, 0], [10, 10], [0, 0]], [[2, 2], [3, 2], [3, 3], [2, 2]]]},
+    {"type": "MultiPoint", "coordinates": []},
+    {"type": "MultiPoint", "coordinates": [[7, 8], [-1, 9]]},
+    {"type": "GeometryCollection", "geometries": [{"type": "Point", "coordinates": [1, 1]}]},
+    {"type": "MultiLineString", "coordinates": [[[0, 0], [1, 1]], [[5, 5], [6, 4]]]},
+    {"type": "MultiPolygon", "coordinates": [[[[100, 100], [101, 100], [101, 101], [100, 100]]],
+                                             [[[-5, -5], [-4, -5], [-4, -4], [-5, -5]]]]},
+    {"type": "Point", "coordinates": [-3, 4]},
+]
+
+
+def test_batch_matches_one_at_a_time():
+    assert encode_geometries(GEOMETRIES, SRS_ID) == [encode_geometry(geometry, SRS_ID) for geometry in GEOMETRIES]
+
+
+def test_batch_with_z_coordinates_matches_one_at_a_time():
+    geometries = GEOMETRIES + [{"type": "LineString", "coordinates": [[1, 2, 3], [4, 5, 6]]}]
+    assert encode_geometries(geometries, SRS_ID) == [encode_geometry(geometry, SRS_ID) for geometry in geometries]
+
+
+def test_envelopes_of_the_batch():
+    blobs = encode_geometries(GEOMETRIES, SRS_ID)
+    assert blob_envelope(blobs[3]) == (0, 10, 0, 10)
+    assert blob_envelope(blobs[4]) is None
+    assert blob_envelope(blobs[8]) == (-5, 101, -5, 101)
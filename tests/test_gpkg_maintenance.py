@@ -0,0 +1,55 @@
+import hashlib
+import sqlite3
+
+import pytest
+
+from top10nl_downloader.gpkg_maintenance import maintain_geopackage
+from top10nl_downloader.gpkg_writer import GeoPackageWriter
+
+
+def square(identifier, x):
+    ring = [[x, 0], [x + 1, 0], [x + 1, 1], [x, 0]]
+    return {"type": "Feature", "id": identifier, "properties": {"ID": identifier},
+            "geometry": {"type": "Polygon", "coordinates": [ring]}}
+
+
+def digest(path):
+    with open(path, "rb") as data:
+        return hashlib.sha256(data.read()).hexdigest()
+
+
+@pytest.fixture
+def geopackage(tmp_path):
+    path = str(tmp_path / "top10nl.gpkg")
+    writer = GeoPackageWriter(path)
+    writer.write_features("gebouw_vlak", [square(f"g{index}", index) for index in range(100)])
+    writer.close()
+    return path
+
+
+def test_check_only_does_not_change_the_file(geopackage):
+    with sqlite3.connect(geopackage) as conn:
+        conn.execute('DELETE FROM "rtree_gebouw_vlak_geom" WHERE id <= 3')
+    before = digest(geopackage)
+    report = maintain_geopackage(geopackage, check_only=True)
+    assert report["index_problems"] == {"gebouw_vlak": ["3 features are missing from the index"]}
+    assert not report["indexes_rebuilt"]
+    assert digest(geopackage) == before
+
+
+def test_damaged_spatial_index_is_rebuilt(geopackage):
+    with sqlite3.connect(geopackage) as conn:
+        conn.execute('DELETE FROM "rtree_gebouw_vlak_geom" WHERE id <= 3')
+    report = maintain_geopackage(geopackage, vacuum=True)
+    assert "gebouw_vlak" in report["indexes_rebuilt"]
+    assert maintain_geopackage(geopackage, check_only=True)["index_problems"] == {}
+
+
+def test_plain_sqlite_file_is_refused(tmp_path):
+    path = str(tmp_path / "plain.sqlite")
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE t (x)")
+    with pytest.raises(ValueError):
+        maintain_geopackage(path, check_only=True)
+    with sqlite3.connect(path) as conn:
+        assert [row[0] for row in conn.execute("SELECT name FROM sqlite_master")] == ["t"]
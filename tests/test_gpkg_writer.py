@@ -0,0 +1,103 @@
+import os
+
+from top10nl_downloader.gpkg_writer import GeoPackage, GeoPackageWriter
+
+
+def square(identifier, x, **properties):
+    ring = [[x, 0], [x + 1, 0], [x + 1, 1], [x, 0]]
+    return {"type": "Feature", "id": identifier, "properties": dict(properties, ID=identifier),
+            "geometry": {"type": "Polygon", "coordinates": [ring]}}
+
+
+def rows(path, sql):
+    # The GeoPackage connection has the ST_ functions of the spatial index triggers
+    geopackage = GeoPackage(path, read_only=True)
+    try:
+        return geopackage.conn.execute(sql).fetchall()
+    finally:
+        geopackage.close()
+
+
+def test_features_with_a_known_id_are_updated_in_place(tmp_path):
+    path = str(tmp_path / "top10nl.gpkg")
+    writer = GeoPackageWriter(path)
+    writer.write_features("gebouw_vlak", [square("g1", 0, hoogte=5.0), square("g2", 10, hoogte=6.0)])
+    writer.write_features("gebouw_vlak", [square("g1", 20, hoogte=7.5), square("g3", 30, hoogte=8.0)])
+    writer.close()
+    assert rows(path, 'SELECT "ID", hoogte, ST_MinX(geom) FROM gebouw_vlak ORDER BY fid') == [
+        ("g1", 7.5, 20.0), ("g2", 6.0, 10.0), ("g3", 8.0, 30.0)]
+    # The updated feature keeps its fid, and its entry in the spatial index follows the new geometry
+    assert rows(path, 'SELECT fid FROM gebouw_vlak WHERE "ID" = \'g1\'') == [(1,)]
+    assert rows(path, 'SELECT minx FROM "rtree_gebouw_vlak_geom" ORDER BY minx') == [(10.0,), (20.0,), (30.0,)]
+
+
+def test_duplicate_ids_of_an_older_layer_are_removed_once(tmp_path):
+    path = str(tmp_path / "top10nl.gpkg")
+    writer = GeoPackageWriter(path)
+    writer.write_features("gebouw_vlak", [square("g1", 0), square("g2", 10)])
+    writer.close()
+    # A layer written before the IDs were unique
+    geopackage = GeoPackage(path)
+    geopackage.conn.execute('DROP INDEX "uk_gebouw_vlak_ID"')
+    geopackage.conn.execute("""INSERT INTO gebouw_vlak ("ID") VALUES ('g1'), ('g1'), ('g2'), (NULL), (NULL)""")
+    geopackage.close()
+
+    writer = GeoPackageWriter(path)
+    assert writer.ensure_layer("gebouw_vlak", False)["duplicates_removed"] == 3
+    writer.write_features("gebouw_vlak", [square("g2", 40)])
+    writer.close()
+    assert rows(path, 'SELECT fid, "ID" FROM gebouw_vlak ORDER BY fid') == [
+        (1, "g1"), (2, "g2"), (6, None), (7, None)]
+    assert rows(path, 'SELECT ST_MinX(geom) FROM gebouw_vlak WHERE "ID" = \'g2\'') == [(40.0,)]
+
+    writer = GeoPackageWriter(path)
+    assert writer.ensure_layer("gebouw_vlak", False)["duplicates_removed"] == 0
+    writer.close()
+
+
+def test_bulk_load_builds_the_spatial_index_at_close(tmp_path):
+    path = str(tmp_path / "top10nl.gpkg")
+    writer = GeoPackageWriter(path, bulk_load=True)
+    writer.write_features("gebouw_vlak", [square(f"g{index}", index) for index in range(50)])
+    writer.write_features("gebouw_vlak", [square(f"g{index}", index) for index in range(50, 100)])
+    # Loaded without the triggers that maintain the index
+    assert writer.spatial_index_suspended("gebouw_vlak")
+    assert writer.conn.execute('SELECT count(*) FROM "rtree_gebouw_vlak_geom"').fetchone()[0] == 0
+    writer.close()
+
+    assert rows(path, 'SELECT count(*), min(minx), max(maxx) FROM "rtree_gebouw_vlak_geom"') == [(100, 0.0, 100.0)]
+    # The same triggers as a layer written without bulk load
+    reference = str(tmp_path / "reference.gpkg")
+    writer = GeoPackageWriter(reference)
+    writer.write_features("gebouw_vlak", [square("g0", 0)])
+    writer.close()
+    triggers = "SELECT name FROM sqlite_master WHERE type = 'trigger' ORDER BY name"
+    assert rows(path, triggers) == rows(reference, triggers) != []
+    assert rows(path, "PRAGMA journal_mode") == [("delete",)]
+    assert not os.path.exists(path + "-wal")
+    geopackage = GeoPackage(path, read_only=True)
+    assert geopackage.check_spatial_index("gebouw_vlak") == []
+    geopackage.close()
+
+
+def test_declared_version_matches_the_spatial_index_triggers(tmp_path):
+    path = str(tmp_path / "top10nl.gpkg")
+    writer = GeoPackageWriter(path)
+    writer.write_features("gebouw_vlak", [square("g1", 0)])
+    writer.close()
+    # A GeoPackage 1.2 with the triggers of that version, as written by older GDAL versions
+    geopackage = GeoPackage(path)
+    conn = geopackage.conn
+    conn.execute("PRAGMA user_version = 10200")
+    conn.execute("UPDATE gpkg_extensions SET definition = 'http://www.geopackage.org/spec120/#extension_rtree'")
+    conn.execute('DROP TRIGGER "rtree_gebouw_vlak_geom_update6"')
+    conn.execute('CREATE TRIGGER "rtree_gebouw_vlak_geom_update1" AFTER UPDATE ON gebouw_vlak BEGIN SELECT 1; END')
+    geopackage.close()
+
+    writer = GeoPackageWriter(path)
+    writer.write_features("gebouw_vlak", [square("g1", 5)])
+    writer.close()
+    assert rows(path, "PRAGMA user_version") == [(10400,)]
+    assert rows(path, "SELECT definition FROM gpkg_extensions WHERE extension_name = 'gpkg_rtree_index'") == [
+        ("http://www.geopackage.org/spec140/#extension_rtree",)]
+    assert rows(path, 'SELECT minx FROM "rtree_gebouw_vlak_geom"') == [(5.0,)]
@@ -0,0 +1,15 @@
+import json
+
+from top10nl_downloader.http_session import HttpSession
+
+
+def test_requests_go_through_the_proxy_of_the_environment(server, monkeypatch):
+    # The mock service answers the absolute URLs that are sent to a proxy
+    monkeypatch.setenv("http_proxy", server.url)
+    monkeypatch.delenv("no_proxy", raising=False)
+    monkeypatch.delenv("NO_PROXY", raising=False)
+    session = HttpSession()
+    response = session.get("http://top10nl.invalid/collections?f=json")
+    assert json.loads(response.body) == {"collections": [{"id": "gebouw_vlak"}]}
+    assert session.connections_opened == 0
+    assert server.requests == 1
@@ -0,0 +1,71 @@
+import email.utils
+import time
+import urllib.error
+
+from top10nl_downloader.request_scheduler import RETRY_AFTER_MAX, AdaptiveLimiter, RequestScheduler, retry_after
+
+
+def test_throttling_halves_the_limit_once_per_epoch():
+    limiter = AdaptiveLimiter(8)
+    epochs = [limiter.acquire() for _ in range(4)]
+    assert limiter.release(epochs[0], "throttled") == (8, 4, "throttled by the service")
+    # Requests sent before the limit was lowered do not lower it again
+    assert limiter.release(epochs[1], "throttled") is None
+    assert limiter.limit == 4
+    epoch = limiter.acquire()
+    assert epoch != epochs[0]
+    assert limiter.release(epoch, "throttled") == (4, 2, "throttled by the service")
+    limiter.release(epochs[2], "ok", 0.1)
+    limiter.release(epochs[3], "ok", 0.1)
+    assert limiter.active == 0
+
+
+def test_throttling_keeps_the_minimum():
+    limiter = AdaptiveLimiter(1)
+    assert limiter.release(limiter.acquire(), "throttled") is None
+    assert limiter.limit == 1
+
+
+def test_pause_holds_new_requests():
+    limiter = AdaptiveLimiter(4)
+    limiter.pause(0.3)
+    start = time.monotonic()
+    limiter.release(limiter.acquire(), "ok", 0.1)
+    assert time.monotonic() - start >= 0.25
+
+
+def test_retry_after():
+    assert retry_after({"Retry-After": "2"}) == 2.0
+    assert retry_after({"Retry-After": "100000"}) == RETRY_AFTER_MAX
+    date = email.utils.formatdate(time.time() + 30, usegmt=True)
+    assert 25 <= retry_after({"Retry-After": date}) <= 30
+    assert retry_after({"Retry-After": email.utils.formatdate(0, usegmt=True)}) == 0.0
+    assert retry_after({"Retry-After": "soon"}) is None
+    assert retry_after({}) is None
+    assert retry_after(None) is None
+
+
+class ThrottlingSession:
+    """Answers the first request with HTTP 429 and Retry-After, the others with the URL"""
+
+    def __init__(self):
+        self.requests = 0
+
+    def get(self, url, headers=None, timeout=60):
+        self.requests += 1
+        if self.requests == 1:
+            raise urllib.error.HTTPError(url, 429, "Too Many Requests", {"Retry-After": "0.2"}, None)
+        return url
+
+
+def test_scheduler_waits_for_retry_after_and_halves_the_limit():
+    messages = []
+    scheduler = RequestScheduler(4, log=messages.append, session=ThrottlingSession())
+    start = time.monotonic()
+    response, _ = scheduler.fetch("https://example.com/items")
+    assert response == "https://example.com/items"
+    assert time.monotonic() - start >= 0.2
+    assert scheduler.retry_count == 1
+    assert scheduler.limiter.limit == 2
+    assert messages == ["Parallel requests: 4 -> 2 (throttled by the service)",
+                        "  Retry 1/5 in 0.2 s: HTTP 429 Too Many Requests"]
@@ -0,0 +1,61 @@
+import sqlite3
+
+import pytest
+
+from mock_oapif_server import MockOapifServer
+from top10nl_downloader.download_engine import Top10NLDownloadEngine
+
+# Two tiles of the smallest size, with 25 features each and pages of 10 features
+EXTENT = [155000, 463000, 155500, 463250]
+FIRST_TILE = "155000,463000,155250,463250"
+SECOND_TILE = "155250,463000,155500,463250"
+
+
+@pytest.fixture
+def dense_server(monkeypatch):
+    mock = MockOapifServer(collections=["gebouw_vlak"], spacing=50)
+    mock.requested = []
+    items = mock.items
+
+    def recording_items(collection, query, path):
+        mock.requested.append({key: values[0] for key, values in query.items()})
+        return items(collection, query, path)
+
+    monkeypatch.setattr(mock, "items", recording_items)
+    mock.start()
+    yield mock
+    mock.stop()
+
+
+def download(server, output_file, resume=False, cancel_after=None):
+    engines = []
+
+    def is_canceled():
+        return cancel_after is not None and engines[0].progress.features >= cancel_after
+
+    engine = Top10NLDownloadEngine(["gebouw_vlak"], EXTENT, output_file, False, max_workers=1, page_size=10,
+                                   tile_size=250, base_url=server.url, is_canceled=is_canceled, resume=resume)
+    engines.append(engine)
+    engine.run()
+    return engine
+
+
+def tile_requests(server):
+    return [(request["bbox"], int(request.get("offset", 0))) for request in server.requested
+            if request["limit"] != "1"]
+
+
+def test_resume_skips_completed_tiles_and_continues_from_the_checkpoint(dense_server, tmp_path):
+    output_file = str(tmp_path / "top10nl.gpkg")
+    # Canceled after the first page of the second tile
+    download(dense_server, output_file, cancel_after=35)
+    assert tile_requests(dense_server) == [(FIRST_TILE, 0), (FIRST_TILE, 10), (FIRST_TILE, 20), (SECOND_TILE, 0)]
+    with sqlite3.connect(output_file) as conn:
+        assert conn.execute("SELECT count(*) FROM gebouw_vlak").fetchone()[0] == 35
+
+    dense_server.requested.clear()
+    engine = download(dense_server, output_file, resume=True)
+    assert not engine.failed_features
+    assert tile_requests(dense_server) == [(SECOND_TILE, 10), (SECOND_TILE, 20)]
+    with sqlite3.connect(output_file) as conn:
+        assert conn.execute("SELECT count(*) FROM gebouw_vlak").fetchone()[0] == 50
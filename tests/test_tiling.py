@@ -0,0 +1,16 @@
+from top10nl_downloader.tiling import queue_tiles, uncovered_tiles
+
+
+def test_narrow_uncovered_strip_is_kept():
+    tiles = uncovered_tiles([(0, 0, 2000, 2000)], [(0, 0, 1999.5, 2000)])
+    assert tiles == [(1999.5, 0, 2000, 2000)]
+
+
+def test_rounding_sliver_is_dropped():
+    assert uncovered_tiles([(0, 0, 2000, 2000)], [(0, 0, 2000 - 1e-9, 2000)]) == []
+    assert uncovered_tiles([(0.1 + 0.2, 0, 2000, 2000)], [(0.3, 0, 2000, 2000)]) == []
+
+
+def test_queue_tiles_leave_out_overlaps():
+    tiles = queue_tiles([(0, 0, 1000, 1000), (500, 0, 1500.25, 1000)], 1000)
+    assert tiles == [(0, 0, 1000, 1000), (1000, 0, 1500, 1000), (1500, 0, 1500.25, 1000)]
@@ -0,0 +1,114 @@
+"""
+Splitting of download extents into tiles
+"""
+
+import math
+
+# Default edge length of a tile in metres (RD New)
+DEFAULT_TILE_SIZE = 2000
+# Dense tiles are split in quadrants until they reach this edge length
+MIN_TILE_SIZE = 250
+# Uncovered parts narrower than this fraction of their tile are floating point noise of the subtraction
+SLIVER_TOLERANCE = 1e-6
+
+
+def tile_size(tile):
+    """Largest edge length of a tile (xmin, ymin, xmax, ymax)"""
+    return max(tile[2] - tile[0], tile[3] - tile[1])
+
+
+def split_extent(extent, size):
+    """Split an extent (xmin, ymin, xmax, ymax) in a grid of tiles of at most size by size"""
+    xmin, ymin, xmax, ymax = extent
+    columns = max(1, math.ceil((xmax - xmin) / size))
+    rows = max(1, math.ceil((ymax - ymin) / size))
+    tiles = []
+    for row in range(rows):
+        for column in range(columns):
+            tiles.append((
+                xmin + column * size,
+                ymin + row * size,
+                min(xmax, xmin + (column + 1) * size),
+                min(ymax, ymin + (row + 1) * size),
+            ))
+    return tiles
+
+
+def split_tile(tile):
+    """Split a tile in four quadrants"""
+    xmin, ymin, xmax, ymax = tile
+    xmid = (xmin + xmax) / 2
+    ymid = (ymin + ymax) / 2
+    return [
+        (xmin, ymin, xmid, ymid),
+        (xmid, ymin, xmax, ymid),
+        (xmin, ymid, xmid, ymax),
+        (xmid, ymid, xmax, ymax),
+    ]
+
+
+def can_split(tile, min_size=MIN_TILE_SIZE):
+    """True when the quadrants of a tile are not smaller than min_size"""
+    return tile_size(tile) / 2 >= min_size
+
+
+def extent_area(extent):
+    """Area of an extent (xmin, ymin, xmax, ymax)"""
+    return max(0, extent[2] - extent[0]) * max(0, extent[3] - extent[1])
+
+
+def subtract_extent(tile, covered):
+    """Parts of a tile outside the covered extent, as up to four rectangles"""
+    xmin, ymin, xmax, ymax = tile
+    cxmin, cymin, cxmax, cymax = covered
+    if cxmin >= xmax or cxmax <= xmin or cymin >= ymax or cymax <= ymin:
+        return [tile]
+    parts = []
+    if cymin > ymin:
+        parts.append((xmin, ymin, xmax, cymin))
+    if cymax < ymax:
+        parts.append((xmin, cymax, xmax, ymax))
+    middle_ymin, middle_ymax = max(ymin, cymin), min(ymax, cymax)
+    if cxmin > xmin:
+        parts.append((xmin, middle_ymin, cxmin, middle_ymax))
+    if cxmax < xmax:
+        parts.append((cxmax, middle_ymin, xmax, middle_ymax))
+    return parts
+
+
+def uncovered_tiles(tiles, covered, tolerance=SLIVER_TOLERANCE):
+    """Parts of tiles that are not within any of the covered extents.
+
+    Only parts narrower than tolerance times the size of their tile are
+    dropped, as those are left by rounding of the coordinates; narrow
+    strips that are really not covered are kept.
+    """
+    result = []
+    for tile in tiles:
+        parts = [tile]
+        for extent in covered:
+            parts = [part for piece in parts for part in subtract_extent(piece, extent)]
+            if not parts:
+                break
+        min_size = tolerance * tile_size(tile)
+        result.extend(part for part in parts
+                      if part[2] - part[0] > min_size and part[3] - part[1] > min_size)
+    return result
+
+
+def bounding_extent(extents):
+    """Smallest extent (xmin, ymin, xmax, ymax) that contains all extents"""
+    return [min(extent[0] for extent in extents), min(extent[1] for extent in extents),
+            max(extent[2] for extent in extents), max(extent[3] for extent in extents)]
+
+
+def queue_tiles(extents, size):
+    """Tiles of a queue of extents, each split in a grid of size by size.
+
+    Parts of an extent that overlap earlier extents are left out, so areas
+    that overlap are only downloaded once.
+    """
+    tiles = []
+    for extent in extents:
+        tiles.extend(uncovered_tiles(split_extent(extent, size), tiles))
+    return tiles
@@ -0,0 +1,397 @@
+"""
+Top10NL Downloader - Dialog of the plugin
+"""
+
+import json
+
+from qgis.PyQt.QtCore import Qt, QSettings
+from qgis.PyQt.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, 
+                                QLabel, QLineEdit, QTextEdit, QPushButton, 
+                                QProgressBar, QRadioButton, QGroupBox,
+                                QListWidget, QListWidgetItem, QSpinBox,
+                                QDialogButtonBox, QComboBox, QCheckBox)
+from qgis.core import QgsCoordinateReferenceSystem, QgsMapLayerProxyModel
+from qgis.gui import QgsExtentGroupBox, QgsMapLayerComboBox
+
+from .tiling import DEFAULT_TILE_SIZE, MIN_TILE_SIZE
+from .download_options import DEFAULT_PARALLEL_DOWNLOADS, MAX_PARALLEL_DOWNLOADS
+
+# Settings for the number of requests to the service that run in parallel
+SETTINGS_MAX_WORKERS = "top10nl_downloader/max_workers"
+
+# Settings for the edge length in metres of the tiles the extent is split into
+SETTINGS_TILE_SIZE = "top10nl_downloader/tile_size"
+MAX_TILE_SIZE = 50000
+
+# Settings with the selected properties per collection, as JSON; collections not in it keep all
+SETTINGS_PROPERTIES = "top10nl_downloader/properties"
+
+
+# Settings with the filter expression per collection, as JSON
+SETTINGS_FILTERS = "top10nl_downloader/filters"
+
+# Settings for the GeoPackage maintenance after a download
+SETTINGS_MAINTAIN = "top10nl_downloader/maintain"
+
+
+def _load_json_setting(key):
+    try:
+        value = json.loads(QSettings().value(key, "{}") or "{}")
+    except (TypeError, ValueError):
+        return {}
+    return value if isinstance(value, dict) else {}
+
+
+def load_property_selection():
+    """The selected property names per collection"""
+    return _load_json_setting(SETTINGS_PROPERTIES)
+
+
+def save_property_selection(selection):
+    """Remember the selected property names per collection"""
+    QSettings().setValue(SETTINGS_PROPERTIES, json.dumps(selection))
+
+
+def load_filters():
+    """The filter expression per collection"""
+    return _load_json_setting(SETTINGS_FILTERS)
+
+
+def save_filters(filters):
+    """Remember the filter expression per collection"""
+    QSettings().setValue(SETTINGS_FILTERS, json.dumps(filters))
+
+
+class ColumnsDialog(QDialog):
+    """Choose the properties of one collection that are downloaded"""
+    
+    def __init__(self, collection, properties, selected=None, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle(f"Columns of {collection}")
+        self.resize(300, 400)
+        layout = QVBoxLayout()
+        layout.addWidget(QLabel("Attributes to download (ID is always kept):"))
+        self.list_properties = QListWidget()
+        for name in properties:
+            item = QListWidgetItem(name)
+            item.setFlags(item.flags() | Qt.ItemFlag.ItemIsUserCheckable)
+            checked = selected is None or name in selected
+            item.setCheckState(Qt.CheckState.Checked if checked else Qt.CheckState.Unchecked)
+            self.list_properties.addItem(item)
+        layout.addWidget(self.list_properties)
+        buttons = QDialogButtonBox(QDialogButtonBox.StandardButton.Ok | QDialogButtonBox.StandardButton.Cancel)
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+        layout.addWidget(buttons)
+        self.setLayout(layout)
+    
+    def selected_properties(self):
+        """The checked property names, or None when all are checked"""
+        items = [self.list_properties.item(i) for i in range(self.list_properties.count())]
+        checked = [item.text() for item in items if item.checkState() == Qt.CheckState.Checked]
+        return None if len(checked) == len(items) else checked
+
+
+class BookmarksDialog(QDialog):
+    """Choose the spatial bookmarks whose extents are downloaded as a queue"""
+    
+    def __init__(self, bookmarks, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Queue Bookmarks")
+        self.resize(300, 400)
+        self.bookmarks = bookmarks
+        layout = QVBoxLayout()
+        layout.addWidget(QLabel("Bookmarks to download, one extent each:"))
+        self.list_bookmarks = QListWidget()
+        for bookmark in bookmarks:
+            item = QListWidgetItem(bookmark.name())
+            item.setFlags(item.flags() | Qt.ItemFlag.ItemIsUserCheckable)
+            item.setCheckState(Qt.CheckState.Unchecked)
+            self.list_bookmarks.addItem(item)
+        layout.addWidget(self.list_bookmarks)
+        buttons = QDialogButtonBox(QDialogButtonBox.StandardButton.Ok | QDialogButtonBox.StandardButton.Cancel)
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+        layout.addWidget(buttons)
+        self.setLayout(layout)
+    
+    def selected_bookmarks(self):
+        """The checked bookmarks"""
+        return [bookmark for index, bookmark in enumerate(self.bookmarks)
+                if self.list_bookmarks.item(index).checkState() == Qt.CheckState.Checked]
+
+
+class Top10NLDownloaderDialog(QDialog):
+    def __init__(self, iface=None, plugin=None):
+        super().__init__(iface.mainWindow() if iface else None)
+        self.iface = iface
+        self.plugin = plugin
+        self.setWindowTitle("Top10NL Downloader")
+        self.resize(500, 700)
+        self.setup_ui()
+        
+    def setup_ui(self):
+        """Create the user interface"""
+        main_layout = QVBoxLayout()
+        
+        # Output file
+        output_layout = QHBoxLayout()
+        output_layout.addWidget(QLabel("Output:"))
+        self.txt_output = QLineEdit()
+        output_layout.addWidget(self.txt_output)
+        self.btn_browse_output = QPushButton("Browse...")
+        output_layout.addWidget(self.btn_browse_output)
+        main_layout.addLayout(output_layout)
+        
+        # Extent - QgsExtentGroupBox
+        self.extent_group = QgsExtentGroupBox()
+        self.extent_group.setTitle("Extent")
+        self.extent_group.setOutputCrs(QgsCoordinateReferenceSystem("EPSG:28992"))
+        # Set the map canvas for built-in "From Canvas" functionality
+        if self.iface:
+            self.extent_group.setMapCanvas(self.iface.mapCanvas())
+        main_layout.addWidget(self.extent_group)
+        
+        # Optional polygon area of interest instead of the extent
+        area_group = QGroupBox("Area of Interest (optional)")
+        area_layout = QVBoxLayout()
+        area_source_layout = QHBoxLayout()
+        area_source_layout.addWidget(QLabel("Polygon layer:"))
+        self.cmb_area_layer = QgsMapLayerComboBox()
+        self.cmb_area_layer.setFilters(QgsMapLayerProxyModel.Filter.PolygonLayer)
+        self.cmb_area_layer.setAllowEmptyLayer(True)
+        self.cmb_area_layer.setLayer(None)
+        self.cmb_area_layer.setToolTip(
+            "Download within the selected features of this layer instead of the extent.")
+        area_source_layout.addWidget(self.cmb_area_layer)
+        self.btn_draw_area = QPushButton("Draw on Canvas")
+        self.btn_draw_area.setToolTip(
+            "Draw the area of interest on the map: click to add vertices, right click to finish.")
+        area_source_layout.addWidget(self.btn_draw_area)
+        area_layout.addLayout(area_source_layout)
+        area_filter_layout = QHBoxLayout()
+        area_filter_layout.addWidget(QLabel("Features:"))
+        self.cmb_area_filter = QComboBox()
+        self.cmb_area_filter.addItem("In tiles intersecting the polygon", "tiles")
+        self.cmb_area_filter.addItem("Intersecting the polygon", "intersects")
+        self.cmb_area_filter.addItem("Clipped to the polygon", "clip")
+        self.cmb_area_filter.setToolTip(
+            "Only tiles that intersect the polygon are downloaded. Features outside the polygon "
+            "can also be left out, or their geometries clipped to it.")
+        area_filter_layout.addWidget(self.cmb_area_filter)
+        area_filter_layout.addStretch()
+        area_layout.addLayout(area_filter_layout)
+        area_queue_layout = QHBoxLayout()
+        self.chk_area_queue = QCheckBox("One extent per selected feature")
+        self.chk_area_queue.setToolTip(
+            "Download the extent of each selected feature of the polygon layer, as a queue in one run.")
+        area_queue_layout.addWidget(self.chk_area_queue)
+        self.btn_bookmarks = QPushButton("Bookmarks...")
+        self.btn_bookmarks.setToolTip("Download the extents of spatial bookmarks, as a queue in one run.")
+        area_queue_layout.addWidget(self.btn_bookmarks)
+        area_queue_layout.addStretch()
+        area_layout.addLayout(area_queue_layout)
+        self.lbl_area = QLabel("")
+        area_layout.addWidget(self.lbl_area)
+        area_group.setLayout(area_layout)
+        main_layout.addWidget(area_group)
+        
+        # Features section
+        features_group = QGroupBox("Top10NL Features")
+        features_layout = QVBoxLayout()
+        
+        # Features list widget with selection controls
+        features_controls_layout = QHBoxLayout()
+        self.btn_select_all = QPushButton("Select All")
+        self.btn_deselect_all = QPushButton("Deselect All")
+        self.btn_refresh_features = QPushButton("Refresh from API")
+        self.btn_columns = QPushButton("Columns...")
+        self.btn_columns.setToolTip(
+            "Choose the attributes to download for the highlighted feature. "
+            "Only those are requested from the service; the choice is remembered.")
+        self.btn_filter = QPushButton("Filter...")
+        self.btn_filter.setToolTip(
+            "Only download the features of the highlighted feature type that pass a filter: "
+            "property=value pairs joined by &, or a CQL2 text expression. "
+            "The filter is sent to the service; the choice is remembered.")
+        features_controls_layout.addWidget(self.btn_select_all)
+        features_controls_layout.addWidget(self.btn_deselect_all)
+        features_controls_layout.addWidget(self.btn_refresh_features)
+        features_controls_layout.addWidget(self.btn_columns)
+        features_controls_layout.addWidget(self.btn_filter)
+        features_controls_layout.addStretch()  # Add stretch to push buttons to left
+        features_layout.addLayout(features_controls_layout)
+        
+        # Features list widget
+        self.list_features = QListWidget()
+        self.list_features.setSelectionMode(QListWidget.SelectionMode.MultiSelection)
+        self.list_features.setMinimumHeight(100)
+        self.list_features.setMaximumHeight(200)  # Set maximum height
+        # Scrollbar policy is automatic by default - shows when needed
+        features_layout.addWidget(self.list_features)
+        
+        features_group.setLayout(features_layout)
+        main_layout.addWidget(features_group)
+        
+        # Operation mode
+        op_group = QGroupBox("Operation Mode")
+        op_layout = QHBoxLayout()
+        self.rad_overwrite = QRadioButton("Overwrite")
+        self.rad_append = QRadioButton("Append")
+        self.rad_update = QRadioButton("Update")
+        self.rad_update.setToolTip(
+            "Only download the features changed since the last download of each layer, "
+            "and remove the features that have ended.")
+        self.rad_append.setChecked(True)
+        op_layout.addWidget(self.rad_append)
+        op_layout.addWidget(self.rad_overwrite)
+        op_layout.addWidget(self.rad_update)
+        op_group.setLayout(op_layout)
+        main_layout.addWidget(op_group)
+        
+        # Concurrency: number of page and tile requests that run in parallel
+        concurrency_layout = QHBoxLayout()
+        concurrency_layout.addWidget(QLabel("Parallel requests:"))
+        self.spin_max_workers = QSpinBox()
+        self.spin_max_workers.setMinimum(1)
+        self.spin_max_workers.setMaximum(MAX_PARALLEL_DOWNLOADS)
+        self.spin_max_workers.setValue(
+            int(QSettings().value(SETTINGS_MAX_WORKERS, DEFAULT_PARALLEL_DOWNLOADS)))
+        self.spin_max_workers.setToolTip(
+            "Largest number of requests for tiles and pages, of all collections together, "
+            "that are sent to the service at the same time. "
+            "Writing to the GeoPackage always happens one batch at a time. "
+            "When the service throttles or slows down, fewer requests are sent at the same time.")
+        concurrency_layout.addWidget(self.spin_max_workers)
+        concurrency_layout.addWidget(QLabel("Tile size (m):"))
+        self.spin_tile_size = QSpinBox()
+        self.spin_tile_size.setMinimum(MIN_TILE_SIZE)
+        self.spin_tile_size.setMaximum(MAX_TILE_SIZE)
+        self.spin_tile_size.setSingleStep(MIN_TILE_SIZE)
+        self.spin_tile_size.setValue(
+            int(QSettings().value(SETTINGS_TILE_SIZE, DEFAULT_TILE_SIZE)))
+        self.spin_tile_size.setToolTip(
+            "The extent is downloaded in tiles of this size. Tiles with many "
+            f"features are split further, down to {MIN_TILE_SIZE} m.")
+        concurrency_layout.addWidget(self.spin_tile_size)
+        concurrency_layout.addStretch()
+        main_layout.addLayout(concurrency_layout)
+        
+        # Maintenance of the GeoPackage after the download
+        self.chk_maintain = QCheckBox("Maintain the GeoPackage after the download")
+        self.chk_maintain.setChecked(QSettings().value(SETTINGS_MAINTAIN, False, type=bool))
+        self.chk_maintain.setToolTip(
+            "Rebuild damaged spatial indexes, compact the GeoPackage when much of it is free "
+            "or fragmented, and update its statistics. The space reclaimed is reported in the log.")
+        main_layout.addWidget(self.chk_maintain)
+        
+        # Progress
+        main_layout.addWidget(QLabel("Progress:"))
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setMinimum(0)
+        self.progress_bar.setMaximum(100)
+        self.progress_bar.setValue(0)
+        main_layout.addWidget(self.progress_bar)
+        self.lbl_progress_status = QLabel("")
+        main_layout.addWidget(self.lbl_progress_status)
+        
+        # Log window
+        main_layout.addWidget(QLabel("Log:"))
+        self.txt_log_output = QTextEdit()
+        self.txt_log_output.setReadOnly(True)
+        self.txt_log_output.setMinimumHeight(150)
+        main_layout.addWidget(self.txt_log_output)
+        
+        # Buttons
+        buttons_layout = QHBoxLayout()
+        self.btn_run = QPushButton("Run")
+        self.btn_resume = QPushButton("Resume")
+        self.btn_resume.setToolTip(
+            "Continue the last canceled or failed download into the output GeoPackage, "
+            "with the same features, extent and mode.")
+        self.btn_close = QPushButton("Close")
+        self.btn_close.clicked.connect(self.close)
+        buttons_layout.addWidget(self.btn_run)
+        buttons_layout.addWidget(self.btn_resume)
+        buttons_layout.addWidget(self.btn_close)
+        main_layout.addLayout(buttons_layout)
+        
+        self.setLayout(main_layout)
+        
+        # Connect selection buttons
+        self.btn_select_all.clicked.connect(self.select_all_features)
+        self.btn_deselect_all.clicked.connect(self.deselect_all_features)
+        
+    def populate_features_list(self, features):
+        """Populate the features list widget with available features"""
+        self.list_features.clear()
+        selection = load_property_selection()
+        filters = load_filters()
+        
+        for feature in sorted(features):
+            item = QListWidgetItem(feature)
+            item.setFlags(item.flags() | Qt.ItemFlag.ItemIsUserCheckable)
+            item.setCheckState(Qt.CheckState.Unchecked)
+            self.set_feature_tooltip(item, selection.get(feature), filters.get(feature))
+            self.list_features.addItem(item)
+            
+    def set_feature_tooltip(self, item, properties, expression=None):
+        """Show the selected attributes and the filter of a feature in its tooltip"""
+        if properties is None:
+            tooltip = "All attributes"
+        else:
+            tooltip = f"Attributes: {', '.join(properties) or 'only ID'}"
+        if expression:
+            tooltip += f"\nFilter: {expression}"
+        item.setToolTip(tooltip)
+            
+    def get_selected_features(self):
+        """Get list of selected features"""
+        selected_features = []
+        for i in range(self.list_features.count()):
+            item = self.list_features.item(i)
+            if item.checkState() == Qt.CheckState.Checked:
+                selected_features.append(item.text())
+        return selected_features
+        
+    def select_all_features(self):
+        """Select all features in the list"""
+        for i in range(self.list_features.count()):
+            item = self.list_features.item(i)
+            item.setCheckState(Qt.CheckState.Checked)
+            
+    def deselect_all_features(self):
+        """Deselect all features in the list"""
+        for i in range(self.list_features.count()):
+            item = self.list_features.item(i)
+            item.setCheckState(Qt.CheckState.Unchecked)
+            
+    def set_default_selection(self, default_features=None):
+        """Set default selected features (useful for common features)"""
+        if default_features is None:
+            # Default to some commonly used Top10NL features
+            default_features = ["wegdeel_vlak", "gebouw_vlak", "waterdeel_vlak", "terrein_vlak"]
+            
+        for i in range(self.list_features.count()):
+            item = self.list_features.item(i)
+            if item.text() in default_features:
+                item.setCheckState(Qt.CheckState.Checked)
+                
+    def select_all_by_default(self, select_all=False):
+        """Option to select all features by default"""
+        check_state = Qt.CheckState.Checked if select_all else Qt.CheckState.Unchecked
+        for i in range(self.list_features.count()):
+            item = self.list_features.item(i)
+            item.setCheckState(check_state)
+            
+    def update_progress(self, value, status=""):
+        """Update the progress bar and the features/s, MB/s and ETA line - called from task thread"""
+        self.progress_bar.setValue(value)
+        self.lbl_progress_status.setText(status)
+        
+    def append_log(self, message):
+        """Append message to log output - called from task thread"""
+        self.txt_log_output.append(message)
+        # Auto-scroll to bottom
+        scrollbar = self.txt_log_output.verticalScrollBar()
+        scrollbar.setValue(scrollbar.maximum())
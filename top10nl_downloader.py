@@ -1,24 +1,53 @@
 """
 Top10NL Downloader - A QGIS plugin for downloading Top10NL objects via OGC-API Features
+
+This module is loaded when QGIS starts, so it only holds the plugin shim.
+The dialog and the download engine are imported when the plugin is first used.
 """
 
+import time
+
+# Start of loading the plugin, to measure its share of the QGIS startup time
+PLUGIN_LOAD_START = time.perf_counter()
+
 import os
-import datetime
 import json
-import urllib.request
 import urllib.error
 from qgis.PyQt.QtCore import Qt, QSettings, QTranslator, QCoreApplication, QThread, pyqtSignal
 from qgis.PyQt.QtGui import QIcon
-from qgis.PyQt.QtWidgets import (QAction, QFileDialog, QMessageBox, 
-                                QDialog, QVBoxLayout, QHBoxLayout, 
-                                QLabel, QLineEdit, QTextEdit, QPushButton, 
-                                QProgressBar, QRadioButton, QGroupBox,
-                                QListWidget, QListWidgetItem)
-from qgis.core import (QgsProject, QgsRectangle, QgsVectorLayer, QgsLayerTreeGroup, QgsLayerTreeLayer,
-                      QgsCoordinateReferenceSystem, QgsTask, QgsApplication, 
+from qgis.PyQt.QtWidgets import QAction, QFileDialog, QInputDialog, QMessageBox
+from qgis.core import (QgsProject, QgsRectangle, QgsCoordinateReferenceSystem, QgsApplication, 
                       QgsMessageLog, Qgis)
-from qgis.gui import QgsExtentGroupBox  # Import the new widget
-import processing
+
+from .catalogue_cache import fetch_catalogue, fetch_properties, is_stale, load_catalogue, save_catalogue
+from .http_session import close_default_session
+from .oapif_client import TOP10NL_API_URL
+
+class Top10NLPropertiesLoader(QThread):
+    """Thread for loading the property names of a Top10NL collection from OGC API"""
+    properties_loaded = pyqtSignal(str, list)
+    error_occurred = pyqtSignal(str, str)
+    
+    def __init__(self, collection, base_url=TOP10NL_API_URL):
+        super().__init__()
+        self.collection = collection
+        self.base_url = base_url
+        
+    def run(self):
+        """Fetch the property names from the schema or a feature of the collection"""
+        try:
+            properties = fetch_properties(self.base_url, self.collection)
+            self.properties_loaded.emit(self.collection, properties)
+            
+        except (urllib.error.URLError, OSError, ValueError) as e:
+            error_msg = f"Could not load the attributes of {self.collection}: {str(e)}"
+            QgsMessageLog.logMessage(error_msg, "Top10NL Downloader", Qgis.MessageLevel.Warning)
+            self.error_occurred.emit(self.collection, error_msg)
+            
+        except Exception as e:
+            error_msg = f"Unexpected error loading the attributes of {self.collection}: {str(e)}"
+            QgsMessageLog.logMessage(error_msg, "Top10NL Downloader", Qgis.MessageLevel.Critical)
+            self.error_occurred.emit(self.collection, error_msg)
 
 """ nieuw van Claude """ 
 class Top10NLFeaturesLoader(QThread):
@@ -26,31 +55,27 @@ class Top10NLFeaturesLoader(QThread):
     features_loaded = pyqtSignal(list)
     error_occurred = pyqtSignal(str)
     
-    def __init__(self, base_url="https://api.pdok.nl/brt/top10nl/ogc/v1"):
+    def __init__(self, base_url=TOP10NL_API_URL, cache_file=None):
         super().__init__()
         self.base_url = base_url
+        self.cache_file = cache_file
         
     def run(self):
         """Fetch available collections from OGC API Features service"""
         try:
-            collections_url = f"{self.base_url}/collections"
-            
-            # Make HTTP request
-            with urllib.request.urlopen(collections_url, timeout=30) as response:
-                data = json.loads(response.read().decode('utf-8'))
-            
-            # Extract collection IDs
-            features = []
-            if 'collections' in data:
-                for collection in data['collections']:
-                    if 'id' in collection:
-                        features.append(collection['id'])
-            
-            # Sort features alphabetically
-            features.sort()
-            
+            # Revalidate the cached catalogue, if any, with ETag/Last-Modified
+            cached = load_catalogue(self.cache_file) if self.cache_file else None
+            catalogue, modified = fetch_catalogue(self.base_url, cached)
+            features = catalogue["features"]
+            if self.cache_file and features:
+                save_catalogue(self.cache_file, catalogue)
+            
+            if not modified:
+                message = f"Top10NL features list is up to date ({len(features)} features)"
+            else:
+                message = f"Successfully loaded {len(features)} Top10NL features from API"
             QgsMessageLog.logMessage(
-                f"Successfully loaded {len(features)} Top10NL features from API", 
+                message, 
                 "Top10NL Downloader", 
                 Qgis.MessageLevel.Info
             )
@@ -91,7 +116,7 @@ class Top10NLDownloader:
         self.plugin_dir = os.path.dirname(__file__)
         
         # Initialize locale
-        locale = QSettings().value('locale/userLocale')[0:2]
+        locale = (QSettings().value('locale/userLocale') or '')[0:2]
         locale_path = os.path.join(
             self.plugin_dir,
             'i18n',
@@ -102,17 +127,29 @@ class Top10NLDownloader:
             self.translator.load(locale_path)
             QCoreApplication.installTranslator(self.translator)
             
-        # Create the dialog and setup UI - pass iface to dialog
-        # self.dlg = Top10NLDownloaderDialog(iface)
-        # Aangepast door CoPilot:
-        self.dlg = Top10NLDownloaderDialog(iface, self)
+        # The dialog is created on first use, see create_dialog()
+        self.dlg = None
+        # Map tool to draw the area of interest, the map tool it replaced, and the drawn area in RD New
+        self.area_tool = None
+        self.previous_map_tool = None
+        self.drawn_area = None
+        # Bookmarks whose extents are downloaded as a queue
+        self.queued_bookmarks = []
         
         # Declare instance attributes
         self.actions = []
         self.menu = 'PDOK - OGC API Features-downloaders'
+        self.toolbar = None
+        # Processing provider, also loaded by qgis_process without a GUI
+        self.provider = None
+        
+        # Load default features
+        self.load_default_features()
+        
+    def init_toolbar(self):
+        """Find the toolbar shared by the PDOK downloaders, or create it"""
         toolbar_name = 'PDOK_OGC_API_Features_downloaders'
         # Check for existing toolbar
-        self.toolbar = None
         for tb in self.iface.mainWindow().findChildren(type(self.iface.addToolBar('dummy'))):
             if tb.objectName() == toolbar_name:
                 self.toolbar = tb
@@ -126,9 +163,6 @@ class Top10NLDownloader:
             self.toolbar = self.iface.addToolBar('PDOK - OGC API Features-downloaders')
             self.toolbar.setObjectName(toolbar_name)
         
-        # Load default features
-        self.load_default_features()
-        
     def get_current_canvas_extent(self):
         """Get the current extent of the map canvas"""
         try:
@@ -202,8 +236,17 @@ class Top10NLDownloader:
         
         return action
     
+    def initProcessing(self):
+        """Register the Processing provider, for the toolbox, the modeler and qgis_process"""
+        from .processing_provider import Top10NLProcessingProvider
+        
+        self.provider = Top10NLProcessingProvider()
+        QgsApplication.processingRegistry().addProvider(self.provider)
+        
     def initGui(self):
         """Create the menu entries and toolbar icons inside the QGIS GUI"""
+        self.initProcessing()
+        self.init_toolbar()
         
         icon_path = os.path.join(self.plugin_dir, 'icon.png')
         self.add_action(
@@ -212,16 +255,53 @@ class Top10NLDownloader:
             callback=self.run,
             parent=self.iface.mainWindow())
         
+        load_time = (time.perf_counter() - PLUGIN_LOAD_START) * 1000
+        QgsMessageLog.logMessage(
+            f"Plugin loaded in {load_time:.1f} ms", 
+            "Top10NL Downloader", 
+            Qgis.MessageLevel.Info
+        )
+        
+    def create_dialog(self):
+        """Create the dialog and connect its signals; done on first use of the plugin"""
+        start = time.perf_counter()
+        from .top10nl_dialog import Top10NLDownloaderDialog
+        
+        # Create the dialog and setup UI - pass iface to dialog
+        # Aangepast door CoPilot:
+        self.dlg = Top10NLDownloaderDialog(self.iface, self)
+        
         # Connect UI signals
         self.dlg.btn_browse_output.clicked.connect(self.select_output_file)
-        # Aangepast door CoPilot
-        # self.dlg.btn_browse_log.clicked.connect(self.select_log_file)
         self.dlg.btn_run.clicked.connect(self.start_download)
+        self.dlg.btn_resume.clicked.connect(self.resume_download)
         self.dlg.btn_refresh_features.clicked.connect(self.refresh_features)
+        self.dlg.btn_columns.clicked.connect(self.select_columns)
+        self.dlg.btn_filter.clicked.connect(self.edit_filter)
+        self.dlg.btn_draw_area.clicked.connect(self.start_drawing_area)
+        self.dlg.cmb_area_layer.layerChanged.connect(self.on_area_layer_changed)
+        self.dlg.cmb_area_filter.currentIndexChanged.connect(lambda index: self.update_area_label())
+        self.dlg.chk_area_queue.toggled.connect(lambda checked: self.update_area_label())
+        self.dlg.btn_bookmarks.clicked.connect(self.select_bookmarks)
         self.dlg.txt_output.textChanged.connect(self.on_output_file_changed)
         
+        QgsMessageLog.logMessage(
+            f"Dialog created in {(time.perf_counter() - start) * 1000:.1f} ms", 
+            "Top10NL Downloader", 
+            Qgis.MessageLevel.Info
+        )
+        
     def unload(self):
         """Removes the plugin menu item and icon from QGIS GUI"""
+        # Close the kept-alive connections to the service
+        close_default_session()
+        if self.provider is not None:
+            QgsApplication.processingRegistry().removeProvider(self.provider)
+            self.provider = None
+        if self.area_tool is not None:
+            self.stop_drawing_area()
+            self.area_tool.clear()
+            self.area_tool = None
         # Remove actions from menu and toolbar
         for action in self.actions:
             self.iface.removePluginMenu(self.menu, action)
@@ -271,18 +351,30 @@ class Top10NLDownloader:
             "wegdeel_vlak"
         ]
         
-        # Initialize with fallback features
-        self.features = self.fallback_features.copy()
+        # Initialize with the cached catalogue, or else the fallback features.
+        # The API is only asked when the dialog is opened and the cache is stale.
+        self.catalogue_file = os.path.join(
+            QgsApplication.qgisSettingsDirPath(), "top10nl_downloader", "collections.json")
+        cached = load_catalogue(self.catalogue_file)
+        self.features = cached["features"] if cached else self.fallback_features.copy()
+        self.catalogue_stale = is_stale(cached)
         
-        # Start loading features from API
-        self.features_loader = Top10NLFeaturesLoader()
+    def start_features_loader(self):
+        """Load the features list from the API in a background thread"""
+        if hasattr(self, 'features_loader') and self.features_loader.isRunning():
+            return False  # Already loading
+        self.features_loader = Top10NLFeaturesLoader(cache_file=self.catalogue_file)
         self.features_loader.features_loaded.connect(self.on_features_loaded)
         self.features_loader.error_occurred.connect(self.on_features_error)
         self.features_loader.start()
+        return True
         
     def on_features_loaded(self, features):
         """Handle successful loading of features from API"""
         if features:
+            self.catalogue_stale = False
+            if features == self.features:
+                return
             self.features = features
             QgsMessageLog.logMessage(
                 f"Updated Top10NL features list with {len(features)} items from API", 
@@ -291,7 +383,7 @@ class Top10NLDownloader:
             )
             
             # Update dialog if it's already shown
-            if hasattr(self, 'dlg') and self.dlg.isVisible():
+            if self.dlg is not None and self.dlg.isVisible():
                 self.dlg.populate_features_list(self.features)
                 # Set some default selections for commonly used features
                 self.dlg.set_default_selection()
@@ -311,7 +403,7 @@ class Top10NLDownloader:
         )
         
         # Show message to user if dialog is visible
-        if hasattr(self, 'dlg') and self.dlg.isVisible():
+        if self.dlg is not None and self.dlg.isVisible():
             self.iface.messageBar().pushMessage(
                 "Top10NL Downloader", 
                 "Could not load latest features from API. Using default list.", 
@@ -323,7 +415,7 @@ class Top10NLDownloader:
             
     def refresh_features(self):
         """Manually refresh the features list from API"""
-        if hasattr(self, 'features_loader') and self.features_loader.isRunning():
+        if not self.start_features_loader():
             return  # Already loading
             
         self.iface.messageBar().pushMessage(
@@ -333,18 +425,243 @@ class Top10NLDownloader:
             duration=3
         )
         
-        self.features_loader = Top10NLFeaturesLoader()
-        self.features_loader.features_loaded.connect(self.on_features_loaded)
-        self.features_loader.error_occurred.connect(self.on_features_error)
-        self.features_loader.start()
+    def cached_properties(self, collection):
+        """Property names of a collection from the cached catalogue, or None"""
+        catalogue = load_catalogue(self.catalogue_file)
+        return (catalogue or {}).get("properties", {}).get(collection) or None
+        
+    def select_columns(self):
+        """Choose the attributes to download for the highlighted feature.
+        
+        Attributes that are not cached yet are loaded in a background thread;
+        the attributes dialog opens when they arrive.
+        """
+        item = self.dlg.list_features.currentItem()
+        if item is None:
+            QMessageBox.information(
+                self.dlg, 
+                "No Feature Highlighted", 
+                "Click a feature in the list to choose its attributes."
+            )
+            return
+        collection = item.text()
+        properties = self.cached_properties(collection)
+        if properties:
+            self.open_columns_dialog(collection, properties)
+            return
+        if hasattr(self, 'properties_loader') and self.properties_loader.isRunning():
+            return  # Already loading
+        self.properties_loader = Top10NLPropertiesLoader(collection)
+        self.properties_loader.properties_loaded.connect(self.on_properties_loaded)
+        self.properties_loader.error_occurred.connect(self.on_properties_error)
+        self.properties_loader.start()
+        self.iface.messageBar().pushMessage(
+            "Top10NL Downloader", 
+            f"Loading the attributes of {collection}...", 
+            level=Qgis.MessageLevel.Info,
+            duration=3
+        )
+        
+    def on_properties_loaded(self, collection, properties):
+        """Cache the loaded attributes of a collection and let the user choose from them"""
+        catalogue = load_catalogue(self.catalogue_file)
+        if catalogue and properties:
+            catalogue.setdefault("properties", {})[collection] = properties
+            save_catalogue(self.catalogue_file, catalogue)
+        if self.dlg is None or not self.dlg.isVisible():
+            return
+        if not properties:
+            QMessageBox.information(
+                self.dlg, 
+                "No Attributes", 
+                f"The API reports no attributes for {collection}."
+            )
+            return
+        self.open_columns_dialog(collection, properties)
+        
+    def on_properties_error(self, collection, error_message):
+        """Handle an error loading the attributes of a collection"""
+        if self.dlg is not None and self.dlg.isVisible():
+            QMessageBox.warning(self.dlg, "Attributes Unavailable", error_message)
+        
+    def open_columns_dialog(self, collection, properties):
+        """Let the user choose the attributes to download of a collection and store the selection"""
+        from .top10nl_dialog import ColumnsDialog, load_filters, load_property_selection, save_property_selection
+        
+        selection = load_property_selection()
+        columns = ColumnsDialog(collection, properties, selection.get(collection), self.dlg)
+        if not columns.exec():
+            return
+        selected = columns.selected_properties()
+        if selected is None:
+            selection.pop(collection, None)
+        else:
+            selection[collection] = selected
+        save_property_selection(selection)
+        # The list may have been refilled while the attributes were loading
+        for item in self.dlg.list_features.findItems(collection, Qt.MatchFlag.MatchExactly):
+            self.dlg.set_feature_tooltip(item, selected, load_filters().get(collection))
+        
+    def edit_filter(self):
+        """Set the filter expression of the highlighted feature"""
+        from .feature_selection import FeatureFilter
+        from .top10nl_dialog import load_filters, load_property_selection, save_filters
+        
+        item = self.dlg.list_features.currentItem()
+        if item is None:
+            QMessageBox.information(
+                self.dlg, 
+                "No Feature Highlighted", 
+                "Click a feature in the list to set its filter."
+            )
+            return
+        collection = item.text()
+        filters = load_filters()
+        expression, ok = QInputDialog.getText(
+            self.dlg, 
+            f"Filter of {collection}", 
+            "property=value pairs joined by &, or a CQL2 text expression.\n"
+            "Leave empty to download all features.", 
+            text=filters.get(collection, "")
+        )
+        if not ok:
+            return
+        expression = expression.strip()
+        if expression:
+            try:
+                FeatureFilter(expression)
+            except ValueError as e:
+                QMessageBox.warning(self.dlg, "Invalid Filter", str(e))
+                return
+            filters[collection] = expression
+        else:
+            filters.pop(collection, None)
+        save_filters(filters)
+        self.dlg.set_feature_tooltip(item, load_property_selection().get(collection), filters.get(collection))
+        
+    def start_drawing_area(self):
+        """Let the user draw the area of interest on the map canvas"""
+        from .area_tool import AreaMapTool
+        
+        canvas = self.iface.mapCanvas()
+        if self.area_tool is None:
+            self.area_tool = AreaMapTool(canvas)
+            self.area_tool.area_drawn.connect(self.on_area_drawn)
+            self.area_tool.canceled.connect(self.stop_drawing_area)
+        if canvas.mapTool() is not self.area_tool:
+            self.previous_map_tool = canvas.mapTool()
+        canvas.setMapTool(self.area_tool)
+        self.iface.messageBar().pushMessage(
+            "Top10NL Downloader", 
+            "Click to add vertices of the area of interest, right click to finish, Esc to cancel.", 
+            level=Qgis.MessageLevel.Info,
+            duration=5
+        )
+        
+    def stop_drawing_area(self):
+        """Give the canvas its previous map tool back"""
+        canvas = self.iface.mapCanvas()
+        if self.area_tool is not None and canvas.mapTool() is self.area_tool:
+            if self.previous_map_tool is not None:
+                canvas.setMapTool(self.previous_map_tool)
+            else:
+                canvas.unsetMapTool(self.area_tool)
+        self.previous_map_tool = None
+        
+    def on_area_drawn(self, geometry):
+        """Use the drawn polygon as area of interest"""
+        from .area_tool import to_rd_new
+        
+        canvas_crs = self.iface.mapCanvas().mapSettings().destinationCrs()
+        self.drawn_area = to_rd_new(geometry, canvas_crs)
+        self.stop_drawing_area()
+        # A drawn polygon replaces the layer selection
+        self.dlg.cmb_area_layer.setLayer(None)
+        self.update_area_label()
+        
+    def on_area_layer_changed(self, layer):
+        """A polygon layer replaces the drawn polygon"""
+        if layer is not None:
+            self.drawn_area = None
+            if self.area_tool is not None:
+                self.area_tool.clear()
+        self.update_area_label()
+        
+    def update_area_label(self):
+        """Describe the area of interest below its options"""
+        layer = self.dlg.cmb_area_layer.currentLayer()
+        if layer is not None and self.dlg.chk_area_queue.isChecked():
+            text = f"Queue of the extents of the {layer.selectedFeatureCount()} selected features of {layer.name()}"
+        elif self.queued_bookmarks:
+            text = f"Queue of {len(self.queued_bookmarks)} bookmark extents"
+        elif layer is not None:
+            text = f"Selected features of {layer.name()} ({layer.selectedFeatureCount()} selected)"
+        elif self.drawn_area is not None:
+            text = f"Drawn polygon of {self.drawn_area.area() / 1e6:.2f} km2"
+        else:
+            text = "No polygon: the extent is downloaded"
+        self.dlg.lbl_area.setText(text)
+        
+    def select_bookmarks(self):
+        """Choose spatial bookmarks to download as a queue of extents"""
+        from .top10nl_dialog import BookmarksDialog
+        
+        bookmarks = (QgsProject.instance().bookmarkManager().bookmarks()
+                     + QgsApplication.bookmarkManager().bookmarks())
+        if not bookmarks:
+            QMessageBox.information(self.dlg, "No Bookmarks", "The project and QGIS have no spatial bookmarks.")
+            return
+        dialog = BookmarksDialog(bookmarks, self.dlg)
+        if dialog.exec():
+            self.queued_bookmarks = dialog.selected_bookmarks()
+            self.update_area_label()
+        
+    def queued_extents(self):
+        """Extents in RD New to download as a queue, or None for a single extent or polygon.
+        
+        Raises ValueError with a message for the user when the queue is empty.
+        """
+        from .area_tool import bookmark_extents, feature_extents
+        
+        layer = self.dlg.cmb_area_layer.currentLayer()
+        if layer is not None and self.dlg.chk_area_queue.isChecked():
+            extents = feature_extents(layer)
+            if not extents:
+                raise ValueError(f"Select one or more features of {layer.name()} to queue their extents.")
+            return extents
+        if self.queued_bookmarks:
+            return bookmark_extents(self.queued_bookmarks)
+        return None
+        
+    def area_of_interest(self):
+        """The AreaOfInterest of the dialog, or None to download the extent.
+        
+        Raises ValueError with a message for the user when the polygon cannot be used.
+        """
+        from .area_of_interest import AreaOfInterest
+        from .area_tool import selected_area, to_geojson
+        
+        layer = self.dlg.cmb_area_layer.currentLayer()
+        if layer is not None:
+            geometry = selected_area(layer)
+            if geometry is None:
+                raise ValueError(f"Select one or more features of {layer.name()} as area of interest.")
+        elif self.drawn_area is not None:
+            geometry = self.drawn_area
+        else:
+            return None
+        if geometry.isEmpty():
+            raise ValueError("The area of interest is empty.")
+        return AreaOfInterest(to_geojson(geometry), self.dlg.cmb_area_filter.currentData())
         
     def select_output_file(self):
-        """Open file dialog to select output GPKG file"""
+        """Open file dialog to select the output GeoPackage, or FlatGeobuf or GeoParquet files"""
         filename, _ = QFileDialog.getSaveFileName(
             self.dlg, 
             "Select output file", 
             self.default_output, 
-            "GeoPackage (*.gpkg)")
+            "GeoPackage (*.gpkg);;FlatGeobuf, one file per feature type (*.fgb);;"
+            "GeoParquet, one file per feature type (*.parquet)")
             
         if filename:
             filename = os.path.normpath(filename)
@@ -359,8 +676,18 @@ class Top10NLDownloader:
     
     def start_download(self):
         """Start the download process"""
+        from .output_writers import check_output_format
+        from .top10nl_dialog import (SETTINGS_MAINTAIN, SETTINGS_MAX_WORKERS, SETTINGS_TILE_SIZE, load_filters,
+                                     load_property_selection)
+        from .top10nl_task import Top10NLDownloadTask
+        
         # Get parameters from UI
         output_file = self.dlg.txt_output.text()
+        try:
+            check_output_format(output_file)
+        except ValueError as e:
+            QMessageBox.warning(self.dlg, "Unsupported Output Format", str(e))
+            return
         base, _ = os.path.splitext(output_file)
         log_file = base + ".log"
         
@@ -383,9 +710,21 @@ class Top10NLDownloader:
                 "Please select at least one Top10NL feature to download."
             )
             return
+        
+        # A queue of extents or a polygon area of interest replaces the extent
+        try:
+            extents = self.queued_extents()
+            area = self.area_of_interest() if extents is None else None
+        except ValueError as e:
+            QMessageBox.warning(self.dlg, "Invalid Area of Interest", str(e))
+            return
+        if extents is not None:
+            extent_coords = None
+        elif area is not None:
+            extent_coords = area.extent
             
         # Check if extent is valid
-        if extent.isEmpty() or extent.width() <= 0 or extent.height() <= 0:
+        elif extent.isEmpty() or extent.width() <= 0 or extent.height() <= 0:
             QMessageBox.warning(
                 self.dlg, 
                 "Invalid Extent", 
@@ -395,6 +734,20 @@ class Top10NLDownloader:
         
         # Determine operation mode
         overwrite = self.dlg.rad_overwrite.isChecked()
+        update = self.dlg.rad_update.isChecked()
+        
+        # Number of requests that run in parallel; remember for next time
+        max_workers = self.dlg.spin_max_workers.value()
+        QSettings().setValue(SETTINGS_MAX_WORKERS, max_workers)
+        tile_size = self.dlg.spin_tile_size.value()
+        QSettings().setValue(SETTINGS_TILE_SIZE, tile_size)
+        maintain = self.dlg.chk_maintain.isChecked()
+        QSettings().setValue(SETTINGS_MAINTAIN, maintain)
+        # Attributes chosen with Columns...; features without a choice keep all
+        selection = load_property_selection()
+        properties = {feature: selection[feature] for feature in features if feature in selection}
+        # Filters set with Filter...
+        filters = {feature: expression for feature, expression in load_filters().items() if feature in features}
         
         # Start the download task
         self.download_task = Top10NLDownloadTask(
@@ -404,7 +757,15 @@ class Top10NLDownloader:
             log_file, 
             overwrite,
             self.dlg,
-            self.iface
+            self.iface,
+            max_workers,
+            tile_size=tile_size,
+            update=update,
+            properties=properties,
+            filters=filters,
+            area=area,
+            extents=extents,
+            maintain=maintain
         )
         
         # Start the task
@@ -417,8 +778,58 @@ class Top10NLDownloader:
             level=Qgis.MessageLevel.Info
         )
             
+    def resume_download(self):
+        """Continue the last download job stored in the output GeoPackage"""
+        from .batch_download import job_arguments, unfinished_job
+        from .top10nl_dialog import SETTINGS_MAINTAIN, SETTINGS_MAX_WORKERS
+        from .top10nl_task import Top10NLDownloadTask
+        
+        output_file = self.dlg.txt_output.text()
+        job = unfinished_job(output_file)
+        if job is None:
+            QMessageBox.information(
+                self.dlg, 
+                "Nothing to Resume", 
+                "The output GeoPackage has no unfinished download."
+            )
+            return
+        
+        base, _ = os.path.splitext(output_file)
+        log_file = base + ".log"
+        max_workers = self.dlg.spin_max_workers.value()
+        QSettings().setValue(SETTINGS_MAX_WORKERS, max_workers)
+        maintain = self.dlg.chk_maintain.isChecked()
+        QSettings().setValue(SETTINGS_MAINTAIN, maintain)
+        
+        # Resume with the parameters of the job, not those in the dialog
+        arguments = job_arguments(job)
+        self.download_task = Top10NLDownloadTask(
+            arguments.pop("features"), 
+            arguments.pop("extent"), 
+            output_file, 
+            log_file, 
+            arguments.pop("overwrite"),
+            self.dlg,
+            self.iface,
+            max_workers,
+            resume=True,
+            maintain=maintain,
+            **arguments
+        )
+        QgsApplication.taskManager().addTask(self.download_task)
+        
+        remaining = [name for name, status in job["status"].items() if status != "complete"]
+        self.iface.messageBar().pushMessage(
+            "Top10NL Downloader", 
+            f"Resuming download of {len(remaining)} of {len(job['collections'])} Top10NL features", 
+            level=Qgis.MessageLevel.Info
+        )
+            
     def run(self):
         """Run method that performs all the real work"""
+        if self.dlg is None:
+            self.create_dialog()
+        
         # Update home_path when plugin is used
         home_path_str = QgsProject.instance().homePath()
         if not home_path_str or home_path_str == '.':
@@ -453,420 +864,7 @@ class Top10NLDownloader:
         # Show the dialog
         self.dlg.show()
         
-class Top10NLDownloaderDialog(QDialog):
-    def __init__(self, iface=None, plugin=None):
-        super().__init__(iface.mainWindow() if iface else None)
-        self.iface = iface
-        self.plugin = plugin
-        self.setWindowTitle("Top10NL Downloader")
-        self.resize(500, 700)
-        self.setup_ui()
-        
-    def setup_ui(self):
-        """Create the user interface"""
-        main_layout = QVBoxLayout()
-        
-        # Output file
-        output_layout = QHBoxLayout()
-        output_layout.addWidget(QLabel("Output GPKG:"))
-        self.txt_output = QLineEdit()
-        output_layout.addWidget(self.txt_output)
-        self.btn_browse_output = QPushButton("Browse...")
-        output_layout.addWidget(self.btn_browse_output)
-        main_layout.addLayout(output_layout)
-        
-        # Extent - QgsExtentGroupBox
-        self.extent_group = QgsExtentGroupBox()
-        self.extent_group.setTitle("Extent")
-        self.extent_group.setOutputCrs(QgsCoordinateReferenceSystem("EPSG:28992"))
-        # Set the map canvas for built-in "From Canvas" functionality
-        if self.iface:
-            self.extent_group.setMapCanvas(self.iface.mapCanvas())
-        main_layout.addWidget(self.extent_group)
-        
-        # Features section
-        features_group = QGroupBox("Top10NL Features")
-        features_layout = QVBoxLayout()
-        
-        # Features list widget with selection controls
-        features_controls_layout = QHBoxLayout()
-        self.btn_select_all = QPushButton("Select All")
-        self.btn_deselect_all = QPushButton("Deselect All")
-        self.btn_refresh_features = QPushButton("Refresh from API")
-        features_controls_layout.addWidget(self.btn_select_all)
-        features_controls_layout.addWidget(self.btn_deselect_all)
-        features_controls_layout.addWidget(self.btn_refresh_features)
-        features_controls_layout.addStretch()  # Add stretch to push buttons to left
-        features_layout.addLayout(features_controls_layout)
-        
-        # Features list widget
-        self.list_features = QListWidget()
-        self.list_features.setSelectionMode(QListWidget.SelectionMode.MultiSelection)
-        self.list_features.setMinimumHeight(100)
-        self.list_features.setMaximumHeight(200)  # Set maximum height
-        # Scrollbar policy is automatic by default - shows when needed
-        features_layout.addWidget(self.list_features)
-        
-        features_group.setLayout(features_layout)
-        main_layout.addWidget(features_group)
-        
-        # Operation mode
-        op_group = QGroupBox("Operation Mode")
-        op_layout = QHBoxLayout()
-        self.rad_overwrite = QRadioButton("Overwrite")
-        self.rad_append = QRadioButton("Append")
-        self.rad_append.setChecked(True)
-        op_layout.addWidget(self.rad_append)
-        op_layout.addWidget(self.rad_overwrite)
-        op_group.setLayout(op_layout)
-        main_layout.addWidget(op_group)
-        
-        # Progress
-        main_layout.addWidget(QLabel("Progress:"))
-        self.progress_bar = QProgressBar()
-        self.progress_bar.setMinimum(0)
-        self.progress_bar.setMaximum(100)
-        self.progress_bar.setValue(0)
-        main_layout.addWidget(self.progress_bar)
-        
-        # Log window
-        main_layout.addWidget(QLabel("Log:"))
-        self.txt_log_output = QTextEdit()
-        self.txt_log_output.setReadOnly(True)
-        self.txt_log_output.setMinimumHeight(150)
-        main_layout.addWidget(self.txt_log_output)
-        
-        # Buttons
-        buttons_layout = QHBoxLayout()
-        self.btn_run = QPushButton("Run")
-        self.btn_close = QPushButton("Close")
-        self.btn_close.clicked.connect(self.close)
-        buttons_layout.addWidget(self.btn_run)
-        buttons_layout.addWidget(self.btn_close)
-        main_layout.addLayout(buttons_layout)
-        
-        self.setLayout(main_layout)
-        
-        # Connect selection buttons
-        self.btn_select_all.clicked.connect(self.select_all_features)
-        self.btn_deselect_all.clicked.connect(self.deselect_all_features)
-        
-    def populate_features_list(self, features):
-        """Populate the features list widget with available features"""
-        self.list_features.clear()
-        
-        for feature in sorted(features):
-            item = QListWidgetItem(feature)
-            item.setFlags(item.flags() | Qt.ItemFlag.ItemIsUserCheckable)
-            item.setCheckState(Qt.CheckState.Unchecked)
-            self.list_features.addItem(item)
-            
-    def get_selected_features(self):
-        """Get list of selected features"""
-        selected_features = []
-        for i in range(self.list_features.count()):
-            item = self.list_features.item(i)
-            if item.checkState() == Qt.CheckState.Checked:
-                selected_features.append(item.text())
-        return selected_features
-        
-    def select_all_features(self):
-        """Select all features in the list"""
-        for i in range(self.list_features.count()):
-            item = self.list_features.item(i)
-            item.setCheckState(Qt.CheckState.Checked)
-            
-    def deselect_all_features(self):
-        """Deselect all features in the list"""
-        for i in range(self.list_features.count()):
-            item = self.list_features.item(i)
-            item.setCheckState(Qt.CheckState.Unchecked)
-            
-    def set_default_selection(self, default_features=None):
-        """Set default selected features (useful for common features)"""
-        if default_features is None:
-            # Default to some commonly used Top10NL features
-            default_features = ["wegdeel_vlak", "gebouw_vlak", "waterdeel_vlak", "terrein_vlak"]
-            
-        for i in range(self.list_features.count()):
-            item = self.list_features.item(i)
-            if item.text() in default_features:
-                item.setCheckState(Qt.CheckState.Checked)
-                
-    def select_all_by_default(self, select_all=False):
-        """Option to select all features by default"""
-        check_state = Qt.CheckState.Checked if select_all else Qt.CheckState.Unchecked
-        for i in range(self.list_features.count()):
-            item = self.list_features.item(i)
-            item.setCheckState(check_state)
-            
-    def update_progress(self, value):
-        """Update the progress bar - called from task thread"""
-        self.progress_bar.setValue(value)
+        # Refresh the cached features list in the background when it is outdated
+        if self.catalogue_stale:
+            self.start_features_loader()
         
-    def append_log(self, message):
-        """Append message to log output - called from task thread"""
-        self.txt_log_output.append(message)
-        # Auto-scroll to bottom
-        scrollbar = self.txt_log_output.verticalScrollBar()
-        scrollbar.setValue(scrollbar.maximum())
-        
-
-class Top10NLDownloadTask(QgsTask):
-    """Background task for downloading Top10NL features"""
-    
-    # Add custom signals for real-time updates
-    progress_updated = pyqtSignal(int)  # For progress percentage
-    log_updated = pyqtSignal(str)       # For log messages
-    
-    def __init__(self, features, extent, output_file, log_file, overwrite, dialog, iface):
-        # Normalize all file paths
-        output_file = os.path.normpath(output_file)
-        log_file = os.path.normpath(log_file)
-        super().__init__("Top10NL Download Task", QgsTask.Flag.CanCancel)
-        self.features = features
-        self.extent = extent
-        self.output_file = output_file
-        self.log_file = log_file
-        self.overwrite = overwrite
-        self.dlg = dialog
-        self.iface = iface
-        self.exception = None
-        self.log_lines = []
-        
-        # Connect signals to dialog updates
-        if self.dlg:
-            self.progress_updated.connect(self.dlg.update_progress)
-            self.log_updated.connect(self.dlg.append_log)
-        
-    def log(self, message):
-        """Add message to log file and UI"""
-        timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        log_message = f"{timestamp} - {message}"
-        self.log_lines.append(log_message)
-        
-        # Emit signal to update dialog log in real-time
-        self.log_updated.emit(log_message)
-        
-        # Write to log file immediately
-        try:
-            with open(self.log_file, 'a', encoding='utf-8') as log_file:
-                log_file.write(log_message + "\n")
-        except Exception as e:
-            QgsMessageLog.logMessage(f"Error writing to log: {str(e)}", "Top10NL Downloader", Qgis.MessageLevel.Warning)
-            
-    def run(self):
-        """Run the download task"""
-        try:
-            # Initialize log file
-            with open(self.log_file, 'a', encoding='utf-8') as log_file:
-                log_file.write("\n\n")
-                log_file.write(f"{datetime.datetime.now().strftime('%Y-%m-%d')}\n")
-                log_file.write("Top10NL-features importeren in GeoPackage\n")
-                log_file.write("\n")
-                log_file.write("-------------------------\n")
-            
-            self.log(f"Starting Top10NL download process with {len(self.features)} features")
-            self.log(f"Extent: {self.extent[0]},{self.extent[1]},{self.extent[2]},{self.extent[3]}")
-            self.log(f"Processing mode: {'overwrite layer' if self.overwrite else 'append to layer'}")
-            
-            start_time = datetime.datetime.now()
-            self.log(f"Script start: {start_time.strftime('%H:%M:%S')}")
-            self.log("-------------------------\n")
-            
-            # Process each feature
-            total_features = len(self.features)
-            
-            for i, feature in enumerate(self.features):
-                if self.isCanceled():
-                    return False
-                    
-                feature = feature.strip()
-                if not feature:
-                    continue
-                    
-                # Calculate and emit progress
-                progress = int((i / total_features) * 100)
-                self.setProgress(progress)  # For QGIS task manager
-                self.progress_updated.emit(progress)  # For dialog progress bar
-                
-                self.log(f"  Top10NL-object: {feature}")
-                self.log(f"  Extent: {self.extent[0]},{self.extent[1]},{self.extent[2]},{self.extent[3]}")
-                
-                start_feature_time = datetime.datetime.now()
-                self.log(f"  Start Time: {start_feature_time.strftime('%H:%M:%S')}")
-                
-                params = {
-                    'INPUT': f'OAPIF:https://api.pdok.nl/brt/top10nl/ogc/v1/collections/{feature}',
-                    'OUTPUT': self.output_file,
-                    'OPTIONS': f'-{"overwrite" if self.overwrite else "append"} -oo CRS=EPSG:28992 -spat {self.extent[0]} {self.extent[1]} {self.extent[2]} {self.extent[3]} -s_srs EPSG:28992 -t_srs EPSG:28992'
-                }
-                
-                try:
-                    processing.run("gdal:convertformat", params)
-                    self.log(f"  Feature {feature} processed")
-                except Exception as e:
-                    self.log(f"  Error processing feature {feature}: {str(e)}")
-                
-                end_feature_time = datetime.datetime.now()
-                self.log(f"  Finish Time: {end_feature_time.strftime('%H:%M:%S')}")
-                self.log("-------------------------")
-            
-            # Final progress update
-            self.setProgress(100)
-            self.progress_updated.emit(100)
-            
-            # Deduplicate features by 'ID' in each layer if appending
-            if not self.overwrite:
-                self.log("Removing duplicate features based on 'ID' attribute...")
-                for feature in self.features:
-                    layer_path = os.path.normpath(f"{self.output_file}|layername={feature}")
-                    layer = QgsVectorLayer(layer_path, feature, "ogr")
-                    if not layer.isValid():
-                        self.log(f"  Could not open layer {feature} for deduplication.")
-                        continue
-                    try:
-                        # https://docs.qgis.org/3.40/en/docs/user_manual/processing_algs/qgis/vectorgeneral.html#delete-duplicates-by-attribute
-                        dedup_result = processing.run(
-                            "native:removeduplicatesbyattribute",
-                            {
-                                "INPUT": layer,
-                                "FIELDS": ["ID"],
-                                "OUTPUT": 'TEMPORARY_OUTPUT'  # Output to memory first
-                            }
-                        )
-                        # Overwrite the layer in the GeoPackage with the deduplicated version
-                        # toevoegen: alleen saven wanneer er duplicaten waren, anders is wegschrijven niet nodig
-                        processing.run(
-                            "native:savefeatures",
-                            {
-                                "INPUT": dedup_result["OUTPUT"],
-                                "LAYER_NAME": feature,
-                                "LAYER_OPTIONS": '',
-                                "ACTION_ON_EXISTING_FILE": 1,    # create or overwrite layer
-                                "OUTPUT": self.output_file
-                            }
-                        )
-                        self.log(f"  {dedup_result['DUPLICATE_COUNT']} Duplicates features removed from {feature}; {dedup_result['RETAINED_COUNT']} features remaining")
-                    except Exception as e:
-                        self.log(f"  Error removing duplicates from {feature}: {str(e)}")
-
-            end_time = datetime.datetime.now()
-            self.log(f"Script end: {end_time.strftime('%H:%M:%S')}")
-            self.log(f"Total time: {end_time - start_time}")
-            self.log("Finished")
-            self.log("-------------------------")
-            
-            return True
-            
-        except Exception as e:
-            self.exception = e
-            self.log(f"Error during download: {str(e)}")
-            return False
-    
-    def finished(self, result):
-        """Called when the task is complete"""
-        if result:
-            # Success message
-            self.iface.messageBar().pushMessage(
-                "Top10NL Downloader", 
-                f"Downloaded {len(self.features)} Top10NL features successfully", 
-                level=Qgis.MessageLevel.Success
-            )
-            
-            # Ask if user wants to add the layers to the project
-            if self.iface:
-                reply = QMessageBox.question(
-                    None, 
-                    "Top10NL Downloader", 
-                    "Do you want to add the downloaded layers to the map?",
-                    QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No
-                )
-                
-                root = QgsProject.instance().layerTreeRoot()
-                gpkg_name = os.path.basename(self.output_file)
-                group_layer_name = f"{gpkg_name} (PDOK-OAPIF-download)"
-                group_layer = root.findGroup(group_layer_name)
-                if group_layer:
-                    for child in group_layer.children():
-                        if hasattr(child, 'layer') and child.layer() is not None:
-                            existing_layer = child.layer()
-                            # Only refresh layers from this GeoPackage
-                            existing_source = os.path.normpath(existing_layer.source())
-                            normalized_output = os.path.normpath(self.output_file)
-                            if normalized_output in existing_source:
-                                existing_layer.triggerRepaint()
-
-                if reply == QMessageBox.StandardButton.Yes:
-                    # group layer: search for existing group or create new one
-                    if not group_layer:
-                        group_layer = QgsLayerTreeGroup(group_layer_name)
-                        root.insertChildNode(0, group_layer)
-
-                    # Build a list of (layer, geometry_type) for existing layers in the group
-                    existing_layers = []
-                    for child in group_layer.children():
-                        if hasattr(child, 'layer') and child.layer() is not None:
-                            existing_layers.append((child.layer(), child.layer().geometryType()))
-
-                    # Prepare new layers and their geometry types
-                    new_layers = []
-                    for feature in self.features:
-                        feature = feature.strip()
-                        if not feature:
-                            continue
-                        layer_source = os.path.normpath(f"{self.output_file}|layername={feature}")
-                        layer = QgsVectorLayer(layer_source, f"Top10NL {feature}", "ogr")
-                        if layer.isValid():
-                            # Check if this layer already exists in the group (by source)
-                            already_in_group = False
-                            for child in group_layer.children():
-                                if hasattr(child, 'layer') and child.layer() is not None:
-                                    existing_layer = child.layer()
-                                    # Normalize both paths before comparing
-                                    existing_source = os.path.normpath(existing_layer.source())
-                                    if (existing_source == layer_source or
-                                        os.path.normpath(existing_layer.dataProvider().dataSourceUri()) == layer_source):
-                                        already_in_group = True
-                                        break
-                            if not already_in_group:
-                                QgsProject.instance().addMapLayer(layer, False)
-                                new_layers.append((layer, layer.geometryType()))
-                            # Optionally, refresh the layer if it already exists
-                            else:
-                                existing_layer.triggerRepaint()
-                        else:
-                            QgsMessageLog.logMessage(
-                                f"Layer {feature} is not valid",
-                                "Top10NL Downloader",
-                                Qgis.MessageLevel.Warning
-                            )
-
-                    # Helper: geometryType() returns 0=Point, 1=Line, 2=Polygon
-                    # Insert new layers in correct order: points (top), lines (middle), polygons (bottom)
-                    for new_layer, new_geom in new_layers:
-                        # Find the correct index to insert
-                        insert_index = 0
-                        for idx, (existing_layer, existing_geom) in enumerate(existing_layers):
-                            # If new layer should be below this existing layer, break
-                            if new_geom > existing_geom:
-                                insert_index = idx + 1
-                        # Insert at the found index
-                        group_layer.insertChildNode(insert_index, QgsLayerTreeLayer(new_layer))
-                        # Also update existing_layers to reflect the new state
-                        existing_layers.insert(insert_index, (new_layer, new_geom))
-        else:
-            # Show error
-            if self.exception:
-                QgsMessageLog.logMessage(
-                    f"Top10NL Download task failed: {str(self.exception)}", 
-                    "Top10NL Downloader", 
-                    Qgis.MessageLevel.Critical
-                )
-                
-                self.iface.messageBar().pushMessage(
-                    "Top10NL Downloader", 
-                    f"Error during download: {str(self.exception)}", 
-                    level=Qgis.MessageLevel.Critical
-                )
-
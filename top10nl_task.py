@@ -0,0 +1,251 @@
+"""
+Top10NL Downloader - Background task that downloads Top10NL collections into a GeoPackage
+"""
+
+import os
+import datetime
+from qgis.PyQt.QtCore import pyqtSignal
+from qgis.PyQt.QtWidgets import QMessageBox
+from qgis.core import (QgsProject, QgsVectorLayer, QgsLayerTreeGroup, QgsLayerTreeLayer,
+                      QgsTask, QgsMessageLog, Qgis)
+
+from .download_engine import DEFAULT_PARALLEL_DOWNLOADS, Top10NLDownloadEngine
+from .log_writer import BufferedLogWriter
+from .oapif_client import DEFAULT_PAGE_SIZE
+from .output_writers import layer_source as output_layer_source
+from .tiling import DEFAULT_TILE_SIZE
+
+
+class Top10NLDownloadTask(QgsTask):
+    """Background task for downloading Top10NL features"""
+    
+    # Add custom signals for real-time updates
+    progress_updated = pyqtSignal(int, str)  # For progress percentage and status line
+    log_updated = pyqtSignal(str)       # For log messages
+    
+    def __init__(self, features, extent, output_file, log_file, overwrite, dialog, iface,
+                 max_workers=DEFAULT_PARALLEL_DOWNLOADS, page_size=DEFAULT_PAGE_SIZE,
+                 tile_size=DEFAULT_TILE_SIZE, resume=False, update=False, properties=None,
+                 filters=None, area=None, extents=None, maintain=False):
+        # Normalize all file paths
+        output_file = os.path.normpath(output_file)
+        log_file = os.path.normpath(log_file)
+        super().__init__("Top10NL Download Task", QgsTask.Flag.CanCancel)
+        self.features = features
+        self.extent = extent
+        self.output_file = output_file
+        self.log_file = log_file
+        self.overwrite = overwrite
+        self.resume = resume
+        self.update = update
+        self.dlg = dialog
+        self.iface = iface
+        self.exception = None
+        self.log_lines = []
+        self.log_writer = None
+        # Per collection metrics, written as JSON lines next to the log file
+        self.metrics_file = os.path.splitext(log_file)[0] + ".metrics.jsonl"
+        self.engine = Top10NLDownloadEngine(
+            features, extent, output_file, overwrite,
+            max_workers=max_workers, page_size=page_size, tile_size=tile_size,
+            log=self.log, progress=self.report_progress, is_canceled=self.isCanceled, resume=resume,
+            update=update, properties=properties, filters=filters, area=area,
+            extents=extents, maintain=maintain)
+        
+        # Connect signals to dialog updates
+        if self.dlg:
+            self.progress_updated.connect(self.dlg.update_progress)
+            self.log_updated.connect(self.dlg.append_log)
+        
+    def log(self, message):
+        """Add message to log file and UI"""
+        timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        log_message = f"{timestamp} - {message}"
+        self.log_lines.append(log_message)
+        
+        # The log writer writes the file and updates the dialog in batches
+        if self.log_writer is not None:
+            self.log_writer.log(log_message)
+    
+    def show_log_lines(self, lines):
+        """Emit a batch of log lines to the dialog - called from the log writer thread"""
+        self.log_updated.emit("\n".join(lines))
+    
+    def report_log_error(self, message):
+        """Report a problem with the log file - called from the log writer thread"""
+        QgsMessageLog.logMessage(message, "Top10NL Downloader", Qgis.MessageLevel.Warning)
+    
+    def report_progress(self, value, status=None):
+        """Show the progress in the task manager and the progress with throughput and ETA in the dialog"""
+        self.setProgress(value)  # For QGIS task manager
+        self.progress_updated.emit(value, status or "")  # For dialog progress bar
+    
+    def run(self):
+        """Run the download task"""
+        self.log_writer = BufferedLogWriter(self.log_file, self.show_log_lines, self.report_log_error)
+        result = False
+        try:
+            result = self.download()
+            return result
+        finally:
+            try:
+                self.engine.write_metrics(self.metrics_file, result)
+            except OSError as e:
+                self.report_log_error(f"Error writing metrics: {str(e)}")
+            # Write the remaining log lines before the task is reported finished
+            self.log_writer.close()
+    
+    def download(self):
+        """Download all features; returns True on success"""
+        try:
+            # Initialize log file
+            self.log_writer.write(
+                "\n\n"
+                f"{datetime.datetime.now().strftime('%Y-%m-%d')}\n"
+                "Top10NL-features importeren in GeoPackage\n"
+                "\n"
+                "-------------------------\n"
+            )
+            
+            self.log(f"Starting Top10NL download process with {len(self.features)} features")
+            extent = self.engine.extent
+            self.log(f"Extent: {extent[0]},{extent[1]},{extent[2]},{extent[3]}"
+                     f"{f' ({len(self.engine.extents)} queued extents)' if self.engine.extents else ''}")
+            mode = "update layer" if self.update else "overwrite layer" if self.overwrite else "append to layer"
+            self.log(f"Processing mode: {mode}"
+                     f"{' (resumed)' if self.resume else ''}")
+            
+            start_time = datetime.datetime.now()
+            self.log(f"Script start: {start_time.strftime('%H:%M:%S')}")
+            self.log("-------------------------\n")
+            
+            if not self.engine.run():
+                return False
+            if self.engine.failed_features:
+                # Do not report success with missing or partial layers
+                raise RuntimeError(
+                    f"Download incomplete for {', '.join(self.engine.failed_features)}; "
+                    "use Resume to download the missing tiles")
+            
+            end_time = datetime.datetime.now()
+            self.log(f"Script end: {end_time.strftime('%H:%M:%S')}")
+            self.log(f"Total time: {end_time - start_time}")
+            self.log("Finished")
+            self.log("-------------------------")
+            
+            return True
+            
+        except Exception as e:
+            self.exception = e
+            self.log(f"Error during download: {str(e)}")
+            return False
+    
+    def finished(self, result):
+        """Called when the task is complete"""
+        if result:
+            # Success message
+            self.iface.messageBar().pushMessage(
+                "Top10NL Downloader", 
+                f"Downloaded {len(self.features)} Top10NL features successfully", 
+                level=Qgis.MessageLevel.Success
+            )
+            
+            # Ask if user wants to add the layers to the project
+            if self.iface:
+                reply = QMessageBox.question(
+                    None, 
+                    "Top10NL Downloader", 
+                    "Do you want to add the downloaded layers to the map?",
+                    QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No
+                )
+                
+                root = QgsProject.instance().layerTreeRoot()
+                gpkg_name = os.path.basename(self.output_file)
+                group_layer_name = f"{gpkg_name} (PDOK-OAPIF-download)"
+                group_layer = root.findGroup(group_layer_name)
+                # FlatGeobuf and GeoParquet layers have a file per feature type
+                layer_sources = {os.path.normpath(output_layer_source(self.output_file, feature.strip()))
+                                 for feature in self.features}
+                if group_layer:
+                    for child in group_layer.children():
+                        if hasattr(child, 'layer') and child.layer() is not None:
+                            existing_layer = child.layer()
+                            # Only refresh layers from this GeoPackage
+                            existing_source = os.path.normpath(existing_layer.source())
+                            normalized_output = os.path.normpath(self.output_file)
+                            if normalized_output in existing_source or existing_source in layer_sources:
+                                existing_layer.triggerRepaint()
+
+                if reply == QMessageBox.StandardButton.Yes:
+                    # group layer: search for existing group or create new one
+                    if not group_layer:
+                        group_layer = QgsLayerTreeGroup(group_layer_name)
+                        root.insertChildNode(0, group_layer)
+
+                    # Build a list of (layer, geometry_type) for existing layers in the group
+                    existing_layers = []
+                    for child in group_layer.children():
+                        if hasattr(child, 'layer') and child.layer() is not None:
+                            existing_layers.append((child.layer(), child.layer().geometryType()))
+
+                    # Prepare new layers and their geometry types
+                    new_layers = []
+                    for feature in self.features:
+                        feature = feature.strip()
+                        if not feature:
+                            continue
+                        layer_source = os.path.normpath(output_layer_source(self.output_file, feature))
+                        layer = QgsVectorLayer(layer_source, f"Top10NL {feature}", "ogr")
+                        if layer.isValid():
+                            # Check if this layer already exists in the group (by source)
+                            already_in_group = False
+                            for child in group_layer.children():
+                                if hasattr(child, 'layer') and child.layer() is not None:
+                                    existing_layer = child.layer()
+                                    # Normalize both paths before comparing
+                                    existing_source = os.path.normpath(existing_layer.source())
+                                    if (existing_source == layer_source or
+                                        os.path.normpath(existing_layer.dataProvider().dataSourceUri()) == layer_source):
+                                        already_in_group = True
+                                        break
+                            if not already_in_group:
+                                QgsProject.instance().addMapLayer(layer, False)
+                                new_layers.append((layer, layer.geometryType()))
+                            # Optionally, refresh the layer if it already exists
+                            else:
+                                existing_layer.triggerRepaint()
+                        else:
+                            QgsMessageLog.logMessage(
+                                f"Layer {feature} is not valid",
+                                "Top10NL Downloader",
+                                Qgis.MessageLevel.Warning
+                            )
+
+                    # Helper: geometryType() returns 0=Point, 1=Line, 2=Polygon
+                    # Insert new layers in correct order: points (top), lines (middle), polygons (bottom)
+                    for new_layer, new_geom in new_layers:
+                        # Find the correct index to insert
+                        insert_index = 0
+                        for idx, (existing_layer, existing_geom) in enumerate(existing_layers):
+                            # If new layer should be below this existing layer, break
+                            if new_geom > existing_geom:
+                                insert_index = idx + 1
+                        # Insert at the found index
+                        group_layer.insertChildNode(insert_index, QgsLayerTreeLayer(new_layer))
+                        # Also update existing_layers to reflect the new state
+                        existing_layers.insert(insert_index, (new_layer, new_geom))
+        else:
+            # Show error
+            if self.exception:
+                QgsMessageLog.logMessage(
+                    f"Top10NL Download task failed: {str(self.exception)}", 
+                    "Top10NL Downloader", 
+                    Qgis.MessageLevel.Critical
+                )
+                
+                self.iface.messageBar().pushMessage(
+                    "Top10NL Downloader", 
+                    f"Error during download: {str(self.exception)}", 
+                    level=Qgis.MessageLevel.Critical
+                )
+